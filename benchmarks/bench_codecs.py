@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Compares the JSON codecs in `mlstreamfield.codecs` on realistic StreamField
+payloads, and confirms that each one decodes and encodes values exactly as
+the standard library does.
+
+Usage:
+
+    python benchmarks/bench_codecs.py [--repeat 5] [--sizes 50 500 3000]
+
+`--sizes` are approximate payload sizes in KB.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import uuid
+
+from collections.abc import Callable
+from typing import Any
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mlstreamfield.codecs import CODECS
+
+
+PARAGRAPH = (
+    '<p data-block-key="{key}">Lorem ipsum <b>dolor</b> sit amet, '
+    '<a href="https://example.com/{key}/">consectetur</a> adipiscing elit. '
+    "Café, naïve, façade — “quoted” text and emoji 🎉 appear in real content "
+    "more often than you might think.</p>"
+)
+
+
+def make_block(rng: random.Random, depth: int = 0) -> dict:
+    block_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    kind = rng.choice(["heading", "paragraph", "paragraph", "image", "list", "section"])
+    if kind == "heading":
+        value = f"Heading number {rng.randint(1, 10_000)}"
+    elif kind == "paragraph":
+        value = "".join(
+            PARAGRAPH.format(key=uuid.UUID(int=rng.getrandbits(128)).hex[:5])
+            for _ in range(rng.randint(1, 6))
+        )
+    elif kind == "image":
+        value = {
+            "image": rng.randint(1, 100_000),
+            "caption": "An image caption",
+            "alignment": rng.choice(["left", "right", "full-width"]),
+            "link": {"page": rng.randint(1, 5000), "url": "", "new_window": False},
+        }
+    elif kind == "list" or depth >= 2:
+        value = [
+            {
+                "type": "item",
+                "value": {"title": f"Item {i}", "score": rng.random() * 100},
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            }
+            for i in range(rng.randint(2, 8))
+        ]
+    else:
+        value = {
+            "title": "A section",
+            "content": [make_block(rng, depth + 1) for _ in range(rng.randint(2, 5))],
+        }
+    return {"type": kind, "value": value, "id": block_id}
+
+
+def make_payload(size_kb: int, seed: int = 0) -> str:
+    rng = random.Random(seed)  # noqa: S311
+    blocks = []
+    size = 2
+    while size < size_kb * 1024:
+        block = make_block(rng)
+        blocks.append(block)
+        size += len(json.dumps(block)) + 2
+    return json.dumps(blocks)
+
+
+def best_of(func: Callable[[Any], Any], value: Any, repeat: int) -> float:
+    """Return the fastest of `repeat` calls to `func(value)`, in milliseconds."""
+    return min(timeit.repeat(lambda: func(value), number=1, repeat=repeat)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 3000])
+    args = parser.parse_args()
+
+    codecs = {name: cls() for name, cls in CODECS.items() if cls.is_available()}
+    unavailable = sorted(set(CODECS) - set(codecs))
+    if unavailable:
+        print(f"Not installed (skipped): {', '.join(unavailable)}\n")
+
+    print(
+        f"{'payload':>10} {'codec':>10} {'loads ms':>10} {'dumps ms':>10} {'speed-up':>9}"
+    )
+    for size_kb in args.sizes:
+        payload = make_payload(size_kb)
+        expected = json.loads(payload)
+        baseline = None
+        for name, codec in codecs.items():
+            decoded = codec.loads(payload)
+            if decoded != expected or codec.dumps(decoded) != payload:
+                raise SystemExit(f"{name} output differs from the standard library")
+            loads_time = best_of(codec.loads, payload, args.repeat)
+            dumps_time = best_of(codec.dumps, expected, args.repeat)
+            if baseline is None:
+                baseline = loads_time
+            print(
+                f"{len(payload) // 1024:>8}KB {name:>10} {loads_time:>10.2f} "
+                f"{dumps_time:>10.2f} {baseline / loads_time:>8.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
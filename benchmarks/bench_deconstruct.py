@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Measures the cost of `mlstreamfield.fields.StreamField.deconstruct()` for
+fields with large block trees, and its effect on the migration autodetector,
+compared to the previous implementation (which let Wagtail build block
+definitions, only to throw them away).
+
+Usage:
+
+    python benchmarks/bench_deconstruct.py [--models 20] [--blocks 100]
+        [--repeat 5]
+"""
+
+import argparse
+import timeit
+
+from bench_migrations import configure, make_blocks
+
+
+def legacy_deconstruct(self):
+    from wagtail.fields import StreamField as WagtailStreamfield
+
+    name, path, args, kwargs = WagtailStreamfield.deconstruct(self)
+    args = args[1:]
+    kwargs.pop("block_lookup", None)
+    kwargs.pop("verbose_name", None)
+    if self.json_codec is not None:
+        kwargs["json_codec"] = self.json_codec
+    return name, path, args, kwargs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--models", type=int, default=20)
+    parser.add_argument("--blocks", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    configure()
+
+    from django.apps.registry import Apps
+    from django.db import models
+    from django.db.migrations.autodetector import MigrationAutodetector
+    from django.db.migrations.graph import MigrationGraph
+    from django.db.migrations.questioner import NonInteractiveMigrationQuestioner
+    from django.db.migrations.state import ModelState, ProjectState
+
+    from mlstreamfield.fields import StreamField
+
+    registry = Apps()
+    for i in range(args.models):
+        type(
+            f"Model{i}",
+            (models.Model,),
+            {
+                "__module__": __name__,
+                "Meta": type("Meta", (), {"app_label": "bench", "apps": registry}),
+                "body": StreamField(make_blocks(args.blocks), blank=True),
+            },
+        )
+    bench_models = list(registry.all_models["bench"].values())
+    fields = [model._meta.get_field("body") for model in bench_models]
+
+    def get_state() -> ProjectState:
+        # Equivalent to ProjectState.from_apps(), as used by makemigrations
+        state = ProjectState()
+        for model in bench_models:
+            state.add_model(ModelState.from_model(model))
+        return state
+
+    from_state = get_state()
+
+    def clear_caches() -> None:
+        for field in fields:
+            field.__dict__.pop("_deconstructed", None)
+
+    def deconstruct() -> None:
+        clear_caches()
+        fields[0].deconstruct()
+
+    def autodetect() -> None:
+        # makemigrations runs once per process, so nothing is cached yet
+        clear_caches()
+        changes = MigrationAutodetector(
+            from_state,
+            get_state(),
+            NonInteractiveMigrationQuestioner(dry_run=True),
+        ).changes(graph=MigrationGraph())
+        if changes:
+            raise SystemExit("Unexpected changes detected")
+
+    def best_of(func) -> float:
+        return min(timeit.repeat(func, number=1, repeat=args.repeat)) * 1000
+
+    current = StreamField.deconstruct
+    StreamField.deconstruct = legacy_deconstruct
+    results = {"legacy": (best_of(deconstruct), best_of(autodetect))}
+    StreamField.deconstruct = current
+    results["current"] = (best_of(deconstruct), best_of(autodetect))
+    cached_time = best_of(fields[0].deconstruct)
+
+    print(f"{'':>10} {'deconstruct ms':>15} {'autodetect ms':>14}")
+    for label, (deconstruct_time, autodetect_time) in results.items():
+        print(f"{label:>10} {deconstruct_time:>15.3f} {autodetect_time:>14.1f}")
+    print(
+        f"{'speed-up':>10} {results['legacy'][0] / results['current'][0]:>14.1f}x "
+        f"{results['legacy'][1] / results['current'][1]:>13.1f}x"
+    )
+    print(f"\nRepeated deconstruct() calls (cached): {cached_time:.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
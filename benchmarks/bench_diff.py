@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Measures `mlstreamfield.diff` on long streams of realistic blocks, with a
+small proportion of blocks removed, inserted, moved and changed, and compares
+the size of each diff with the size of the value it changes.
+
+Usage:
+
+    python benchmarks/bench_diff.py [--repeat 5] [--blocks 1000 10000 100000]
+        [--changes 0.01]
+"""
+
+import argparse
+import copy
+import json
+import random
+import timeit
+
+from collections.abc import Callable
+from typing import Any
+
+from bench_codecs import make_block
+
+from mlstreamfield.diff import apply_diff, diff_raw_data
+
+
+def make_values(count: int, changes: float, seed: int = 0) -> tuple[list, list]:
+    rng = random.Random(seed)  # noqa: S311
+    old = [make_block(rng) for _ in range(count)]
+    new = copy.deepcopy(old)
+    for _ in range(max(1, int(count * changes))):
+        action = rng.choice(["remove", "insert", "move", "change"])
+        i = rng.randrange(len(new))
+        if action == "remove":
+            del new[i]
+        elif action == "insert":
+            new.insert(i, make_block(rng))
+        elif action == "move":
+            new.insert(rng.randrange(len(new)), new.pop(i))
+        else:
+            new[i]["type"] = "changed"
+    return old, new
+
+
+def best_of(func: Callable[..., Any], *args: Any, repeat: int) -> float:
+    """Return the fastest of `repeat` calls to `func(*args)`, in milliseconds."""
+    return min(timeit.repeat(lambda: func(*args), number=1, repeat=repeat)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--blocks", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--changes", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(
+        f"{'blocks':>8} {'diff ms':>9} {'apply ms':>9} {'operations':>11} "
+        f"{'value KB':>9} {'diff KB':>8}"
+    )
+    for count in args.blocks:
+        old, new = make_values(count, args.changes)
+        diff = diff_raw_data(old, new)
+        if apply_diff(old, diff) != new:
+            raise SystemExit("Applying the diff didn't produce the new value")
+        diff_ms = best_of(diff_raw_data, old, new, repeat=args.repeat)
+        apply_ms = best_of(apply_diff, old, diff, repeat=args.repeat)
+        print(
+            f"{count:>8} {diff_ms:>9.1f} {apply_ms:>9.1f} {len(diff):>11} "
+            f"{len(json.dumps(old)) // 1024:>9} {len(json.dumps(diff)) // 1024:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
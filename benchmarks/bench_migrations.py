@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+"""
+Measures how long Django takes to load and render migration state for an app
+with large StreamFields, using Wagtail's native StreamField and
+`mlstreamfield.fields.StreamField`.
+
+For each field type, an app with `--models` models and `--migrations`
+migrations is generated in a temporary directory. Each migration after the
+first adds a field to every model and, like a real project, adds a block to
+every model's StreamField (which only produces `AlterField` operations for
+the native field). Every run takes place in a fresh process, so nothing is
+cached between runs.
+
+Usage:
+
+    python benchmarks/bench_migrations.py [--models 20] [--migrations 30]
+        [--blocks 30] [--repeat 5] [--json results.json]
+
+The timed steps are:
+
+- load: creating a `MigrationLoader` (importing migrations, building the graph)
+- state: `MigrationLoader.project_state()`
+- render: `ProjectState.apps`
+- autodetect: `MigrationAutodetector.changes()`, as run by `makemigrations`
+- plan: `manage.py migrate --plan`
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import Any
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+APP_LABEL = "benchapp"
+FIELD_CLASSES = {
+    "native": "wagtail.fields.StreamField",
+    "mlstreamfield": "mlstreamfield.fields.StreamField",
+}
+STEPS = ("load", "state", "render", "autodetect", "plan")
+
+
+def configure(project_dir: str | None = None) -> None:
+    import django
+
+    from django.conf import settings
+
+    installed_apps = []
+    if project_dir:
+        sys.path.insert(0, project_dir)
+        installed_apps.append(APP_LABEL)
+    settings.configure(
+        INSTALLED_APPS=installed_apps,
+        DATABASES={
+            "default": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(project_dir or "", "db.sqlite3"),
+            }
+        },
+        DEFAULT_AUTO_FIELD="django.db.models.AutoField",
+        STATIC_URL="/static/",
+        USE_TZ=True,
+    )
+    django.setup()
+
+
+def make_blocks(count: int) -> list[tuple[str, Any]]:
+    """
+    Return `count` block definitions, every third of which is a StructBlock
+    containing a ListBlock and a nested StreamBlock, like a typical page body.
+    """
+    from wagtail import blocks
+
+    result: list[tuple[str, Any]] = []
+    for i in range(count):
+        if i % 3 == 2:
+            block = blocks.StructBlock(
+                [
+                    ("title", blocks.CharBlock()),
+                    ("intro", blocks.TextBlock(required=False)),
+                    ("links", blocks.ListBlock(blocks.URLBlock())),
+                    (
+                        "content",
+                        blocks.StreamBlock(
+                            [
+                                ("paragraph", blocks.RichTextBlock()),
+                                ("quote", blocks.BlockQuoteBlock()),
+                                ("number", blocks.IntegerBlock()),
+                            ]
+                        ),
+                    ),
+                ]
+            )
+        elif i % 3 == 1:
+            block = blocks.RichTextBlock(features=["bold", "italic", "link"])
+        else:
+            block = blocks.CharBlock(max_length=255, help_text=f"Block {i}")
+        result.append((f"block_{i}", block))
+    return result
+
+
+def generate_app(
+    project_dir: str, variant: str, models: int, migrations: int, blocks: int
+) -> int:
+    """
+    Write the app's models and migrations to `project_dir`, returning the
+    total size of the migration files in bytes.
+    """
+    from django.db import migrations as django_migrations
+    from django.db import models as django_models
+    from django.db.migrations.writer import MigrationWriter
+    from django.utils.module_loading import import_string
+
+    field_class = import_string(FIELD_CLASSES[variant])
+    model_names = [f"Model{i}" for i in range(models)]
+    app_dir = os.path.join(project_dir, APP_LABEL)
+    os.makedirs(os.path.join(app_dir, "migrations"))
+    for path in ["__init__.py", os.path.join("migrations", "__init__.py")]:
+        with open(os.path.join(app_dir, path), "w"):
+            pass
+
+    total_size = 0
+    previous = None
+    for number in range(1, migrations + 1):
+        block_count = blocks + number - 1
+        operations: list[Any] = []
+        if number == 1:
+            for name in model_names:
+                operations.append(
+                    django_migrations.CreateModel(
+                        name,
+                        [
+                            (
+                                "id",
+                                django_models.AutoField(
+                                    auto_created=True,
+                                    primary_key=True,
+                                    serialize=False,
+                                    verbose_name="ID",
+                                ),
+                            ),
+                            ("body", field_class(make_blocks(block_count))),
+                        ],
+                    )
+                )
+        else:
+            for name in model_names:
+                operations.append(
+                    django_migrations.AddField(
+                        name.lower(),
+                        f"field_{number}",
+                        django_models.CharField(max_length=255, blank=True),
+                    )
+                )
+                if variant == "native":
+                    operations.append(
+                        django_migrations.AlterField(
+                            name.lower(), "body", field_class(make_blocks(block_count))
+                        )
+                    )
+        migration = django_migrations.Migration(f"{number:04d}_auto", APP_LABEL)
+        migration.initial = number == 1
+        migration.dependencies = [(APP_LABEL, previous)] if previous else []
+        migration.operations = operations
+        source = MigrationWriter(migration).as_string()
+        with open(
+            os.path.join(app_dir, "migrations", f"{migration.name}.py"), "w"
+        ) as f:
+            f.write(source)
+        total_size += len(source.encode())
+        previous = migration.name
+
+    lines = [
+        "from django.db import models",
+        f"from {FIELD_CLASSES[variant].rsplit('.', 1)[0]} import StreamField",
+        "",
+        "from bench_migrations import make_blocks",
+    ]
+    for name in model_names:
+        lines += ["", "", f"class {name}(models.Model):"]
+        for number in range(2, migrations + 1):
+            lines.append(
+                f"    field_{number} = models.CharField(max_length=255, blank=True)"
+            )
+        lines.append(f"    body = StreamField(make_blocks({blocks + migrations - 1}))")
+    with open(os.path.join(app_dir, "models.py"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return total_size
+
+
+def measure(project_dir: str) -> dict[str, float]:
+    """
+    Time each step once, returning the results in milliseconds. Only called
+    in a fresh process (see `main()`).
+    """
+    configure(project_dir)
+
+    from django.apps import apps
+    from django.core.management import call_command
+    from django.db.migrations.autodetector import MigrationAutodetector
+    from django.db.migrations.loader import MigrationLoader
+    from django.db.migrations.questioner import NonInteractiveMigrationQuestioner
+    from django.db.migrations.state import ProjectState
+
+    timings = {}
+
+    start = time.perf_counter()
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    state = loader.project_state()
+    timings["state"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    state.apps  # noqa: B018
+    timings["render"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    changes = MigrationAutodetector(
+        loader.project_state(),
+        ProjectState.from_apps(apps),
+        NonInteractiveMigrationQuestioner(dry_run=True),
+    ).changes(graph=loader.graph)
+    timings["autodetect"] = time.perf_counter() - start
+    if changes:
+        raise SystemExit("The generated models and migrations are out of sync")
+
+    start = time.perf_counter()
+    call_command("migrate", plan=True, stdout=io.StringIO())
+    timings["plan"] = time.perf_counter() - start
+
+    return {step: value * 1000 for step, value in timings.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--models", type=int, default=20)
+    parser.add_argument("--migrations", type=int, default=30)
+    parser.add_argument("--blocks", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write machine-readable results to this file")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        json.dump(measure(args.measure), sys.stdout)
+        return
+
+    import django
+    import wagtail
+
+    configure()
+    parameters = {
+        "models": args.models,
+        "migrations": args.migrations,
+        "blocks": args.blocks,
+        "repeat": args.repeat,
+    }
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for variant in FIELD_CLASSES:
+            project_dir = os.path.join(temp_dir, variant)
+            migration_bytes = generate_app(
+                project_dir, variant, args.models, args.migrations, args.blocks
+            )
+            runs = [
+                json.loads(
+                    subprocess.run(  # noqa: S603
+                        [sys.executable, __file__, "--measure", project_dir],
+                        check=True,
+                        capture_output=True,
+                        text=True,
+                    ).stdout
+                )
+                for _ in range(args.repeat)
+            ]
+            results[variant] = {
+                "migration_bytes": migration_bytes,
+                "timings_ms": {
+                    step: {
+                        "min": min(run[step] for run in runs),
+                        "median": statistics.median(run[step] for run in runs),
+                    }
+                    for step in STEPS
+                },
+            }
+
+    print(f"{'step':>12} {'native ms':>12} {'mlstreamfield ms':>17} {'speed-up':>9}")
+    for step in STEPS:
+        native = results["native"]["timings_ms"][step]["median"]
+        lite = results["mlstreamfield"]["timings_ms"][step]["median"]
+        print(f"{step:>12} {native:>12.1f} {lite:>17.1f} {native / lite:>8.1f}x")
+    print(
+        f"{'size (KB)':>12} {results['native']['migration_bytes'] / 1024:>12.1f} "
+        f"{results['mlstreamfield']['migration_bytes'] / 1024:>17.1f}"
+    )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "environment": {
+                        "python": platform.python_version(),
+                        "django": django.get_version(),
+                        "wagtail": wagtail.__version__,
+                    },
+                    "parameters": parameters,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Measures the time and memory spent building the StreamBlocks of many models
+that use the same block types, with and without StreamBlocks being shared
+between fields (see `mlstreamfield.fields.StreamField.stream_block`).
+
+For each way of declaring block types (a shared list of blocks, or a
+StreamBlock subclass), models are defined (as when importing models.py),
+then each field's StreamBlock is built and checked (as `manage.py check`
+and the first requests to a worker do), and the memory still allocated
+afterwards is reported.
+
+Usage:
+
+    python benchmarks/bench_shared_blocks.py [--models 50] [--blocks 100]
+        [--repeat 5]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from bench_migrations import configure, make_blocks
+
+
+def define_models(registry, count: int, block_types) -> list:
+    from django.db import models
+
+    from mlstreamfield.fields import StreamField
+
+    return [
+        type(
+            f"Model{i}",
+            (models.Model,),
+            {
+                "__module__": __name__,
+                "Meta": type("Meta", (), {"app_label": "bench", "apps": registry}),
+                "body": StreamField(block_types, blank=True),
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def measure(count: int, block_types, *, shared: bool) -> tuple[float, float, int]:
+    """
+    Return the milliseconds taken to define `count` models, and to build and
+    check their StreamBlocks, and the bytes still allocated afterwards.
+    """
+    from django.apps.registry import Apps
+    from django.conf import settings
+
+    from mlstreamfield import fields
+
+    settings.MLSTREAMFIELD_SHARE_STREAM_BLOCKS = shared
+    fields.shared_stream_blocks.clear()
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    bench_models = define_models(Apps(), count, block_types)
+    defined = time.perf_counter()
+    for model in bench_models:
+        field = model._meta.get_field("body")
+        field.stream_block.check(field=field)
+    built = time.perf_counter()
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (defined - start) * 1000, (built - defined) * 1000, allocated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--models", type=int, default=50)
+    parser.add_argument("--blocks", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    configure()
+
+    from wagtail.blocks import StreamBlock
+
+    block_list = make_blocks(args.blocks)
+    BodyBlock = type("BodyBlock", (StreamBlock,), dict(make_blocks(args.blocks)))
+
+    print(
+        f"{'block types':>12} {'shared':>7} {'define ms':>10} "
+        f"{'build+check ms':>15} {'memory KiB':>11}"
+    )
+    for label, block_types in [("list", block_list), ("class", BodyBlock)]:
+        results = {}
+        for shared in (False, True):
+            runs = [
+                measure(args.models, block_types, shared=shared)
+                for _ in range(args.repeat)
+            ]
+            define_ms = min(run[0] for run in runs)
+            build_ms = min(run[1] for run in runs)
+            memory = min(run[2] for run in runs)
+            results[shared] = (define_ms, build_ms, memory)
+            print(
+                f"{label:>12} {'yes' if shared else 'no':>7} {define_ms:>10.1f} "
+                f"{build_ms:>15.1f} {memory / 1024:>11.1f}"
+            )
+        saved = results[False][2] - results[True][2]
+        print(
+            f"{'':>12} {'saved':>7} "
+            f"{results[False][0] - results[True][0]:>10.1f} "
+            f"{results[False][1] - results[True][1]:>15.1f} {saved / 1024:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate
+
+from mlstreamfield import instrumentation
+
+
+class MLStreamFieldConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "mlstreamfield"
+    verbose_name = "Migration-lite StreamField"
+
+    def ready(self) -> None:
+        if getattr(settings, "MLSTREAMFIELD_INSTRUMENTATION", False):
+            instrumentation.enable()
+        # Sent once per run of migrate (and flush), as this app has models
+        post_migrate.connect(
+            instrumentation.print_summary,
+            sender=self,
+            dispatch_uid="mlstreamfield.instrumentation.print_summary",
+        )
@@ -0,0 +1,1128 @@
+"""
+Helpers for transforming raw StreamField data in bulk, for use in data
+migrations (or, using the async variants, in scripts running under asyncio).
+"""
+
+import asyncio
+import difflib
+import json
+import multiprocessing
+import time
+
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, NamedTuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, transaction
+from django.db.models.functions import Cast
+
+from mlstreamfield import instrumentation
+from mlstreamfield.codecs import JSONCodec
+from mlstreamfield.diff import apply_diff, diff_raw_data
+from mlstreamfield.fields import EncodedJSON
+from mlstreamfield.utils import stream_value_has_changed
+from mlstreamfield.values import (
+    ChangeTracker,
+    RawStreamValue,
+    decode_raw_json,
+    track_changes,
+)
+
+
+RawDataTransform = Callable[[Any], Any]
+
+
+class TransformResult(NamedTuple):
+    processed: int
+    changed: int
+
+
+def get_queryset(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any],
+) -> models.QuerySet[Any]:
+    if isinstance(model_or_queryset, models.QuerySet):
+        return model_or_queryset
+    return model_or_queryset._base_manager.all()
+
+
+def iter_batches(
+    queryset: models.QuerySet[Any],
+    field_name: str,
+    batch_size: int,
+    *,
+    after_pk: Any = None,
+) -> Iterator[list[models.Model]]:
+    """
+    Yield lists of up to `batch_size` objects from `queryset`, with only the
+    primary key and `field_name` values loaded. Objects are fetched in primary
+    key order, using the last primary key of each batch to fetch the next
+    (rather than OFFSET, which gets slower the further through the table you
+    get), so memory use and query times remain constant for any table size.
+    If `after_pk` is provided, only objects after it are fetched.
+    """
+    queryset = queryset.only(field_name).order_by("pk")
+    last_pk = after_pk
+    while True:
+        batch_queryset = queryset
+        if last_pk is not None:
+            batch_queryset = queryset.filter(pk__gt=last_pk)
+        batch = list(batch_queryset[:batch_size])
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1].pk
+
+
+def get_mlstreamfield_model(
+    opts: Any, model_name: str, feature: str, migration: str
+) -> Any:
+    """
+    Return one of this app's models from the app registry of `opts` (e.g.
+    the historical models of a data migration, whose fields mypy can't
+    know about).
+    """
+    try:
+        return opts.apps.get_model("mlstreamfield", model_name)
+    except LookupError:
+        raise ValueError(
+            f"{feature} require 'mlstreamfield' to be in INSTALLED_APPS, and "
+            "migrations that use them to depend on "
+            f"('mlstreamfield', '{migration}')."
+        ) from None
+
+
+class Checkpoint:
+    """
+    Counts the objects processed and changed by a transform of `queryset`,
+    as each batch is written. If `key` is provided, progress is also
+    recorded in the `TransformCheckpoint` table (in the same transaction as
+    each batch), so that an interrupted transform with the same key resumes
+    after the last batch written. The record is deleted by `finish()`, unless
+    `keep` is `True`, in which case running the transform again (with the
+    same key) skips every object already written, until the record is
+    deleted by `delete_checkpoints()`.
+
+    If `patches` is set, reverse patches for the objects written are
+    recorded in the same transaction as each batch.
+    """
+
+    patches: "ReversePatches | None" = None
+
+    def __init__(
+        self,
+        queryset: models.QuerySet[Any],
+        field_name: str,
+        key: str | None,
+        *,
+        keep: bool = False,
+    ) -> None:
+        self.db = queryset.db
+        self.keep = keep
+        self.processed = 0
+        self.changed = 0
+        self.last_pk: Any = None
+        # An object of the historical TransformCheckpoint model, if any
+        self.record: Any = None
+        if key is None:
+            return
+        opts = queryset.model._meta
+        TransformCheckpoint = get_mlstreamfield_model(
+            opts, "TransformCheckpoint", "Checkpoints", "0001_initial"
+        )
+        self.record = (
+            TransformCheckpoint._base_manager.db_manager(self.db)
+            .filter(key=key)
+            .first()
+        )
+        if self.record is None:
+            self.record = TransformCheckpoint(
+                key=key, model=opts.label_lower, field_name=field_name
+            )
+        elif (self.record.model, self.record.field_name) != (
+            opts.label_lower,
+            field_name,
+        ):
+            raise ValueError(
+                f"Checkpoint {key!r} is for {self.record.model}."
+                f"{self.record.field_name}, not {opts.label_lower}.{field_name}."
+            )
+        else:
+            self.last_pk = opts.pk.to_python(self.record.last_pk)
+            self.processed = self.record.processed
+            self.changed = self.record.changed
+
+    def write_batch(
+        self,
+        manager: models.Manager[Any],
+        batch: list[models.Model],
+        to_update: list[models.Model],
+        fields: list[str],
+    ) -> int:
+        """
+        Write the changed objects in `batch` using `bulk_update()`, and
+        record the batch as done, returning the number of objects written.
+        """
+        with (
+            nullcontext()
+            if self.record is None and self.patches is None
+            else transaction.atomic(using=self.db, savepoint=False)
+        ):
+            if to_update:
+                manager.bulk_update(to_update, fields)
+            if self.patches is not None:
+                self.patches.write(batch, to_update)
+            self.processed += len(batch)
+            self.changed += len(to_update)
+            self.last_pk = batch[-1].pk
+            if self.record is not None:
+                self.record.last_pk = str(self.last_pk)
+                self.record.processed = self.processed
+                self.record.changed = self.changed
+                self.record.save(using=self.db)
+        return len(to_update)
+
+    def finish(self) -> TransformResult:
+        if self.record is not None and self.record.pk is not None and not self.keep:
+            self.record.delete(using=self.db)
+        return TransformResult(self.processed, self.changed)
+
+
+def delete_checkpoints(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any], *keys: str
+) -> None:
+    """
+    Delete the checkpoint records with `keys` (kept by transforms with
+    `keep_checkpoint=True`), in a single query, using the database and app
+    registry of `model_or_queryset`.
+    """
+    queryset = get_queryset(model_or_queryset)
+    TransformCheckpoint = get_mlstreamfield_model(
+        queryset.model._meta, "TransformCheckpoint", "Checkpoints", "0001_initial"
+    )
+    TransformCheckpoint._base_manager.db_manager(queryset.db).filter(
+        key__in=keys
+    ).delete()
+
+
+class ReversePatches:
+    """
+    Records a patch (see `mlstreamfield.diff`) that undoes the changes made
+    to each object written by a transform of `queryset`, in the
+    `ReversePatch` table, so that the changes can be undone by
+    `replay_reverse_patches()` with the same `key`. The stored value of each
+    object must be captured (see `capture()`) before it's transformed.
+
+    Values that aren't StreamField data (raw text converted from another
+    field type, see `decode_raw_json()`) can't be patched, so a `raw` patch
+    holding the stored JSON is recorded for them instead.
+    """
+
+    def __init__(
+        self,
+        queryset: models.QuerySet[Any],
+        field_name: str,
+        key: str,
+        *,
+        resuming: bool = False,
+    ) -> None:
+        opts = queryset.model._meta
+        ReversePatch = get_mlstreamfield_model(
+            opts, "ReversePatch", "Reverse patches", "0002_reversepatch"
+        )
+        self.manager = ReversePatch._base_manager.db_manager(queryset.db)
+        self.key = key
+        self.model = opts.label_lower
+        self.field_name = field_name
+        self.codec = opts.get_field(field_name).codec
+        self.originals: dict[Any, str] = {}
+        # Patches from an interrupted run of the same transform are kept
+        if not resuming and self.manager.filter(key=key).exists():
+            raise ValueError(
+                f"Reverse patches {key!r} already exist. Replay them with "
+                "replay_reverse_patches() (or delete them) before using the "
+                "key again."
+            )
+
+    def capture(self, batch: list[models.Model]) -> None:
+        for obj in batch:
+            self.originals[obj.pk] = get_raw_json(
+                getattr(obj, self.field_name), self.codec
+            )
+
+    def write(self, batch: list[models.Model], to_update: list[models.Model]) -> None:
+        records = []
+        for obj in to_update:
+            raw_json = self.originals[obj.pk]
+            original, raw_text = decode_raw_json(raw_json, self.codec)
+            value = getattr(obj, self.field_name)
+            if raw_text is not None:
+                patch = [["raw", raw_json]]
+            else:
+                patch = diff_raw_data(
+                    None if value is None else value.raw_data, original
+                )
+            if patch:
+                records.append(
+                    self.manager.model(
+                        key=self.key,
+                        model=self.model,
+                        field_name=self.field_name,
+                        object_pk=str(obj.pk),
+                        patch=patch,
+                    )
+                )
+        self.manager.bulk_create(records)
+        for obj in batch:
+            self.originals.pop(obj.pk, None)
+
+
+def can_skip(raw_json: str, transform: RawDataTransform) -> bool:
+    """
+    Return `True` if `transform` has an `applies_to()` method (see
+    `RawDataTransformer.applies_to()`) that says it can't change `raw_json`,
+    so that decoding it can be skipped.
+    """
+    applies_to = getattr(transform, "applies_to", None)
+    return applies_to is not None and not applies_to(raw_json)
+
+
+def apply_transform(
+    obj: models.Model, field_name: str, transform: RawDataTransform
+) -> bool:
+    """
+    Apply `transform` to the raw data of `field_name` for `obj`, returning
+    `True` if the value was changed as a result. `transform` can modify the
+    raw data in place, or return a new value to replace it with.
+    """
+    value = getattr(obj, field_name)
+    if (
+        isinstance(value, RawStreamValue)
+        and value.raw_json is not None
+        and not value.is_decoded
+        and can_skip(value.raw_json, transform)
+    ):
+        return False
+    raw_data = value.raw_data
+    started = instrumentation.start()
+    result = transform(raw_data)
+    instrumentation.record(obj._meta.get_field(field_name), "transform", started)
+    if result is not None and result is not raw_data:
+        setattr(obj, field_name, result)
+        return True
+    return stream_value_has_changed(value)
+
+
+def transform_json(
+    raw_json: str, transform: RawDataTransform, codec: JSONCodec
+) -> str | None:
+    """
+    Decode `raw_json`, apply `transform` to the result, and return the
+    transformed data encoded as JSON, or `None` if it was not changed (or
+    `raw_json` doesn't contain StreamField data).
+    """
+    if can_skip(raw_json, transform):
+        return None
+    raw_data, raw_text = decode_raw_json(raw_json, codec)
+    if raw_text is not None:
+        return None
+    tracker = ChangeTracker()
+    raw_data = track_changes(raw_data, tracker)
+    result = transform(raw_data)
+    if result is not None and result is not raw_data:
+        return codec.dumps(result)
+    if tracker.changed:
+        return codec.dumps(raw_data)
+    return None
+
+
+def transform_json_batch(
+    rows: list[tuple[Any, str]],
+    transform: RawDataTransform,
+    codec: JSONCodec,
+) -> list[tuple[Any, str]]:
+    """
+    Apply `transform_json()` to a list of `(pk, raw_json)` tuples in a worker
+    process, returning `(pk, new_json)` tuples for changed values only.
+    """
+    results = []
+    for pk, raw_json in rows:
+        new_json = transform_json(raw_json, transform, codec)
+        if new_json is not None:
+            results.append((pk, new_json))
+    return results
+
+
+def init_worker() -> None:
+    import django
+
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+RowBatch = list[tuple[Any, str]]
+
+
+def run_in_workers(
+    batches: Iterable[tuple[RowBatch, Callable[[RowBatch], int]]],
+    transform: RawDataTransform,
+    codec: JSONCodec,
+    workers: int,
+) -> int:
+    """
+    Apply `transform_json()` to the `(pk, raw_json)` rows of each of
+    `batches` in a pool of `workers` worker processes. The changed rows of
+    each batch are passed to its callback in this process, in order, and the
+    total of the values they return is returned.
+
+    `batches` is only consumed as workers become free, so that no more than
+    `workers * 2` batches are held in memory at once.
+    """
+    changed = 0
+    pending: deque[tuple[Future[RowBatch], Callable[[RowBatch], int]]] = deque()
+    # Workers are started with "spawn" rather than "fork", so that they never
+    # share (and risk closing) the database connections of this process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+    ) as executor:
+        for rows, write_results in batches:
+            future = executor.submit(transform_json_batch, rows, transform, codec)
+            pending.append((future, write_results))
+            while len(pending) >= workers * 2:
+                future, write_results = pending.popleft()
+                changed += write_results(future.result())
+        while pending:
+            future, write_results = pending.popleft()
+            changed += write_results(future.result())
+    return changed
+
+
+def transform_raw_data_in_parallel(
+    queryset: models.QuerySet[Any],
+    field_name: str,
+    transform: RawDataTransform,
+    *,
+    batch_size: int,
+    workers: int,
+    checkpoint: Checkpoint,
+) -> None:
+    field = queryset.model._meta.get_field(field_name)
+    codec = field.codec
+    manager = queryset.model._base_manager.db_manager(queryset.db)
+
+    def write_results(
+        batch: list[models.Model], to_update: list[models.Model], results: RowBatch
+    ) -> int:
+        objs_by_pk = {obj.pk: obj for obj in batch}
+        for pk, new_json in results:
+            obj = objs_by_pk[pk]
+            setattr(
+                obj,
+                field_name,
+                RawStreamValue.from_json(field.stream_block, new_json, codec),
+            )
+            to_update.append(obj)
+        return checkpoint.write_batch(manager, batch, to_update, [field_name])
+
+    def iter_row_batches() -> Iterator[tuple[RowBatch, Callable[[RowBatch], int]]]:
+        for batch in iter_batches(
+            queryset, field_name, batch_size, after_pk=checkpoint.last_pk
+        ):
+            if checkpoint.patches is not None:
+                checkpoint.patches.capture(batch)
+            rows = []
+            to_update = []
+            for obj in batch:
+                value = getattr(obj, field_name)
+                if (
+                    isinstance(value, RawStreamValue)
+                    and value.raw_json is not None
+                    and not value.is_decoded
+                ):
+                    if not can_skip(value.raw_json, transform):
+                        rows.append((obj.pk, value.raw_json))
+                elif apply_transform(obj, field_name, transform):
+                    # e.g. NULL values, which aren't worth sending to a worker
+                    to_update.append(obj)
+            yield rows, partial(write_results, batch, to_update)
+
+    run_in_workers(iter_row_batches(), transform, codec, workers)
+
+
+def transform_raw_data(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any],
+    field_name: str,
+    transform: RawDataTransform,
+    *,
+    batch_size: int = 500,
+    workers: int | None = None,
+    checkpoint: str | None = None,
+    keep_checkpoint: bool = False,
+    reverse_patches: str | None = None,
+) -> TransformResult:
+    """
+    Apply `transform` to the raw data of a StreamField for every object in a
+    model's table (or a queryset), and write any changed values back to the
+    database using `bulk_update()`, `batch_size` rows at a time.
+
+    Only the primary key and the StreamField value are fetched, and only
+    one batch of objects is held in memory at a time. `transform` receives the
+    raw data (a list of dicts) and can modify it in place, or return a new
+    value to replace it with. Unchanged values are not written back.
+
+    For example:
+
+        def rename_block_type(raw_data):
+            for block in raw_data:
+                if block["type"] == "heading":
+                    block["type"] = "title"
+
+
+        def migrate_forwards(apps, schema_editor):
+            BlogPage = apps.get_model("blog", "BlogPage")
+            transform_raw_data(BlogPage, "body", rename_block_type)
+
+    If `workers` is provided, values are decoded, transformed and encoded in
+    a pool of that many worker processes, while this process reads batches
+    from the database and writes the results. Because all reads and writes
+    still use the migration's own database connection, atomic migrations
+    remain atomic. `transform` must be picklable (i.e. a module-level
+    function, not a lambda or nested function) to be used with workers.
+
+    For long-running transforms in non-atomic migrations, provide a unique
+    `checkpoint` key. Progress is then recorded (in the same transaction as
+    each batch), and if the transform is interrupted, running it again with
+    the same key resumes after the last batch written. The counts returned
+    include those of any earlier, interrupted runs. The record is deleted
+    when the transform completes, unless `keep_checkpoint` is `True` (e.g.
+    because later steps of the same migration use checkpoints too), in which
+    case it must be deleted with `delete_checkpoints()` once they complete.
+
+    To make a transform reversible, provide a unique `reverse_patches` key.
+    For each value written, a patch that restores the original value is then
+    recorded (in the same transaction as each batch), which can be replayed
+    by `replay_reverse_patches()` in the backwards migration:
+
+        def migrate_backwards(apps, schema_editor):
+            BlogPage = apps.get_model("blog", "BlogPage")
+            replay_reverse_patches(BlogPage, "body", "blog_0042_rename_headings")
+
+    If `transform` has an `applies_to()` method, it is called with each
+    stored JSON string before it is decoded, and values it returns `False`
+    for are skipped (see `RawDataTransformer.applies_to()`), which makes
+    running the same transform again over converted values cheap.
+    """
+    queryset = get_queryset(model_or_queryset)
+    progress = Checkpoint(queryset, field_name, checkpoint, keep=keep_checkpoint)
+    if reverse_patches is not None:
+        progress.patches = ReversePatches(
+            queryset,
+            field_name,
+            reverse_patches,
+            resuming=progress.last_pk is not None,
+        )
+    if workers:
+        transform_raw_data_in_parallel(
+            queryset,
+            field_name,
+            transform,
+            batch_size=batch_size,
+            workers=workers,
+            checkpoint=progress,
+        )
+        return progress.finish()
+    manager = queryset.model._base_manager.db_manager(queryset.db)
+    for batch in iter_batches(
+        queryset, field_name, batch_size, after_pk=progress.last_pk
+    ):
+        if progress.patches is not None:
+            progress.patches.capture(batch)
+        to_update = [
+            obj for obj in batch if apply_transform(obj, field_name, transform)
+        ]
+        progress.write_batch(manager, batch, to_update, [field_name])
+    return progress.finish()
+
+
+def replay_reverse_patches(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any],
+    field_name: str,
+    key: str,
+    *,
+    batch_size: int = 500,
+) -> TransformResult:
+    """
+    Undo the changes made by `transform_raw_data()` with the same
+    `reverse_patches` key, by applying the recorded patches to the current
+    values of `field_name`, `batch_size` objects at a time. Each batch of
+    patches is deleted in the same transaction as the values are written,
+    so an interrupted replay can simply be run again.
+
+    Patches are only guaranteed to restore the original values if they're
+    applied to the values written by the transform. A `ValueError` is
+    raised if a patch can't be applied (e.g. because a block it refers to
+    has since been removed). Objects deleted since are skipped.
+    """
+    queryset = get_queryset(model_or_queryset)
+    opts = queryset.model._meta
+    ReversePatch = get_mlstreamfield_model(
+        opts, "ReversePatch", "Reverse patches", "0002_reversepatch"
+    )
+    patches = ReversePatch._base_manager.db_manager(queryset.db).filter(key=key)
+    other = patches.exclude(model=opts.label_lower, field_name=field_name).first()
+    if other is not None:
+        raise ValueError(
+            f"Reverse patches {key!r} are for {other.model}.{other.field_name}, "
+            f"not {opts.label_lower}.{field_name}."
+        )
+    manager = queryset.model._base_manager.db_manager(queryset.db)
+    processed = changed = 0
+    while True:
+        records = list(patches.order_by("pk")[:batch_size])
+        if not records:
+            break
+        objs_by_pk = {
+            str(obj.pk): obj
+            for obj in queryset.filter(
+                pk__in=[opts.pk.to_python(record.object_pk) for record in records]
+            ).only(field_name)
+        }
+        to_update = []
+        for record in records:
+            obj = objs_by_pk.get(record.object_pk)
+            if obj is None:
+                continue
+            if record.patch[0][0] == "raw":
+                # Written as it was stored, without being decoded
+                setattr(obj, field_name, EncodedJSON(record.patch[0][1]))
+                to_update.append(obj)
+                continue
+            value = getattr(obj, field_name)
+            try:
+                original = apply_diff(
+                    None if value is None else value.raw_data, record.patch
+                )
+            except (KeyError, IndexError, TypeError) as err:
+                raise ValueError(
+                    f"The reverse patch for {opts.label_lower} {record.object_pk} "
+                    "can't be applied to its current value."
+                ) from err
+            setattr(obj, field_name, original)
+            to_update.append(obj)
+        with transaction.atomic(using=queryset.db, savepoint=False):
+            if to_update:
+                manager.bulk_update(to_update, [field_name])
+            patches.filter(pk__in=[record.pk for record in records]).delete()
+        processed += len(records)
+        changed += len(to_update)
+    return TransformResult(processed, changed)
+
+
+def get_raw_json_rows(
+    queryset: models.QuerySet[Any], field_name: str
+) -> models.QuerySet[Any]:
+    """
+    Return `(pk, raw_json)` rows from `queryset`, in primary key order, where
+    `raw_json` is the JSON text stored in the database for `field_name`, so
+    that values are never decoded (and can be fetched for any model, not just
+    those from data migrations).
+    """
+    return (
+        queryset.annotate(raw_json=Cast(field_name, output_field=models.TextField()))
+        .order_by("pk")
+        .values_list("pk", "raw_json")
+    )
+
+
+def iter_raw_json_batches(
+    queryset: models.QuerySet[Any], field_name: str, batch_size: int
+) -> Iterator[RowBatch]:
+    """
+    Yield lists of up to `batch_size` `(pk, raw_json)` rows from `queryset`
+    (see `get_raw_json_rows()`), in the same way as `iter_batches()`.
+    """
+    queryset = get_raw_json_rows(queryset, field_name)
+    last_pk = None
+    while True:
+        batch_queryset = queryset
+        if last_pk is not None:
+            batch_queryset = queryset.filter(pk__gt=last_pk)
+        batch = list(batch_queryset[:batch_size])
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1][0]
+
+
+async def aiter_raw_json_batches(
+    queryset: models.QuerySet[Any], field_name: str, batch_size: int
+) -> AsyncIterator[RowBatch]:
+    """
+    An async version of `iter_raw_json_batches()`, fetching each batch with
+    Django's async ORM.
+    """
+    queryset = get_raw_json_rows(queryset, field_name)
+    last_pk = None
+    while True:
+        batch_queryset = queryset
+        if last_pk is not None:
+            batch_queryset = queryset.filter(pk__gt=last_pk)
+        batch = [row async for row in batch_queryset[:batch_size]]
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1][0]
+
+
+async def atransform_raw_data(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any],
+    field_name: str,
+    transform: RawDataTransform,
+    *,
+    batch_size: int = 500,
+    executor: Executor | None = None,
+) -> TransformResult:
+    """
+    An async version of `transform_raw_data()`, for scripts using Django's
+    async ORM. Batches are read asynchronously, decoded, transformed and
+    encoded in `executor` (the event loop's default thread pool if not
+    provided), and changed values are written with `abulk_update()`, so that
+    one event loop can transform the values of several models at once:
+
+        await asyncio.gather(
+            atransform_raw_data(BlogPage, "body", rename_block_type),
+            atransform_raw_data(EventPage, "body", rename_block_type),
+        )
+
+    Pass a `ProcessPoolExecutor` to use more than one CPU, in which case
+    `transform` must be picklable. Unlike `transform_raw_data()`, each batch
+    is written in its own transaction, so this isn't suitable for atomic
+    migrations, and neither checkpoints nor reverse patches are supported.
+    """
+    queryset = get_queryset(model_or_queryset)
+    model = queryset.model
+    pk_attname = model._meta.pk.attname
+    codec = model._meta.get_field(field_name).codec
+    manager = queryset.model._base_manager.db_manager(queryset.db)
+    loop = asyncio.get_running_loop()
+    processed = changed = 0
+    async for batch in aiter_raw_json_batches(queryset, field_name, batch_size):
+        processed += len(batch)
+        rows = [
+            (pk, raw_json)
+            for pk, raw_json in batch
+            if raw_json is not None and not can_skip(raw_json, transform)
+        ]
+        if not rows:
+            continue
+        results = await loop.run_in_executor(
+            executor, transform_json_batch, rows, transform, codec
+        )
+        to_update = []
+        for pk, new_json in results:
+            # A deferred instance, as if loaded with only("pk")
+            obj = model.from_db(queryset.db, [pk_attname], [pk])
+            # Written as it is, without being decoded again
+            setattr(obj, field_name, EncodedJSON(new_json))
+            to_update.append(obj)
+        if to_update:
+            await manager.abulk_update(to_update, [field_name])
+            changed += len(to_update)
+    return TransformResult(processed, changed)
+
+
+def get_revisions(
+    queryset: models.QuerySet[Any], *, latest_only: bool = False
+) -> models.QuerySet[Any]:
+    """
+    Return the Wagtail revisions of the objects in `queryset` (or of every
+    object of its model, and of any models that inherit from it, if it isn't
+    filtered), using the same app registry and database as `queryset`.
+
+    If `latest_only` is `True`, only the latest revision of each object, and
+    any revisions scheduled to be published, are included.
+    """
+    model = queryset.model
+    Revision = model._meta.apps.get_model("wagtailcore", "Revision")
+    content_types = models.Q()
+    for model_class in model._meta.apps.get_models():
+        if issubclass(model_class, model):
+            content_types |= models.Q(
+                content_type__app_label=model_class._meta.app_label,
+                content_type__model=model_class._meta.model_name,
+            )
+    revisions: models.QuerySet[Any] = Revision._base_manager.db_manager(
+        queryset.db
+    ).filter(content_types)
+    if queryset.query.where:
+        revisions = revisions.filter(
+            object_id__in=queryset.values(object_id=Cast("pk", models.CharField()))
+        )
+    if latest_only:
+        try:
+            model._meta.get_field("latest_revision")
+        except FieldDoesNotExist:
+            raise ValueError(
+                f"{model._meta.label} doesn't keep track of its latest revision."
+            ) from None
+        revisions = revisions.filter(
+            models.Q(pk__in=queryset.values("latest_revision"))
+            | models.Q(approved_go_live_at__isnull=False)
+        )
+    return revisions
+
+
+def get_revision_json(revision: Any, field_name: str) -> str | None:
+    """
+    Return the JSON string of `field_name` in the content of `revision`, or
+    `None` if it doesn't have one.
+    """
+    content = revision.content
+    if isinstance(content, dict) and isinstance(content.get(field_name), str):
+        return content[field_name]  # type: ignore[no-any-return]
+    return None
+
+
+def apply_transform_to_revision(
+    revision: Any,
+    field_name: str,
+    transform: RawDataTransform,
+    codec: JSONCodec,
+) -> bool:
+    """
+    Apply `transform` to the raw data of `field_name` in the content of
+    `revision`, returning `True` if the value was changed as a result.
+    """
+    raw_json = get_revision_json(revision, field_name)
+    if raw_json is None:
+        return False
+    new_json = transform_json(raw_json, transform, codec)
+    if new_json is None:
+        return False
+    revision.content[field_name] = new_json
+    return True
+
+
+def transform_revisions(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any],
+    field_name: str,
+    transform: RawDataTransform,
+    *,
+    latest_only: bool = False,
+    batch_size: int = 500,
+    workers: int | None = None,
+    checkpoint: str | None = None,
+    keep_checkpoint: bool = False,
+) -> TransformResult:
+    """
+    Apply `transform` to the raw data of a StreamField in the content of the
+    Wagtail revisions (including drafts) of every object of a model (or of
+    the objects in a filtered queryset), in the same way as
+    `transform_raw_data()` does for the objects themselves. For example:
+
+        def migrate_forwards(apps, schema_editor):
+            BlogPage = apps.get_model("blog", "BlogPage")
+            transform_raw_data(BlogPage, "body", rename_block_type)
+            transform_revisions(BlogPage, "body", rename_block_type)
+
+    Revisions store StreamField values as JSON strings, which are decoded,
+    transformed and encoded in the same way as values of the field itself,
+    optionally in `workers` worker processes, and progress can be recorded
+    using a `checkpoint` key (and kept with `keep_checkpoint`). Only the
+    values of the field in each revision's content are changed (not those of
+    any child objects).
+
+    If `latest_only` is `True`, only the latest revision of each object, and
+    any revisions scheduled to be published, are transformed. Older
+    revisions are left as they are, and may not be usable afterwards.
+    """
+    queryset = get_queryset(model_or_queryset)
+    codec = queryset.model._meta.get_field(field_name).codec
+    revisions = get_revisions(queryset, latest_only=latest_only)
+    manager = revisions.model._base_manager.db_manager(revisions.db)
+    progress = Checkpoint(revisions, "content", checkpoint, keep=keep_checkpoint)
+
+    if workers:
+
+        def write_results(batch: list[Any], results: RowBatch) -> int:
+            revisions_by_pk = {revision.pk: revision for revision in batch}
+            to_update = []
+            for pk, new_json in results:
+                revision = revisions_by_pk[pk]
+                revision.content[field_name] = new_json
+                to_update.append(revision)
+            return progress.write_batch(manager, batch, to_update, ["content"])
+
+        def iter_row_batches() -> Iterator[tuple[RowBatch, Callable[[RowBatch], int]]]:
+            for batch in iter_batches(
+                revisions, "content", batch_size, after_pk=progress.last_pk
+            ):
+                rows = []
+                for revision in batch:
+                    raw_json = get_revision_json(revision, field_name)
+                    if raw_json is not None and not can_skip(raw_json, transform):
+                        rows.append((revision.pk, raw_json))
+                yield rows, partial(write_results, batch)
+
+        run_in_workers(iter_row_batches(), transform, codec, workers)
+        return progress.finish()
+
+    for batch in iter_batches(
+        revisions, "content", batch_size, after_pk=progress.last_pk
+    ):
+        to_update = [
+            revision
+            for revision in batch
+            if apply_transform_to_revision(revision, field_name, transform, codec)
+        ]
+        progress.write_batch(manager, batch, to_update, ["content"])
+    return progress.finish()
+
+
+class RewriteResult(NamedTuple):
+    processed: int
+    rewritten: int
+    bytes_before: int
+    bytes_after: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def reencode_json(raw_json: str, codec: JSONCodec) -> str:
+    """
+    Return `raw_json` decoded and encoded again by `codec`, or as it is if
+    it doesn't contain StreamField data.
+    """
+    raw_data, raw_text = decode_raw_json(raw_json, codec)
+    if raw_text is not None:
+        return raw_json
+    return codec.dumps(raw_data)
+
+
+def rewrite_raw_json(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any],
+    field_name: str,
+    *,
+    codec: JSONCodec | None = None,
+    revisions: bool = False,
+    batch_size: int = 500,
+    dry_run: bool = False,
+    strings_only: bool = False,
+) -> RewriteResult:
+    """
+    Encode the stored values of a StreamField again with `codec` (the
+    field's own codec by default), e.g. to rewrite existing values in the
+    compact form written by fields with `compact_json=True`. Values are
+    fetched in batches, as with `transform_raw_data()`, and only written if
+    their JSON changes (or never, if `dry_run` is `True`). Sizes are counted
+    in bytes of UTF-8 encoded JSON, including those of values that don't
+    change.
+
+    If `revisions` is `True`, the field's values in the content of the
+    objects' Wagtail revisions are rewritten instead of the objects' own
+    values (see `transform_revisions()`).
+
+    If `strings_only` is `True`, only values stored as JSON strings holding
+    the document (as earlier versions of this package could write them) are
+    rewritten, as documents. Other values are counted, but left as they are,
+    e.g. on PostgreSQL, whose `jsonb` columns never store whitespace.
+
+    The field must be in migration mode, e.g. on a model from
+    `apps.get_model()` in a data migration.
+    """
+    queryset = get_queryset(model_or_queryset)
+    field = queryset.model._meta.get_field(field_name)
+    if codec is None:
+        codec = field.codec
+
+    if revisions:
+        queryset = get_revisions(queryset)
+        column = "content"
+
+        def get_json(obj: Any) -> str | None:
+            return get_revision_json(obj, field_name)
+
+        def set_json(obj: Any, new_json: str) -> None:
+            obj.content[field_name] = new_json
+
+    else:
+        column = field_name
+
+        def get_json(obj: Any) -> str | None:
+            value = getattr(obj, field_name)
+            if isinstance(value, RawStreamValue):
+                return value.raw_json
+            return None
+
+        def set_json(obj: Any, new_json: str) -> None:
+            # Unchanged values are written exactly as they were loaded
+            setattr(
+                obj,
+                field_name,
+                RawStreamValue.from_json(field.stream_block, new_json, codec),
+            )
+
+    manager = queryset.model._base_manager.db_manager(queryset.db)
+    processed = rewritten = bytes_before = bytes_after = 0
+    for batch in iter_batches(queryset, column, batch_size):
+        to_update = []
+        for obj in batch:
+            raw_json = get_json(obj)
+            if raw_json is None:
+                continue
+            if strings_only and not raw_json.lstrip().startswith('"'):
+                new_json = raw_json
+            else:
+                new_json = reencode_json(raw_json, codec)
+            processed += 1
+            bytes_before += len(raw_json.encode())
+            bytes_after += len(new_json.encode())
+            if new_json != raw_json:
+                set_json(obj, new_json)
+                to_update.append(obj)
+        rewritten += len(to_update)
+        if to_update and not dry_run:
+            manager.bulk_update(to_update, [column])
+    return RewriteResult(processed, rewritten, bytes_before, bytes_after)
+
+
+@dataclass
+class TransformPreview:
+    """
+    The outcome of applying a transform without writing anything (see
+    `preview_transform()`). Sizes are those of the encoded JSON values, in
+    bytes, and `examples` holds `(pk, diff)` tuples for some changed values.
+    """
+
+    total: int
+    processed: int = 0
+    changed: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    bytes_written: int = 0
+    seconds: float = 0.0
+    examples: list[tuple[Any, str]] = field(default_factory=list)
+
+    @property
+    def changed_ratio(self) -> float:
+        return self.changed / self.processed if self.processed else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+    @property
+    def estimated_seconds(self) -> float:
+        """
+        The estimated time to read and transform every row, which doesn't
+        include the time taken to write changed values.
+        """
+        return self.total / self.rows_per_second if self.rows_per_second else 0.0
+
+    def summary(self) -> list[str]:
+        return [
+            f"Rows: {self.processed} of {self.total} processed, "
+            f"{self.changed} changed ({self.changed_ratio:.1%})",
+            f"Throughput: {self.rows_per_second:.0f} rows/sec "
+            f"(about {self.estimated_seconds:.1f}s for all rows, plus writes)",
+            f"Size: {self.bytes_before} bytes before, {self.bytes_after} after, "
+            f"{self.bytes_written} to be written",
+        ]
+
+
+def get_raw_json(value: Any, codec: JSONCodec) -> str:
+    """
+    Return the JSON that `value` (a StreamField value) was loaded from, or
+    its raw data encoded with `codec` if it wasn't loaded from JSON.
+    """
+    if isinstance(value, RawStreamValue) and value.raw_json is not None:
+        return value.raw_json
+    if value is None:
+        return codec.dumps(None)
+    return codec.dumps(list(value.raw_data))
+
+
+def diff_json(pk: Any, before: Any, after: Any) -> str:
+    return "".join(
+        difflib.unified_diff(
+            json.dumps(before, indent=2).splitlines(keepends=True),
+            json.dumps(after, indent=2).splitlines(keepends=True),
+            fromfile=f"{pk} (before)",
+            tofile=f"{pk} (after)",
+        )
+    )
+
+
+def preview_transform(
+    model_or_queryset: type[models.Model] | models.QuerySet[Any],
+    field_name: str,
+    transform: RawDataTransform,
+    *,
+    sample: int | None = None,
+    batch_size: int = 500,
+    examples: int = 3,
+) -> TransformPreview:
+    """
+    Apply `transform` in the same way as `transform_raw_data()`, without
+    writing anything to the database, and return a `TransformPreview` of
+    how many values would change, how large they are before and after, how
+    quickly they were processed, and diffs of the first `examples` changed
+    values. For example:
+
+        preview = preview_transform(BlogPage, "body", rename_block_type)
+        print("\n".join(preview.summary()))
+
+    If `sample` is provided, only that many randomly chosen objects are
+    processed, and `TransformPreview.estimated_seconds` estimates how long
+    all of them would take.
+    """
+    queryset = get_queryset(model_or_queryset)
+    codec = queryset.model._meta.get_field(field_name).codec
+    preview = TransformPreview(total=queryset.count())
+    if sample is not None:
+        pks = queryset.order_by("?").values_list("pk", flat=True)[:sample]
+        queryset = queryset.filter(pk__in=list(pks))
+    start = time.perf_counter()
+    for batch in iter_batches(queryset, field_name, batch_size):
+        for obj in batch:
+            raw_json = get_raw_json(getattr(obj, field_name), codec)
+            new_json = transform_json(raw_json, transform, codec)
+            size = len(raw_json.encode())
+            preview.processed += 1
+            preview.bytes_before += size
+            if new_json is None:
+                preview.bytes_after += size
+                continue
+            new_size = len(new_json.encode())
+            preview.changed += 1
+            preview.bytes_after += new_size
+            preview.bytes_written += new_size
+            if len(preview.examples) < examples:
+                preview.examples.append(
+                    (
+                        obj.pk,
+                        diff_json(
+                            obj.pk,
+                            decode_raw_json(raw_json, codec)[0],
+                            codec.loads(new_json),
+                        ),
+                    )
+                )
+    preview.seconds = time.perf_counter() - start
+    return preview
@@ -0,0 +1,181 @@
+"""
+JSON codecs used to decode and encode raw StreamField data.
+
+Decoding large StreamField values with the standard library's `json` module
+can account for a large proportion of the time spent running data
+migrations. The codecs here allow a faster third-party library (`msgspec` or
+`ujson`) to be used for decoding when installed.
+
+`orjson` is deliberately not supported: it silently decodes integers that do
+not fit into 64 bits as floats, so values could change when written back.
+
+All codecs encode values in exactly the same format as `json.dumps()` with
+default arguments (the same format Wagtail itself uses), so switching codecs
+never changes what is written to the database. Codecs can also be configured
+to encode values in a compact, canonical form instead (see `get_codec()`).
+"""
+
+import json
+
+from functools import cache
+from typing import Any
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+class JSONCodec:
+    """
+    The default codec, using the standard library's `json` module.
+
+    Subclasses only need to override `loads()`. If the faster library rejects
+    a value that `json.loads()` would accept (e.g. integers larger than 64 bits,
+    or `NaN`), decoding is retried with `json.loads()`, so that every codec
+    accepts and rejects exactly the same input.
+    """
+
+    name = "json"
+    module_name = "json"
+
+    # Encoding options, set by get_codec()
+    compact = False
+    ensure_ascii = True
+
+    @classmethod
+    def is_available(cls) -> bool:
+        try:
+            __import__(cls.module_name)
+        except ImportError:
+            return False
+        return True
+
+    def loads(self, value: str | bytes) -> Any:
+        return json.loads(value)
+
+    @property
+    def dumps_kwargs(self) -> dict[str, Any]:
+        """
+        Keyword arguments for `json.dumps()` matching the codec's encoding
+        options. Compact values have no whitespace, and their keys are
+        sorted, so equal values are always encoded in the same way.
+        """
+        kwargs: dict[str, Any] = {"ensure_ascii": self.ensure_ascii}
+        if self.compact:
+            kwargs.update(separators=(",", ":"), sort_keys=True)
+        return kwargs
+
+    def dumps(self, value: Any) -> str:
+        return json.dumps(value, **self.dumps_kwargs)
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Codecs are sent to worker processes (see `mlstreamfield.bulk`), where
+        # they're recreated, as the functions they hold from other libraries
+        # can't always be pickled
+        return (
+            type(self),
+            (),
+            {"compact": self.compact, "ensure_ascii": self.ensure_ascii},
+        )
+
+    def __repr__(self) -> str:
+        if self.compact or not self.ensure_ascii:
+            return (
+                f"<{type(self).__name__} compact={self.compact} "
+                f"ensure_ascii={self.ensure_ascii}>"
+            )
+        return f"<{type(self).__name__}>"
+
+
+class MsgspecCodec(JSONCodec):
+    name = "msgspec"
+    module_name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._loads = msgspec.json.decode
+
+    def loads(self, value: str | bytes) -> Any:
+        try:
+            return self._loads(value)
+        except ValueError:
+            return super().loads(value)
+
+
+class UjsonCodec(JSONCodec):
+    name = "ujson"
+    module_name = "ujson"
+
+    def __init__(self) -> None:
+        import ujson
+
+        self._loads = ujson.loads
+
+    def loads(self, value: str | bytes) -> Any:
+        try:
+            return self._loads(value)
+        except (ValueError, OverflowError):
+            return super().loads(value)
+
+
+CODECS: dict[str, type[JSONCodec]] = {
+    codec.name: codec for codec in (JSONCodec, MsgspecCodec, UjsonCodec)
+}
+
+# The order in which codecs are tried when the "auto" codec is requested
+AUTO_CODEC_PREFERENCE = ("msgspec", "ujson", "json")
+
+
+@cache
+def _get_codec(
+    name: str, *, compact: bool = False, ensure_ascii: bool = True
+) -> JSONCodec:
+    codec = _create_codec(name)
+    codec.compact = compact
+    codec.ensure_ascii = ensure_ascii
+    return codec
+
+
+def _create_codec(name: str) -> JSONCodec:
+    if name == "auto":
+        for codec_name in AUTO_CODEC_PREFERENCE:
+            if CODECS[codec_name].is_available():
+                return CODECS[codec_name]()
+
+    if name in CODECS:
+        codec_class = CODECS[name]
+        if not codec_class.is_available():
+            raise ImproperlyConfigured(
+                f"The '{name}' JSON codec cannot be used because the "
+                f"'{codec_class.module_name}' package is not installed."
+            )
+        return codec_class()
+
+    try:
+        codec_class = import_string(name)
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            f"'{name}' is not a valid JSON codec. Use one of: "
+            f"{', '.join(['auto', *CODECS])}, or the import path of a "
+            "JSONCodec subclass."
+        ) from e
+    return codec_class()  # type: ignore[no-any-return]
+
+
+def get_codec(
+    name: str | None = None, *, compact: bool = False, ensure_ascii: bool = True
+) -> JSONCodec:
+    """
+    Return a codec instance matching `name`, which can be one of the keys of
+    `CODECS`, "auto" (to use the fastest codec that is installed), or the
+    import path of a custom `JSONCodec` subclass. When `name` is not provided,
+    the `MLSTREAMFIELD_JSON_CODEC` setting is used (defaults to "auto").
+
+    If `compact` is `True`, the codec encodes values without whitespace, and
+    with sorted keys. If `ensure_ascii` is `False`, non-ASCII characters are
+    encoded as they are, rather than as escape sequences.
+    """
+    if name is None:
+        name = getattr(settings, "MLSTREAMFIELD_JSON_CODEC", "auto")
+    return _get_codec(name, compact=compact, ensure_ascii=ensure_ascii)
@@ -0,0 +1,226 @@
+"""
+Block-aware diffs between raw StreamField values, for reviewing the changes
+made by data migrations, and for recording patches that can be applied to
+values later (e.g. to reverse a migration).
+
+Blocks in streams (and ListBlock items in the format used since Wagtail
+2.16) are matched by their `id`, so a diff describes the blocks removed,
+inserted, moved and changed, rather than the lines of JSON that differ. A
+diff is a list of operations, each of which is a JSON-serialisable list:
+
+- `["remove", id]`: remove the block with this id
+- `["insert", index, block]`: insert a new block at this index
+- `["move", id, index]`: move the block with this id to this index
+- `["change", id, key, value]`: set a key of the block with this id (e.g.
+  its "type" or "value")
+- `["patch", id, diff]`: apply a diff to the value of the block with this
+  id, which is itself a stream
+- `["set", value]`: replace the whole value, used where blocks can't be
+  matched by id (e.g. when some of them don't have ids)
+
+Indexes are those in the new value. Only blocks whose positions can't be
+kept (outside a longest increasing subsequence of the blocks both values
+have) are moved, so diffs are small, and are found in O(n log n) time for a
+stream of n blocks, plus the time taken to compare the blocks.
+"""
+
+from bisect import bisect_left
+from itertools import islice
+from typing import Any
+
+
+Diff = list[list[Any]]
+
+_MISSING = object()
+
+
+def get_block_ids(value: Any) -> list[str] | None:
+    """
+    Return the ids of the blocks in `value`, if it is a list of blocks that
+    all have distinct ids, or `None` otherwise.
+    """
+    if not isinstance(value, list):
+        return None
+    ids = []
+    for block in value:
+        if not isinstance(block, dict) or not isinstance(block.get("id"), str):
+            return None
+        ids.append(block["id"])
+    if len(set(ids)) != len(ids):
+        return None
+    return ids
+
+
+def longest_increasing_subsequence(values: list[int]) -> set[int]:
+    """
+    Return the values (which must be distinct) of a longest strictly
+    increasing subsequence of `values`, in O(n log n) time.
+    """
+    tails: list[int] = []
+    tail_indexes: list[int] = []
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        position = bisect_left(tails, value)
+        if position:
+            previous[i] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(value)
+            tail_indexes.append(i)
+        else:
+            tails[position] = value
+            tail_indexes[position] = i
+    result = set()
+    i = tail_indexes[-1] if tail_indexes else -1
+    while i != -1:
+        result.add(values[i])
+        i = previous[i]
+    return result
+
+
+def diff_blocks(block_id: str, old: dict[str, Any], new: dict[str, Any]) -> Diff:
+    diff = []
+    for key in (*old, *(key for key in new if key not in old)):
+        if key == "id":
+            continue
+        old_value = old.get(key, _MISSING)
+        new_value = new.get(key, _MISSING)
+        if new_value is _MISSING:
+            # Keys are rarely removed, so the whole block is replaced
+            return [["remove", block_id]]
+        if old_value == new_value:
+            continue
+        if key == "value":
+            value_diff = diff_raw_data(old_value, new_value)
+            if value_diff[0][0] != "set":
+                diff.append(["patch", block_id, value_diff])
+                continue
+        diff.append(["change", block_id, key, new_value])
+    return diff
+
+
+def diff_raw_data(old: Any, new: Any) -> Diff:
+    """
+    Return a diff that changes the raw StreamField data `old` to `new` when
+    passed to `apply_diff()` with `old`. The diff is empty if they're equal.
+    """
+    if old == new:
+        return []
+    old_ids = get_block_ids(old)
+    new_ids = get_block_ids(new)
+    if old_ids is None or new_ids is None:
+        return [["set", new]]
+
+    old_indexes = {block_id: i for i, block_id in enumerate(old_ids)}
+    new_blocks = dict(zip(new_ids, new))
+    diff: Diff = [
+        ["remove", block_id] for block_id in old_ids if block_id not in new_blocks
+    ]
+    kept = longest_increasing_subsequence(
+        [old_indexes[block_id] for block_id in new_ids if block_id in old_indexes]
+    )
+    changes: Diff = []
+    for index, (block_id, block) in enumerate(zip(new_ids, new)):
+        old_index = old_indexes.get(block_id)
+        if old_index is None:
+            diff.append(["insert", index, block])
+            continue
+        block_diff = diff_blocks(block_id, old[old_index], block)
+        if block_diff and block_diff[0][0] == "remove":
+            # The block has lost a key, so it's replaced
+            diff.extend([*block_diff, ["insert", index, block]])
+            continue
+        if old_index not in kept:
+            diff.append(["move", block_id, index])
+        changes.extend(block_diff)
+    # Removals must come before insertions and moves (see `apply_diff()`)
+    diff.sort(key=lambda operation: operation[0] != "remove")
+    return diff + changes
+
+
+def apply_diff(value: Any, diff: Diff) -> Any:
+    """
+    Return the result of applying `diff` (as returned by `diff_raw_data()`)
+    to the raw StreamField data `value`. `value` isn't changed, though
+    blocks that the diff doesn't change are shared with the result. Raises
+    `KeyError` if the diff refers to blocks that `value` doesn't have.
+    """
+    if not diff:
+        return value
+    if diff[0][0] == "set":
+        return diff[0][1]
+
+    # Take out removed and moved blocks, leaving the blocks that keep their
+    # positions in the right order, then put moved and inserted blocks in
+    # order of their new indexes, so that every block is placed after all
+    # of those that come before it
+    removed = {operation[1] for operation in diff if operation[0] == "remove"}
+    moved = {operation[1] for operation in diff if operation[0] == "move"}
+    taken = {}
+    kept = []
+    found = set()
+    for block in value:
+        if block["id"] in moved:
+            taken[block["id"]] = block
+        elif block["id"] not in removed:
+            kept.append(block)
+        else:
+            found.add(block["id"])
+    missing = removed - found
+    if missing:
+        raise KeyError(f"Blocks {sorted(missing)} don't exist.")
+
+    placements = []
+    changes = []
+    for operation in diff:
+        if operation[0] == "insert":
+            placements.append((operation[1], operation[2]))
+        elif operation[0] == "move":
+            placements.append((operation[2], taken[operation[1]]))
+        elif operation[0] in ("change", "patch"):
+            changes.append(operation)
+    placements.sort(key=lambda placement: placement[0])
+    remaining = iter(kept)
+    result: list[Any] = []
+    for index, block in placements:
+        result.extend(islice(remaining, index - len(result)))
+        result.append(block)
+    result.extend(remaining)
+
+    if changes:
+        positions = {block["id"]: i for i, block in enumerate(result)}
+        for operation in changes:
+            i = positions[operation[1]]
+            block = dict(result[i])
+            if operation[0] == "change":
+                block[operation[2]] = operation[3]
+            else:
+                block["value"] = apply_diff(block.get("value"), operation[2])
+            result[i] = block
+    return result
+
+
+def describe_diff(diff: Diff, prefix: str = "") -> list[str]:
+    """
+    Return a line describing each of the operations in `diff`, for review.
+    """
+    lines = []
+    for operation in diff:
+        action = operation[0]
+        if action == "set":
+            lines.append(f"{prefix}replace the whole value")
+        elif action == "remove":
+            lines.append(f"{prefix}remove block {operation[1]}")
+        elif action == "insert":
+            block = operation[2]
+            lines.append(
+                f"{prefix}insert {block.get('type')} block {block.get('id')} at "
+                f"{operation[1]}"
+            )
+        elif action == "move":
+            lines.append(f"{prefix}move block {operation[1]} to {operation[2]}")
+        elif action == "change":
+            lines.append(f"{prefix}change {operation[2]} of block {operation[1]}")
+        elif action == "patch":
+            lines.append(f"{prefix}change value of block {operation[1]}:")
+            lines.extend(describe_diff(operation[2], prefix + "  "))
+    return lines
@@ -1,15 +1,76 @@
 import json
+import weakref
 
+from typing import Any
+
+from django.conf import settings
+from django.db import models
+from django.db.models.fields.json import KeyTransform
+from django.utils.functional import cached_property
 from wagtail import __version__ as wagtail_version
+from wagtail.blocks import Block, StreamValue
 from wagtail.fields import StreamField as WagtailStreamfield
 
+from mlstreamfield import instrumentation
+from mlstreamfield.codecs import JSONCodec, get_codec
+from mlstreamfield.lookups import HasBlockType
+from mlstreamfield.values import RawStreamValue, decode_raw_json
+
+
+class EncodedJSON(str):
+    """
+    A string of JSON that has already been encoded by the field's codec, and
+    should be written to the database as-is (rather than being encoded again).
+    """
+
+
+class PassthroughJSONEncoder(json.JSONEncoder):
+    """
+    Allows `EncodedJSON` values to be handed to the database backend's
+    `adapt_json_value()` without being encoded a second time.
+    """
+
+    def encode(self, o: Any) -> str:
+        if isinstance(o, EncodedJSON):
+            return str(o)
+        return super().encode(o)
 
-class StreamField(WagtailStreamfield):
-    def __init__(self, *args, **kwargs):
+
+# StreamBlocks shared by fields with the same block types and options, keyed
+# by StreamField.get_shared_block_key(). Blocks are only kept while a field
+# uses them (which also keeps alive the child blocks whose ids are in keys)
+shared_stream_blocks: weakref.WeakValueDictionary[tuple[Any, str], Any] = (
+    weakref.WeakValueDictionary()
+)
+
+
+class StreamField(WagtailStreamfield):  # type: ignore[misc]
+    # Only set for fields rebuilt from deconstruct() output (see clone()),
+    # which is how Django creates the fields of historical models when
+    # rendering migration state
+    migration_mode = False
+
+    def __init__(
+        self,
+        *args: Any,
+        json_codec: str | None = None,
+        compact_json: bool = False,
+        json_ensure_ascii: bool = True,
+        **kwargs: Any,
+    ) -> None:
         """
         Overrides StreamField.__init__() to account for `block_types` no longer
         being received as an arg when migrating (because there is no longer a
         `block_types` value in the migration to provide).
+
+        `json_codec` can be used to override the `MLSTREAMFIELD_JSON_CODEC`
+        setting for this field (see `mlstreamfield.codecs.get_codec()`).
+
+        If `compact_json` is `True`, values are written without whitespace and
+        with sorted keys (including in revisions), and if `json_ensure_ascii`
+        is `False`, non-ASCII characters are written as they are, rather than
+        as escape sequences. Existing values can be rewritten in the same form
+        using the `compact_streamfields` management command.
         """
         if args:
             block_types = args[0] or []
@@ -18,56 +79,242 @@ class StreamField(WagtailStreamfield):
             block_types = kwargs.pop("block_types", [])
         if wagtail_version < "6.0" and "use_json_field" not in kwargs:
             kwargs["use_json_field"] = True
+        self.json_codec = json_codec
+        self.compact_json = compact_json
+        self.json_ensure_ascii = json_ensure_ascii
         super().__init__(block_types, *args, **kwargs)
 
-    def deconstruct(self):
+    @property
+    def codec(self) -> JSONCodec:
+        return get_codec(
+            self.json_codec,
+            compact=self.compact_json,
+            ensure_ascii=self.json_ensure_ascii,
+        )
+
+    @property
+    def encodes_json(self) -> bool:
+        """
+        Whether values need encoding with the field's codec options, rather
+        than being encoded in Wagtail's format by the database backend.
+        """
+        return self.compact_json or not self.json_ensure_ascii
+
+    def get_shared_block_key(self) -> tuple[Any, str] | None:
+        """
+        Return a key identifying the StreamBlock this field would build, if
+        it can be shared with other fields, or `None` if it can't.
+
+        Fields share a StreamBlock when they're given the same StreamBlock
+        class, or lists of the same block instances under the same names, as
+        well as the same options for the block (`min_num`, `max_num`,
+        `block_counts`, `collapsed` and `blank`). Blocks are compared by
+        identity, so this is as cheap as it is safe. Fields given a block
+        instance already share it, and fields built for migrations never have
+        block types to share.
+        """
+        if self.migration_mode or self.block_lookup is not None:
+            return None
+        block_types = self.block_types_arg
+        types_key: Any
+        if isinstance(block_types, type):
+            types_key = block_types
+        elif isinstance(block_types, list | tuple) and all(
+            isinstance(block, Block) for _, block in block_types
+        ):
+            types_key = tuple((name, id(block)) for name, block in block_types)
+        else:
+            return None
+        # Options can include dicts (block_counts), which aren't hashable
+        return types_key, repr(sorted(self.block_opts.items()))
+
+    @cached_property
+    def stream_block(self) -> Any:
+        """
+        Overrides StreamField.stream_block to share one StreamBlock between
+        all fields with the same block types and options (see
+        get_shared_block_key()), so that projects using the same large block
+        sets for many models only build (and cache things on) each one once.
+        Labels and help text belong to fields, rather than their StreamBlock,
+        so they're never shared. Set `MLSTREAMFIELD_SHARE_STREAM_BLOCKS` to
+        `False` to give each field its own StreamBlock.
+
+        Before Wagtail 6.0, __init__() builds and assigns each field's
+        StreamBlock itself, which replaces this property, so blocks are only
+        shared with Wagtail 6.0+.
+        """
+        if not getattr(settings, "MLSTREAMFIELD_SHARE_STREAM_BLOCKS", True):
+            return super().stream_block
+        key = self.get_shared_block_key()
+        if key is None:
+            return super().stream_block
+        stream_block = shared_stream_blocks.get(key)
+        if stream_block is None:
+            stream_block = shared_stream_blocks[key] = super().stream_block
+        return stream_block
+
+    def get_lookup(self, lookup_name: str) -> Any:
+        # Wagtail hands all lookups to an internal JSONField, which would
+        # treat the name as a key transform
+        if lookup_name == HasBlockType.lookup_name:
+            return HasBlockType
+        return super().get_lookup(lookup_name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Any change to the field's attributes could change its deconstruct()
+        # output, so the cached output is discarded
+        self.__dict__.pop("_deconstructed", None)
+        super().__setattr__(name, value)
+
+    def deconstruct(self) -> tuple[str, str, list[Any], dict[str, Any]]:
         """
         Overrides StreamField.deconstruct() to remove `block_types` and
         `verbose_name` values so that migrations remain smaller in size,
         and changes to those attributes do not require a new migration.
+
+        Wagtail's implementation is skipped entirely, because building the
+        block definitions it includes is expensive for large block trees
+        (though before Wagtail 6.0, they're built when the field is created).
+        The result is cached until any of the field's attributes change.
         """
-        name, path, args, kwargs = super().deconstruct()
-        if args:
-            args = args[1:]
-        else:
-            kwargs.pop("block_types", None)
-        kwargs.pop("block_lookup", None)
-        kwargs.pop("verbose_name", None)
-        return name, path, args, kwargs
+        if "_deconstructed" not in self.__dict__:
+            name, path, args, kwargs = models.Field.deconstruct(self)
+            # `use_json_field` (only used before Wagtail 6.0) is left out too,
+            # as __init__() sets it to True whenever it isn't given
+            kwargs.pop("verbose_name", None)
+            if self.json_codec is not None:
+                kwargs["json_codec"] = self.json_codec
+            if self.compact_json:
+                kwargs["compact_json"] = True
+            if not self.json_ensure_ascii:
+                kwargs["json_ensure_ascii"] = False
+            self.__dict__["_deconstructed"] = (name, path, args, kwargs)
+        name, path, args, kwargs = self.__dict__["_deconstructed"]
+        return name, path, list(args), dict(kwargs)
+
+    def clone(self) -> "StreamField":
+        """
+        Overrides Field.clone() to mark the new field as being used for
+        migrations. Because deconstruct() doesn't include `block_types`,
+        the new field can only ever work with raw data.
+        """
+        field: StreamField = super().clone()
+        field.migration_mode = True
+        return field
 
-    def to_python(self, value):
+    def to_python(self, value: Any) -> Any:
         """
         Overrides StreamField.to_python() to make the return value
         (a `StreamValue`) more useful when migrating. When migrating, block
         definitions are unavailable to the field's underlying StreamBlock,
         causing self.stream_block.to_python() to not recognise any of the
         blocks in the stored value.
-        """
-        stream_value = super().to_python(value)
 
-        # There is no way to be absolutely sure this is a migration,
-        # but the combination of factors below is a pretty decent indicator
-        if value and not self.stream_block.child_blocks:
+        `EncodedJSON` values are already in the form they're stored in, and
+        are kept as they are, to be written by get_prep_value().
+        """
+        if isinstance(value, EncodedJSON):
+            return value
+        if value and self.migration_mode:
             if isinstance(value, list):
-                stream_value._raw_data = value
+                stream_value = RawStreamValue(self.stream_block, value)
             elif isinstance(value, str):
-                try:
-                    stream_value._raw_data = json.loads(value)
-                except ValueError:
-                    stream_value.raw_text = value
+                started = instrumentation.start()
+                raw_data, raw_text = decode_raw_json(value, self.codec)
+                instrumentation.record(self, "decode", started, len(value))
+                stream_value = RawStreamValue(
+                    self.stream_block, raw_data, raw_text=raw_text
+                )
+            else:
+                return super().to_python(value)
+            stream_value._stream_field = self
+            return stream_value
 
-        return stream_value
+        return super().to_python(value)
 
-    def get_prep_value(self, value):
+    def from_db_value(self, value: Any, expression: Any, connection: Any) -> Any:
+        """
+        Overrides StreamField.from_db_value() to defer decoding of stored
+        values when migrating until the raw data is actually accessed. Values
+        that are never accessed are written back to the database unchanged.
+        """
+        if (
+            isinstance(value, str)
+            and self.migration_mode
+            and not isinstance(expression, KeyTransform)
+        ):
+            stream_value = RawStreamValue.from_json(
+                self.stream_block, value, self.codec
+            )
+            stream_value._stream_field = self
+            return stream_value
+        return super().from_db_value(value, expression, connection)
+
+    def get_prep_value(self, value: Any) -> Any:
         """
         Overrides StreamField.get_prep_value() to account for when
         block definitions are unavailable during migrations, which causes
         empty values to be written back to the database on save.
         """
-        if not self.stream_block.child_blocks:
+        if isinstance(value, EncodedJSON):
+            return value
+        if self.migration_mode:
+            if isinstance(value, RawStreamValue) and not value.has_changed:
+                # Write the stored value back exactly as it was loaded
+                return EncodedJSON(value.raw_json)
             if value.raw_text:
                 return value.raw_text
             if value._raw_data:
-                return json.dumps(value._raw_data)
+                return EncodedJSON(self.codec.dumps(value._raw_data))
+
+        if (
+            wagtail_version < "6.0"
+            and isinstance(value, StreamValue)
+            and (value or value.raw_text is None)
+        ):
+            # Before Wagtail 6.0, StreamValues are encoded as JSON strings
+            # here, which JSONField would then encode a second time, so the
+            # blocks' data is returned for the database backend to encode, as
+            # Wagtail 6.0+ does
+            value = self.stream_block.get_prep_value(value)
+        else:
+            value = super().get_prep_value(value)
+        if self.encodes_json and isinstance(value, list):
+            return EncodedJSON(
+                json.dumps(
+                    value, cls=self.json_field.encoder, **self.codec.dumps_kwargs
+                )
+            )
+        return value
+
+    def value_to_string(self, obj: Any) -> str:
+        """
+        Overrides StreamField.value_to_string() (which is also used to store
+        values in revisions) so that values already encoded by
+        get_prep_value() (and raw text that isn't JSON) aren't encoded again.
+        """
+        value = self.get_prep_value(self.value_from_object(obj))
+        if isinstance(value, str):
+            return str(value)
+        return json.dumps(value, cls=self.json_field.encoder)
+
+    def get_db_prep_value(
+        self,
+        value: Any,
+        connection: Any,
+        prepared: bool = False,  # noqa: FBT001, FBT002
+    ) -> Any:
+        """
+        Overrides StreamField.get_db_prep_value() so that values already
+        encoded by get_prep_value() are written to the database as JSON
+        documents, rather than being encoded again as JSON strings.
+        """
+        if not prepared:
+            value = self.get_prep_value(value)
+        if isinstance(value, EncodedJSON):
+            return connection.ops.adapt_json_value(value, PassthroughJSONEncoder)
+        return super().get_db_prep_value(value, connection, prepared=True)
+
 
-        return super().get_prep_value(value)
+# Recorded while instrumentation is enabled (see mlstreamfield.instrumentation)
+instrumentation.register(StreamField, "to_python", "from_db_value", "get_prep_value")
@@ -0,0 +1,83 @@
+from typing import Any
+
+from django.db.backends.base.schema import BaseDatabaseSchemaEditor
+from django.db.backends.ddl_references import Statement
+from django.db.models import Index, Model
+
+from mlstreamfield.lookups import BlockTypes
+
+
+class BlockTypeIndex(Index):
+    """
+    A GIN index over the types of the top-level blocks in a StreamField's
+    values (see `mlstreamfield.lookups.BlockTypes`), which PostgreSQL uses
+    for `has_block_type` lookups, e.g.
+
+        class Meta:
+            indexes = [BlockTypeIndex(field="body", name="blogpage_body_types")]
+
+    Only block types are indexed, so the index stays much smaller than a GIN
+    index of entire values, and its definition never changes when blocks do.
+    As with the lookups, values must be stored as JSON documents: values
+    stored as JSON strings holding the document (by earlier versions of this
+    package) are indexed as having no blocks, until they're rewritten as
+    documents by the `compact_streamfields` command, which rewrites just
+    those values on PostgreSQL.
+
+    The index is only created on PostgreSQL. On other databases, creating and
+    removing it does nothing, so the same migrations can be used everywhere.
+    """
+
+    suffix = "gin"
+
+    def __init__(
+        self,
+        *,
+        field: str,
+        name: str,
+        db_tablespace: str | None = None,
+        condition: Any = None,
+    ) -> None:
+        self.field_name = field
+        super().__init__(
+            BlockTypes(field),
+            name=name,
+            db_tablespace=db_tablespace,
+            condition=condition,
+        )
+
+    def deconstruct(self) -> Any:
+        path, _, kwargs = super().deconstruct()
+        return path, (), {"field": self.field_name, **kwargs}
+
+    def skipped_sql(self, schema_editor: BaseDatabaseSchemaEditor) -> Statement:
+        # A comment is a no-op statement, which still shows up in the output
+        # of sqlmigrate
+        return Statement(
+            "-- Index %(name)s is only created on PostgreSQL (using %(vendor)s)",
+            name=self.name,
+            vendor=schema_editor.connection.vendor,
+        )
+
+    def create_sql(
+        self,
+        model: type[Model],
+        schema_editor: BaseDatabaseSchemaEditor,
+        using: str = "",
+        **kwargs: Any,
+    ) -> Statement:
+        if schema_editor.connection.vendor != "postgresql":
+            return self.skipped_sql(schema_editor)
+        return super().create_sql(
+            model, schema_editor, using=f" USING {self.suffix}", **kwargs
+        )
+
+    def remove_sql(
+        self,
+        model: type[Model],
+        schema_editor: BaseDatabaseSchemaEditor,
+        **kwargs: Any,
+    ) -> str:
+        if schema_editor.connection.vendor != "postgresql":
+            return str(self.skipped_sql(schema_editor))
+        return super().remove_sql(model, schema_editor, **kwargs)
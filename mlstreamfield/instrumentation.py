@@ -0,0 +1,193 @@
+"""
+Opt-in counters and timers for the paths that StreamField values take
+through `mlstreamfield`, so that the time a slow data migration spends
+converting values can be broken down by model, field and operation:
+
+- `from_db_value`, `to_python` and `get_prep_value`: calls of the field's
+  methods, and the number of bytes of JSON returned by `get_prep_value()`
+  (only counted for values the field encodes itself, i.e. in migrations or
+  with `compact_json` or `json_ensure_ascii` options, as others are encoded
+  by the database backend)
+- `decode`: decoding of stored JSON, and the number of bytes decoded
+- `transform`: transforms applied by `mlstreamfield.bulk` in this process
+
+Recording is enabled by the `MLSTREAMFIELD_INSTRUMENTATION` setting (in which
+case a summary is printed at the end of `migrate`, including the runs that
+create test databases), or with `recording()`:
+
+    with recording() as recorder:
+        call_command("migrate", "blog")
+    print("\\n".join(recorder.summary()))
+
+The field's methods are only wrapped while recording is enabled, so when it
+is disabled, they cost nothing extra, and the cost to other operations is a
+single check of the module's `recorder` attribute. Sizes are lengths of JSON
+strings, which are the same as their sizes in bytes unless
+`json_ensure_ascii=False` is used. Times include those of any operations within them (e.g. `to_python`
+includes `decode` for values that aren't decoded lazily).
+"""
+
+import sys
+import time
+
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any
+
+
+OPERATIONS = ("from_db_value", "to_python", "decode", "transform", "get_prep_value")
+
+
+@dataclass
+class OperationStats:
+    calls: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.stats: defaultdict[tuple[str, str], OperationStats] = defaultdict(
+            OperationStats
+        )
+
+    def add(self, label: str, operation: str, seconds: float, size: int = 0) -> None:
+        stats = self.stats[label, operation]
+        stats.calls += 1
+        stats.bytes += size
+        stats.seconds += seconds
+
+    def reset(self) -> None:
+        self.stats.clear()
+
+    def summary(self) -> list[str]:
+        """
+        Return the lines of a table of the recorded stats, by field and
+        operation.
+        """
+        if not self.stats:
+            return ["No StreamField operations recorded."]
+        keys = sorted(self.stats, key=lambda k: (k[0], OPERATIONS.index(k[1])))
+        width = max(len("field"), *(len(label) for label, _ in keys))
+        lines = [
+            f"{'field':<{width}} {'operation':<14} {'calls':>9} {'bytes':>12} "
+            f"{'ms':>10}"
+        ]
+        for label, operation in keys:
+            stats = self.stats[label, operation]
+            lines.append(
+                f"{label:<{width}} {operation:<14} {stats.calls:>9} "
+                f"{stats.bytes:>12} {stats.seconds * 1000:>10.1f}"
+            )
+        return lines
+
+
+# The active recorder, or None when recording is disabled
+recorder: Recorder | None = None
+
+# (class, attribute name, operation, unwrapped method) for each method
+# registered with `register()`
+instrumented_methods: list[tuple[type, str, str, Callable[..., Any]]] = []
+
+
+def install_wrappers(*, installed: bool) -> None:
+    for owner, name, operation, method in instrumented_methods:
+        setattr(owner, name, wrap(operation, method) if installed else method)
+
+
+def enable() -> Recorder:
+    global recorder
+    if recorder is None:
+        recorder = Recorder()
+        install_wrappers(installed=True)
+    return recorder
+
+
+def disable() -> None:
+    global recorder
+    recorder = None
+    install_wrappers(installed=False)
+
+
+@contextmanager
+def recording() -> Iterator[Recorder]:
+    """
+    Record operations within the block, using a new recorder (even if
+    recording was already enabled), and restore the previous one afterwards.
+    """
+    global recorder
+    previous = recorder
+    recorder = Recorder()
+    install_wrappers(installed=True)
+    try:
+        yield recorder
+    finally:
+        recorder = previous
+        install_wrappers(installed=previous is not None)
+
+
+def get_label(field: Any) -> str:
+    if field is None:
+        return "(unknown)"
+    model = getattr(field, "model", None)
+    if model is None:
+        return field.name or type(field).__name__
+    return f"{model._meta.label}.{field.name}"
+
+
+def start() -> float | None:
+    """
+    Return the time to pass to `record()` when an operation finishes, or
+    `None` if recording is disabled.
+    """
+    return None if recorder is None else time.perf_counter()
+
+
+def record(field: Any, operation: str, started: float | None, size: int = 0) -> None:
+    if started is not None and recorder is not None:
+        recorder.add(get_label(field), operation, time.perf_counter() - started, size)
+
+
+def wrap(operation: str, method: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(method)
+    def wrapper(field: Any, *args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        result = method(field, *args, **kwargs)
+        record(field, operation, started, len(result) if isinstance(result, str) else 0)
+        return result
+
+    return wrapper
+
+
+def register(owner: type, *names: str) -> None:
+    """
+    Record calls of the methods of `owner` with `names` (which must be
+    operations), along with the size of any string they return. The methods
+    are only replaced by wrappers that record their calls while recording is
+    enabled.
+    """
+    for name in names:
+        method = owner.__dict__[name]
+        instrumented_methods.append((owner, name, name, method))
+        if recorder is not None:
+            setattr(owner, name, wrap(name, method))
+
+
+def print_summary(
+    sender: Any, plan: Any = None, stdout: Any = None, **kwargs: Any
+) -> None:
+    """
+    A `post_migrate` receiver that prints (and resets) the recorded stats.
+    The signal is also sent by `flush`, without a migration `plan`, in which
+    case nothing is printed.
+    """
+    if plan is None or recorder is None or not recorder.stats:
+        return
+    stdout = stdout or sys.stdout
+    stdout.write("StreamField instrumentation:\n")
+    for line in recorder.summary():
+        stdout.write(f"  {line}\n")
+    recorder.reset()
@@ -0,0 +1,167 @@
+"""
+Lookups and expressions for querying the block types in stored StreamField
+values, compiled to the database's own JSON functions so that values never
+have to be loaded into Python.
+
+Only top-level stream children are considered, and only PostgreSQL and
+SQLite are supported. Values must be stored as JSON documents: values that
+earlier versions of this package stored as JSON strings holding the
+document (which are still read correctly) have no blocks, until they're
+rewritten as documents by the `compact_streamfields` command, which does so
+on every database (including PostgreSQL, where it leaves other values as
+they are).
+"""
+
+from typing import Any
+
+from django.db import NotSupportedError
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models import Func, IntegerField, JSONField, Lookup
+from django.db.models.sql.compiler import SQLCompiler
+
+
+SQL = tuple[str, list[Any]]
+
+
+def not_supported(vendor: str) -> NotSupportedError:
+    return NotSupportedError(
+        f"Querying StreamField block types is not supported for {vendor!r} "
+        "databases."
+    )
+
+
+class BlockTypes(Func):
+    """
+    A JSON array of the types of the top-level blocks in a StreamField value,
+    e.g. `["heading", "paragraph", "heading"]` (PostgreSQL only). This is the
+    expression indexed by `mlstreamfield.indexes.BlockTypeIndex`.
+    """
+
+    function = "jsonb_path_query_array"
+    template = "%(function)s(%(expressions)s, '$[*].type')"
+    output_field = JSONField()
+
+    def as_sql(
+        self,
+        compiler: SQLCompiler,
+        connection: BaseDatabaseWrapper,
+        function: str | None = None,
+        template: str | None = None,
+        arg_joiner: str | None = None,
+        **extra_context: Any,
+    ) -> SQL:
+        raise not_supported(connection.vendor)
+
+    def as_postgresql(
+        self,
+        compiler: SQLCompiler,
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> SQL:
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+class HasBlockType(Lookup):  # type: ignore[type-arg]
+    """
+    Matches values containing at least one top-level block of the given
+    type, e.g. `BlogPage.objects.filter(body__has_block_type="video")`.
+
+    On PostgreSQL, this checks whether the value's `BlockTypes` contain the
+    type, which can use a `mlstreamfield.indexes.BlockTypeIndex`.
+    """
+
+    lookup_name = "has_block_type"
+    prepare_rhs = False
+
+    def get_prep_lookup(self) -> Any:
+        if not hasattr(self.rhs, "resolve_expression") and not isinstance(
+            self.rhs, str
+        ):
+            raise ValueError(
+                "The QuerySet value for a has_block_type lookup must be a "
+                f"block name (got {self.rhs!r})."
+            )
+        return super().get_prep_lookup()
+
+    def as_sql(self, compiler: SQLCompiler, connection: BaseDatabaseWrapper) -> SQL:
+        raise not_supported(connection.vendor)
+
+    def as_sqlite(self, compiler: SQLCompiler, connection: BaseDatabaseWrapper) -> SQL:
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        sql = (
+            f"EXISTS (SELECT 1 FROM json_each({lhs}) AS block "  # noqa: S608
+            "WHERE block.type = 'object' "
+            f"AND json_extract(block.value, '$.type') = {rhs})"
+        )
+        return sql, [*lhs_params, *rhs_params]
+
+    def as_postgresql(
+        self, compiler: SQLCompiler, connection: BaseDatabaseWrapper
+    ) -> SQL:
+        lhs, lhs_params = compiler.compile(BlockTypes(self.lhs))
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        sql = f"{lhs} @> jsonb_build_array(({rhs})::text)"
+        return sql, [*lhs_params, *rhs_params]
+
+
+class BlockCount(Func):
+    """
+    The number of top-level blocks in a StreamField value, or only those of
+    type `block_type` if given, e.g.
+    `BlogPage.objects.annotate(videos=BlockCount("body", "video"))`.
+    Values that aren't JSON arrays have no blocks.
+    """
+
+    output_field = IntegerField()
+
+    def __init__(
+        self, expression: Any, block_type: str | None = None, **extra: Any
+    ) -> None:
+        self.block_type = block_type
+        super().__init__(expression, **extra)
+
+    def as_sql(
+        self,
+        compiler: SQLCompiler,
+        connection: BaseDatabaseWrapper,
+        function: str | None = None,
+        template: str | None = None,
+        arg_joiner: str | None = None,
+        **extra_context: Any,
+    ) -> SQL:
+        raise not_supported(connection.vendor)
+
+    def as_sqlite(
+        self,
+        compiler: SQLCompiler,
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> SQL:
+        value, params = compiler.compile(self.source_expressions[0])
+        sql = (
+            f"(SELECT count(*) FROM json_each({value}) AS block "  # noqa: S608
+            "WHERE block.type = 'object'"
+        )
+        if self.block_type is not None:
+            sql += " AND json_extract(block.value, '$.type') = %s"
+            params = [*params, self.block_type]
+        return f"{sql})", params
+
+    def as_postgresql(
+        self,
+        compiler: SQLCompiler,
+        connection: BaseDatabaseWrapper,
+        **extra_context: Any,
+    ) -> SQL:
+        value, params = compiler.compile(self.source_expressions[0])
+        sql = (
+            "(SELECT count(*) FROM jsonb_array_elements("  # noqa: S608
+            f"CASE jsonb_typeof({value}) WHEN 'array' THEN {value} END"
+            ") AS block(item) WHERE jsonb_typeof(block.item) = 'object'"
+        )
+        params = [*params, *params]
+        if self.block_type is not None:
+            sql += " AND block.item ->> 'type' = %s"
+            params = [*params, self.block_type]
+        return f"{sql})", params
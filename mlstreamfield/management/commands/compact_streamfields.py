@@ -0,0 +1,174 @@
+from collections.abc import Iterable
+from typing import Any
+
+from django.apps import AppConfig, apps
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Model
+from wagtail.models import RevisionMixin
+
+from mlstreamfield.bulk import RewriteResult, rewrite_raw_json
+from mlstreamfield.fields import StreamField
+
+
+def stores_json_as_text(connection: BaseDatabaseWrapper) -> bool:
+    """
+    Return `True` if JSON columns store values as they are written. The JSON
+    types of PostgreSQL and MySQL store a binary format instead, which never
+    includes whitespace.
+    """
+    if connection.vendor == "postgresql":
+        return False
+    if connection.vendor == "mysql":
+        return bool(connection.mysql_is_mariadb)  # type: ignore[attr-defined]
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites the stored values of mlstreamfield StreamFields in the form "
+        "their fields now write them (e.g. after enabling compact_json, or to "
+        "rewrite values stored as JSON strings as documents), in batches, and "
+        "reports the number of bytes saved."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            help="Only rewrite fields of these apps (by default, all apps).",
+        )
+        parser.add_argument(
+            "--field",
+            action="append",
+            dest="fields",
+            metavar="APP_LABEL.MODEL.FIELD",
+            help=(
+                "Only rewrite this field (can be used more than once). By "
+                "default, all fields with compact_json or json_ensure_ascii "
+                "options are rewritten."
+            ),
+        )
+        parser.add_argument(
+            "--revisions",
+            action="store_true",
+            help="Also rewrite the fields' values in Wagtail revisions.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows fetched and written per query (default: 500).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the bytes that would be saved, without writing anything.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Nominates a database to rewrite values in.",
+        )
+
+    def get_fields(
+        self, app_labels: list[str], field_labels: list[str] | None
+    ) -> list[tuple[type[Model], StreamField]]:
+        app_configs: Iterable[AppConfig]
+        if app_labels:
+            try:
+                app_configs = [apps.get_app_config(label) for label in app_labels]
+            except LookupError as err:
+                raise CommandError(str(err)) from err
+        else:
+            app_configs = apps.get_app_configs()
+        selected = {label.lower() for label in field_labels or []}
+        missing = set(selected)
+        result = []
+        for app_config in app_configs:
+            for model in app_config.get_models():
+                if model._meta.proxy or not model._meta.managed:
+                    continue
+                for field in model._meta.local_fields:
+                    label = f"{model._meta.label_lower}.{field.name}"
+                    if not isinstance(field, StreamField):
+                        continue
+                    if label in selected or (not selected and field.encodes_json):
+                        missing.discard(label)
+                        result.append((model, field))
+        if missing:
+            raise CommandError(
+                f"Unknown mlstreamfield StreamField(s): {', '.join(sorted(missing))}"
+            )
+        return result
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        fields = self.get_fields(options["app_labels"], options["fields"])
+        if not fields:
+            self.stdout.write(
+                "No StreamFields with compact_json or json_ensure_ascii options "
+                "found."
+            )
+            return
+
+        connection = connections[options["database"]]
+        # Values are read and written by historical models, whose fields only
+        # ever deal with raw data
+        state_apps = MigrationLoader(connection).project_state().apps
+        # Values can still be stored as JSON strings holding the document
+        # (see rewrite_raw_json()), which are rewritten as documents
+        strings_only = not stores_json_as_text(connection)
+        if strings_only:
+            self.stdout.write(
+                f"Values of JSON columns aren't stored as text on {connection.vendor}, "
+                "so only values stored as JSON strings (by earlier versions of "
+                "mlstreamfield) and values in revisions are rewritten."
+            )
+
+        total = RewriteResult(0, 0, 0, 0)
+        for model, field in fields:
+            opts = model._meta
+            try:
+                historical_model = state_apps.get_model(opts.app_label, model.__name__)
+            except LookupError as err:
+                raise CommandError(
+                    f"{opts.label} has no migrations. Run makemigrations first."
+                ) from err
+            queryset = historical_model._base_manager.using(options["database"])
+            targets = [False]
+            if options["revisions"] and issubclass(model, RevisionMixin):
+                targets.append(True)
+            for revisions in targets:
+                result = rewrite_raw_json(
+                    queryset,
+                    field.name,
+                    # The field's current options may not be in a migration yet
+                    codec=field.codec,
+                    revisions=revisions,
+                    batch_size=options["batch_size"],
+                    dry_run=options["dry_run"],
+                    strings_only=strings_only and not revisions,
+                )
+                label = f"{opts.label}.{field.name}"
+                if revisions:
+                    label += " (revisions)"
+                self.write_result(label, result, dry_run=options["dry_run"])
+                total = RewriteResult(*(a + b for a, b in zip(total, result)))
+
+        if len(fields) > 1 or options["revisions"]:
+            self.write_result("Total", total, dry_run=options["dry_run"])
+
+    def write_result(self, label: str, result: RewriteResult, *, dry_run: bool) -> None:
+        saving = (
+            f"{result.bytes_saved / result.bytes_before:.1%}"
+            if result.bytes_before
+            else "0.0%"
+        )
+        self.stdout.write(
+            f"{label}: {result.rewritten} of {result.processed} value(s) "
+            f"{'would be ' if dry_run else ''}rewritten, {result.bytes_before} "
+            f"bytes before, {result.bytes_after} after "
+            f"({result.bytes_saved} saved, {saving})"
+        )
@@ -0,0 +1,111 @@
+from typing import Any
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.exceptions import AmbiguityError
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import ProjectState
+
+from mlstreamfield.bulk import preview_transform
+from mlstreamfield.operations import RawStreamFieldOperation
+from mlstreamfield.transforms import RawDataTransformer
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies the RawStreamFieldOperation operations of a migration to "
+        "existing data without writing anything, and reports how many values "
+        "would change, how large they are, and how long it took. Operations "
+        "are previewed against the data as it is now, so the changes made by "
+        "any earlier operations in the migration are not taken into account."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("app_label", help="App label of the migration.")
+        parser.add_argument(
+            "migration_name", help="Migration to preview (a unique prefix will do)."
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            help="Only process this many randomly chosen rows for each operation.",
+        )
+        parser.add_argument(
+            "--examples",
+            type=int,
+            default=3,
+            help="The number of diffs of changed values to show (default: 3).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Rows fetched per query (default: each operation's batch_size).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Nominates a database to preview the migration against.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        app_label = options["app_label"]
+        try:
+            apps.get_app_config(app_label)
+        except LookupError as err:
+            raise CommandError(str(err)) from err
+        loader = MigrationLoader(connections[options["database"]])
+        try:
+            migration = loader.get_migration_by_prefix(
+                app_label, options["migration_name"]
+            )
+        except AmbiguityError as err:
+            raise CommandError(
+                f"More than one migration matches '{options['migration_name']}' "
+                f"in app '{app_label}'. Please be more specific."
+            ) from err
+        except KeyError as err:
+            raise CommandError(
+                f"Cannot find a migration matching '{options['migration_name']}' "
+                f"from app '{app_label}'."
+            ) from err
+
+        # Preview each operation against the state it would run in
+        state = loader.project_state((app_label, migration.name), at_end=False)
+        previewed = 0
+        for operation in migration.operations:
+            if isinstance(operation, RawStreamFieldOperation):
+                self.preview(operation, app_label, state, options)
+                previewed += 1
+            operation.state_forwards(app_label, state)
+        if not previewed:
+            self.stdout.write(
+                f"{migration.app_label}.{migration.name} has no "
+                "RawStreamFieldOperation operations to preview."
+            )
+
+    def preview(
+        self,
+        operation: RawStreamFieldOperation,
+        app_label: str,
+        state: ProjectState,
+        options: dict[str, Any],
+    ) -> None:
+        model = state.apps.get_model(app_label, operation.model_name)
+        self.stdout.write(self.style.MIGRATE_HEADING(operation.describe()))
+        preview = preview_transform(
+            model._base_manager.using(options["database"]),
+            operation.field_name,
+            RawDataTransformer(operation.rules),
+            sample=options["sample"],
+            batch_size=options["batch_size"] or operation.batch_size,
+            examples=options["examples"],
+        )
+        for line in preview.summary():
+            self.stdout.write(f"  {line}")
+        if operation.revisions is not None:
+            self.stdout.write(
+                f"  Values in revisions ({operation.revisions}) are not included."
+            )
+        for _, diff in preview.examples:
+            self.stdout.write(diff)
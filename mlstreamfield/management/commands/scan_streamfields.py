@@ -0,0 +1,243 @@
+import os
+
+from collections.abc import Iterable
+from typing import Any, NamedTuple
+
+from django.apps import AppConfig, apps
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DEFAULT_DB_ALIAS, connections, migrations
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.db.models import Field, Model
+
+from mlstreamfield.utils import is_native_streamfield, time_to_compile, to_mlstreamfield
+
+
+class FieldReport(NamedTuple):
+    model: type[Model]
+    field: "Field[Any, Any]"
+    definition_bytes: int
+    mlstreamfield_bytes: int
+    migrations: int
+    historic_bytes: int
+    historic_compile_ms: float
+
+    @property
+    def label(self) -> str:
+        return f"{self.model._meta.label}.{self.field.name}"
+
+
+def serialize(field: "Field[Any, Any]") -> str:
+    """
+    Return the source of a module that creates `field`, as it would appear
+    in a migration.
+    """
+    value, imports = MigrationWriter.serialize(field)
+    return "\n".join([*sorted(imports), f"field = {value}"])
+
+
+def get_field_mentions(
+    loader: MigrationLoader, app_label: str, model_name: str, field_name: str
+) -> list["Field[Any, Any]"]:
+    """
+    Return the native StreamFields for a model field found in the operations
+    of every migration on disk.
+    """
+    result: list[Field[Any, Any]] = []
+    for (migration_app_label, _), migration in sorted(loader.disk_migrations.items()):
+        if migration_app_label != app_label:
+            continue
+        for operation in migration.operations:
+            if (
+                isinstance(operation, migrations.CreateModel)
+                and operation.name_lower == model_name
+            ):
+                fields = [f for name, f in operation.fields if name == field_name]
+            elif (
+                isinstance(operation, migrations.AddField | migrations.AlterField)
+                and operation.model_name_lower == model_name
+                and operation.name == field_name
+            ):
+                fields = [operation.field]
+            else:
+                continue
+            result.extend(f for f in fields if is_native_streamfield(f))
+    return result
+
+
+def scan_field(
+    loader: MigrationLoader, model: type[Model], field: "Field[Any, Any]"
+) -> FieldReport:
+    opts = model._meta
+    source = serialize(field)
+    mentions = get_field_mentions(
+        loader, opts.app_label, model.__name__.lower(), field.name
+    )
+    sources = [serialize(mention) for mention in mentions]
+    return FieldReport(
+        model=model,
+        field=field,
+        definition_bytes=len(source.encode()),
+        mlstreamfield_bytes=len(serialize(to_mlstreamfield(field)).encode()),
+        migrations=len(mentions),
+        historic_bytes=sum(len(s.encode()) for s in sources),
+        historic_compile_ms=time_to_compile(sources) if sources else 0.0,
+    )
+
+
+def build_swap_migration(
+    loader: MigrationLoader,
+    app_label: str,
+    fields: list[tuple[str, "Field[Any, Any]"]],
+    name: str,
+) -> migrations.Migration:
+    """
+    Return a migration that swaps each of `fields` (`(model_name, field)`
+    tuples) for an `mlstreamfield` StreamField, named like the next migration
+    for `app_label` would be.
+    """
+    leaf_nodes = loader.graph.leaf_nodes(app_label)
+    if len(leaf_nodes) > 1:
+        raise CommandError(
+            f"Conflicting migrations detected in app '{app_label}'. Run "
+            "'manage.py makemigrations --merge' first."
+        )
+    number = 1
+    if leaf_nodes:
+        number = (MigrationAutodetector.parse_number(leaf_nodes[0][1]) or 0) + 1
+    migration = migrations.Migration(f"{number:04d}_{name}", app_label)
+    migration.dependencies = leaf_nodes
+    migration.operations = [
+        migrations.AlterField(model_name, field.name, to_mlstreamfield(field))
+        for model_name, field in fields
+    ]
+    return migration
+
+
+class Command(BaseCommand):
+    help = (
+        "Finds native Wagtail StreamFields on installed models, ranked by how "
+        "much migration code switching them to mlstreamfield's StreamField "
+        "would save, and optionally writes migrations that switch them."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            help="Only scan these apps (by default, all installed apps are scanned).",
+        )
+        parser.add_argument(
+            "--field",
+            action="append",
+            dest="fields",
+            metavar="APP_LABEL.MODEL.FIELD",
+            help="Only include this field (can be used more than once).",
+        )
+        parser.add_argument(
+            "--write-migrations",
+            action="store_true",
+            help=(
+                "Write a migration for each app, switching the selected fields "
+                "to mlstreamfield's StreamField. The fields must also be "
+                "changed in your models."
+            ),
+        )
+        parser.add_argument(
+            "--name",
+            default="swap_native_streamfield_for_mlstreamfield",
+            help="The name to give new migrations (after the number).",
+        )
+
+    def get_fields(
+        self, app_labels: list[str], field_labels: list[str] | None
+    ) -> list[tuple[type[Model], "Field[Any, Any]"]]:
+        app_configs: Iterable[AppConfig]
+        if app_labels:
+            try:
+                app_configs = [apps.get_app_config(label) for label in app_labels]
+            except LookupError as err:
+                raise CommandError(str(err)) from err
+        else:
+            app_configs = apps.get_app_configs()
+        selected = {label.lower() for label in field_labels or []}
+        result = []
+        for app_config in app_configs:
+            for model in app_config.get_models():
+                for field in model._meta.local_fields:
+                    label = f"{model._meta.label_lower}.{field.name}"
+                    if is_native_streamfield(field) and (
+                        not selected or label in selected
+                    ):
+                        result.append((model, field))
+        return result
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self.verbosity = options["verbosity"]
+        fields = self.get_fields(options["app_labels"], options["fields"])
+        if not fields:
+            self.stdout.write("No native StreamFields found.")
+            return
+
+        loader = MigrationLoader(connections[DEFAULT_DB_ALIAS])
+        reports = sorted(
+            (scan_field(loader, model, field) for model, field in fields),
+            key=lambda report: (report.historic_bytes, report.definition_bytes),
+            reverse=True,
+        )
+        self.write_table(reports)
+
+        if options["write_migrations"]:
+            by_app: dict[str, list[tuple[str, Field[Any, Any]]]] = {}
+            for report in reports:
+                by_app.setdefault(report.model._meta.app_label, []).append(
+                    (report.model.__name__.lower(), report.field)
+                )
+            for app_label, app_fields in by_app.items():
+                self.write_migration(loader, app_label, app_fields, options["name"])
+
+    def write_table(self, reports: list[FieldReport]) -> None:
+        label_width = max(len("field"), *(len(r.label) for r in reports))
+        self.stdout.write(
+            f"{'field':<{label_width}} {'bytes':>8} {'saving':>8} "
+            f"{'migrations':>10} {'history':>9} {'compile ms':>10}"
+        )
+        for r in reports:
+            self.stdout.write(
+                f"{r.label:<{label_width}} {r.definition_bytes:>8} "
+                f"{r.definition_bytes - r.mlstreamfield_bytes:>8} "
+                f"{r.migrations:>10} {r.historic_bytes:>9} "
+                f"{r.historic_compile_ms:>10.2f}"
+            )
+        if self.verbosity > 0:
+            self.stdout.write(
+                "\n'bytes' is the size of each field's definition in a migration, "
+                "and 'saving' is how much smaller it would be using mlstreamfield. "
+                "'history' and 'compile ms' are the size and compile time of the "
+                "existing definitions in 'migrations' migrations, which can be "
+                "removed using the squash_streamfield_migrations command after "
+                "switching."
+            )
+
+    def write_migration(
+        self,
+        loader: MigrationLoader,
+        app_label: str,
+        fields: list[tuple[str, "Field[Any, Any]"]],
+        name: str,
+    ) -> None:
+        migration = build_swap_migration(loader, app_label, fields, name)
+        writer = MigrationWriter(migration)
+        if os.path.exists(writer.path):
+            raise CommandError(f"Migration {writer.path} already exists.")
+        with open(writer.path, "w", encoding="utf-8") as f:
+            f.write(writer.as_string())
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(f"Created {writer.path}")
+            + "\n  Remember to switch these fields to mlstreamfield's StreamField "
+            "in your models:\n"
+            + "\n".join(
+                f"  - {model_name}.{field.name}" for model_name, field in fields
+            )
+        )
@@ -0,0 +1,311 @@
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from functools import partial
+from typing import Any
+
+from django.apps import apps
+from django.core.management.base import CommandError, CommandParser
+from django.core.management.commands import squashmigrations
+from django.db import migrations
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.migration import Migration
+from django.db.migrations.optimizer import MigrationOptimizer
+from django.db.migrations.state import ProjectState
+from django.db.migrations.writer import MigrationWriter
+from django.db.models import Field
+
+from mlstreamfield.fields import StreamField
+from mlstreamfield.utils import is_native_streamfield, time_to_compile, to_mlstreamfield
+
+
+FieldKey = tuple[str, str]
+
+
+class StreamFieldHistoryRewriter:
+    """
+    Rewrites the operations of a sequence of migrations, replacing native
+    StreamFields with `mlstreamfield` StreamFields for the fields in
+    `field_keys` (`(model_name, field_name)` tuples, with lowercase model
+    names), and removing any `AlterField` operations for those fields that no
+    longer change anything as a result.
+    """
+
+    def __init__(
+        self, app_label: str, field_keys: Iterable[FieldKey], state: ProjectState
+    ) -> None:
+        self.app_label = app_label
+        self.field_keys = set(field_keys)
+        self.rewritten = 0
+        self.removed = 0
+        # The deconstructed form of each field, as of the last operation seen
+        self.current: dict[FieldKey, Any] = {}
+        for (model_app_label, model_name), model_state in state.models.items():
+            if model_app_label == app_label:
+                for name, field in model_state.fields.items():
+                    self.rewrite_field(model_name, name, field, count=False)
+
+    def rewrite_field(
+        self,
+        model_name: str,
+        name: str,
+        field: "Field[Any, Any]",
+        *,
+        count: bool = True,
+    ) -> "Field[Any, Any]":
+        key = (model_name.lower(), name)
+        if key in self.field_keys and is_native_streamfield(field):
+            field = to_mlstreamfield(field)
+            self.rewritten += count
+        self.current[key] = field.deconstruct()[1:]
+        return field
+
+    def rewrite(self, operations: Iterable[Any]) -> list[Any]:
+        result = []
+        for operation in operations:
+            if isinstance(operation, migrations.CreateModel):
+                fields = [
+                    (name, self.rewrite_field(operation.name, name, field))
+                    for name, field in operation.fields
+                ]
+                if fields != operation.fields:
+                    _, args, kwargs = operation.deconstruct()
+                    kwargs["fields"] = fields
+                    operation = migrations.CreateModel(*args, **kwargs)
+            elif isinstance(operation, migrations.AlterField):
+                key = (operation.model_name_lower, operation.name)
+                previous = self.current.get(key)
+                field = self.rewrite_field(
+                    operation.model_name, operation.name, operation.field
+                )
+                if key in self.field_keys and previous == self.current[key]:
+                    self.removed += 1
+                    continue
+                if field is not operation.field:
+                    operation = migrations.AlterField(
+                        operation.model_name,
+                        operation.name,
+                        field,
+                        operation.preserve_default,
+                    )
+            elif isinstance(operation, migrations.AddField):
+                field = self.rewrite_field(
+                    operation.model_name, operation.name, operation.field
+                )
+                if field is not operation.field:
+                    operation = migrations.AddField(
+                        operation.model_name,
+                        operation.name,
+                        field,
+                        operation.preserve_default,
+                    )
+            elif isinstance(operation, migrations.RenameField):
+                key = (operation.model_name_lower, operation.old_name)
+                if key in self.current:
+                    new_key = (operation.model_name_lower, operation.new_name)
+                    self.current[new_key] = self.current.pop(key)
+            elif isinstance(operation, migrations.RenameModel):
+                for model_name, name in list(self.current):
+                    if model_name == operation.old_name_lower:
+                        self.current[operation.new_name_lower, name] = self.current.pop(
+                            (model_name, name)
+                        )
+            result.append(operation)
+        return result
+
+
+def get_source(migration: Migration) -> str:
+    with open(MigrationWriter(migration).path, encoding="utf-8") as f:
+        return f.read()
+
+
+@contextmanager
+def replacing_squashmigrations_names(**names: Any) -> Iterator[None]:
+    """
+    Replace module-level names used by Django's `squashmigrations` command
+    (which has no hooks for its optimizer and writer) for the duration of the
+    block.
+    """
+    originals = {name: getattr(squashmigrations, name) for name in names}
+    for name, value in names.items():
+        setattr(squashmigrations, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(squashmigrations, name, value)
+
+
+class StreamFieldOptimizer(MigrationOptimizer):
+    """
+    Rewrites StreamField definitions before optimizing, so that `AlterField`
+    operations that only changed block definitions are removed before the
+    optimizer merges them into others.
+    """
+
+    def __init__(self, command: "Command") -> None:
+        super().__init__()
+        self.command = command
+
+    def optimize(
+        self, operations: list[Any], app_label: str | None = None
+    ) -> list[Any]:
+        return super().optimize(self.command.rewrite(operations), app_label)
+
+
+class StreamFieldMigrationWriter(MigrationWriter):
+    """
+    Rewrites StreamField definitions (if `--no-optimize` meant the optimizer
+    didn't), and reports the changes before the new migration is written.
+    """
+
+    def __init__(self, command: "Command", migration: Migration, *args: Any) -> None:
+        super().__init__(migration, *args)
+        command.prepare_writer(self)
+
+
+class DryRun(Exception):
+    pass
+
+
+class Command(squashmigrations.Command):
+    help = (
+        "Squashes an existing set of migrations (from first until specified) into "
+        "a single new one, replacing native StreamFields with mlstreamfield "
+        "StreamFields (for fields that now use mlstreamfield), and removing "
+        "AlterField operations that only changed block definitions."
+    )
+
+    found_migrations: list[Migration]
+    rewriter: StreamFieldHistoryRewriter | None
+    writer: MigrationWriter | None
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--field",
+            action="append",
+            dest="fields",
+            metavar="MODEL.FIELD",
+            help=(
+                "Only rewrite this field (can be used more than once). By "
+                "default, all fields that currently use mlstreamfield's "
+                "StreamField are rewritten."
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change, without writing the new migration.",
+        )
+
+    def get_field_keys(
+        self, app_label: str, field_names: list[str] | None
+    ) -> set[FieldKey]:
+        field_keys = set()
+        for model in apps.get_app_config(app_label).get_models():
+            for field in model._meta.local_fields:
+                if isinstance(field, StreamField):
+                    field_keys.add((model.__name__.lower(), field.name))
+        if not field_names:
+            return field_keys
+        selected = set()
+        for field_name in field_names:
+            model_name, _, name = field_name.lower().partition(".")
+            if (model_name, name) not in field_keys:
+                raise CommandError(
+                    f"'{field_name}' is not an mlstreamfield StreamField in "
+                    f"app '{app_label}'."
+                )
+            selected.add((model_name, name))
+        return selected
+
+    def find_migration(
+        self, loader: MigrationLoader, app_label: str, name: str
+    ) -> Migration:
+        # Called for the last migration to squash, then the first (if given)
+        migration: Migration = super().find_migration(loader, app_label, name)
+        self.loader = loader
+        self.found_migrations.append(migration)
+        return migration
+
+    def get_start_state(self) -> ProjectState:
+        last, *first = self.found_migrations
+        if first:
+            start = (self.app_label, first[0].name)
+        else:
+            start = next(
+                key
+                for key in self.loader.graph.forwards_plan((self.app_label, last.name))
+                if key[0] == self.app_label
+            )
+        return self.loader.project_state(start, at_end=False)
+
+    def rewrite(self, operations: Iterable[Any]) -> list[Any]:
+        rewriter = StreamFieldHistoryRewriter(
+            self.app_label, self.field_keys, self.get_start_state()
+        )
+        self.rewriter = rewriter
+        return rewriter.rewrite(operations)
+
+    def prepare_writer(self, writer: MigrationWriter) -> None:
+        self.writer = writer
+        if self.rewriter is None:
+            writer.migration.operations = self.rewrite(writer.migration.operations)
+        if self.verbosity > 0 and self.rewriter is not None:
+            self.write_report(writer, self.rewriter)
+        if self.dry_run:
+            raise DryRun
+
+    def write_report(
+        self, writer: MigrationWriter, rewriter: StreamFieldHistoryRewriter
+    ) -> None:
+        new_source = writer.as_string()
+        old_sources = [
+            get_source(self.loader.get_migration(app_label, name))
+            for app_label, name in writer.migration.replaces
+        ]
+        old_size = sum(len(source.encode()) for source in old_sources)
+        new_size = len(new_source.encode())
+        self.stdout.write(
+            f"Rewrote {rewriter.rewritten} native StreamField definition(s), "
+            f"and removed {rewriter.removed} redundant AlterField operation(s)."
+        )
+        self.stdout.write(f"Size: {old_size / 1024:.1f} KB -> {new_size / 1024:.1f} KB")
+        # The new migration can't be compiled until any functions it references
+        # have been copied into it
+        new_compile_time = "unknown (manual porting required)"
+        if not writer.needs_manual_porting:
+            new_compile_time = f"{time_to_compile([new_source]):.2f} ms"
+        self.stdout.write(
+            f"Compile time: {time_to_compile(old_sources):.2f} ms -> "
+            f"{new_compile_time}"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        self.app_label = options["app_label"]
+        try:
+            apps.get_app_config(self.app_label)
+        except LookupError as err:
+            raise CommandError(str(err)) from err
+        self.field_keys = self.get_field_keys(self.app_label, options["fields"])
+        self.dry_run = options["dry_run"]
+        self.found_migrations = []
+        self.rewriter = None
+        self.writer = None
+        if self.dry_run:
+            # There's nothing to confirm
+            options["interactive"] = False
+
+        with replacing_squashmigrations_names(
+            MigrationOptimizer=partial(StreamFieldOptimizer, self),
+            MigrationWriter=partial(StreamFieldMigrationWriter, self),
+        ):
+            try:
+                super().handle(*args, **options)
+            except DryRun:
+                return
+
+        if self.verbosity > 0 and self.writer and self.writer.needs_manual_porting:
+            self.stdout.write(
+                "  Note that these functions will now receive raw StreamField data."
+            )
@@ -0,0 +1,112 @@
+from collections.abc import Iterable
+from typing import Any
+
+from django.apps import AppConfig, apps
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Model
+
+from mlstreamfield.fields import StreamField
+from mlstreamfield.validation import validate_stream_fields
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks the stored values of mlstreamfield StreamFields against their "
+        "current block definitions, without building StreamValues, and reports "
+        "unknown block types, unknown StructBlock keys and values that can't "
+        "be converted by their blocks. Exits with an error if any are found."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            help="Only validate fields of these apps (by default, all apps).",
+        )
+        parser.add_argument(
+            "--field",
+            action="append",
+            dest="fields",
+            metavar="APP_LABEL.MODEL.FIELD",
+            help="Only validate this field (can be used more than once).",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            help="Only validate this many randomly chosen values of each field.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Validate values in this many worker processes, validating "
+                "fields in parallel (default: 1, validating in this process)."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows fetched per query (default: 500).",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Nominates a database to validate values in.",
+        )
+
+    def get_fields(
+        self, app_labels: list[str], field_labels: list[str] | None
+    ) -> list[tuple[type[Model], StreamField]]:
+        app_configs: Iterable[AppConfig]
+        if app_labels:
+            try:
+                app_configs = [apps.get_app_config(label) for label in app_labels]
+            except LookupError as err:
+                raise CommandError(str(err)) from err
+        else:
+            app_configs = apps.get_app_configs()
+        selected = {label.lower() for label in field_labels or []}
+        missing = set(selected)
+        result = []
+        for app_config in app_configs:
+            for model in app_config.get_models():
+                if model._meta.proxy or not model._meta.managed:
+                    continue
+                for field in model._meta.local_fields:
+                    label = f"{model._meta.label_lower}.{field.name}"
+                    if isinstance(field, StreamField) and (
+                        not selected or label in selected
+                    ):
+                        missing.discard(label)
+                        result.append((model, field))
+        if missing:
+            raise CommandError(
+                f"Unknown mlstreamfield StreamField(s): {', '.join(sorted(missing))}"
+            )
+        return result
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        fields = self.get_fields(options["app_labels"], options["fields"])
+        if not fields:
+            self.stdout.write("No mlstreamfield StreamFields found.")
+            return
+
+        reports = validate_stream_fields(
+            [
+                (model._base_manager.using(options["database"]), field.name)
+                for model, field in fields
+            ],
+            sample=options["sample"],
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+        )
+        invalid = 0
+        for report in reports:
+            for line in report.summary():
+                self.stdout.write(line)
+            invalid += report.invalid
+        if invalid:
+            raise CommandError(f"Found {invalid} invalid StreamField value(s).")
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("mlstreamfield", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReversePatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255)),
+                ("model", models.CharField(max_length=255)),
+                ("field_name", models.CharField(max_length=255)),
+                ("object_pk", models.CharField(max_length=255)),
+                ("patch", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("key", "object_pk"),
+                        name="mlstreamfield_unique_reverse_patch",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from django.db import models
+
+
+class TransformCheckpoint(models.Model):
+    """
+    The progress of an unfinished raw data transform (see the `checkpoint`
+    argument of `mlstreamfield.bulk.transform_raw_data()`), so that it can be
+    resumed from the last batch written if it is interrupted. Checkpoints are
+    deleted once the transform completes.
+    """
+
+    key: "models.CharField[str, str]" = models.CharField(max_length=255, unique=True)
+    model: "models.CharField[str, str]" = models.CharField(max_length=255)
+    field_name: "models.CharField[str, str]" = models.CharField(max_length=255)
+    last_pk: "models.CharField[str, str]" = models.CharField(max_length=255)
+    processed: "models.PositiveBigIntegerField[int, int]" = (
+        models.PositiveBigIntegerField(default=0)
+    )
+    changed: "models.PositiveBigIntegerField[int, int]" = (
+        models.PositiveBigIntegerField(default=0)
+    )
+    updated_at: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now=True
+    )
+
+    def __str__(self) -> str:
+        return self.key
+
+
+class ReversePatch(models.Model):
+    """
+    A patch (see `mlstreamfield.diff`) that undoes the changes made to a
+    StreamField value by a raw data transform (see the `reverse_patches`
+    argument of `mlstreamfield.bulk.transform_raw_data()`). Patches are
+    deleted as they're applied by `replay_reverse_patches()`.
+    """
+
+    key: "models.CharField[str, str]" = models.CharField(max_length=255)
+    model: "models.CharField[str, str]" = models.CharField(max_length=255)
+    field_name: "models.CharField[str, str]" = models.CharField(max_length=255)
+    object_pk: "models.CharField[str, str]" = models.CharField(max_length=255)
+    patch: models.JSONField = models.JSONField()
+    created_at: "models.DateTimeField[datetime, datetime]" = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["key", "object_pk"], name="mlstreamfield_unique_reverse_patch"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.key}: {self.object_pk}"
@@ -0,0 +1,254 @@
+from collections.abc import Sequence
+from typing import Any
+
+from django.db import router
+from django.db.migrations.operations.base import Operation
+
+from mlstreamfield.bulk import (
+    delete_checkpoints,
+    transform_raw_data,
+    transform_revisions,
+)
+from mlstreamfield.sql import compile_update, get_block_plans, supports_json_updates
+from mlstreamfield.transforms import BlockRule, RawDataTransformer
+
+
+class RawStreamFieldOperation(Operation):
+    """
+    A migration operation that applies a number of rules (see
+    `mlstreamfield.transforms`) to the raw data of a StreamField, for every
+    object of a model. Each value is fetched, walked, and written back (if
+    changed) only once, however many rules there are. For example:
+
+        from mlstreamfield.operations import RawStreamFieldOperation
+        from mlstreamfield.transforms import MapBlockValue, RemoveBlock, RenameBlock
+
+        operations = [
+            RawStreamFieldOperation(
+                "blogpage",
+                "body",
+                [
+                    RenameBlock("heading", "title"),
+                    RenameBlock("section.links", "related_pages"),
+                    RemoveBlock("section.content.embed"),
+                    MapBlockValue("section.title", str.strip),
+                ],
+                reverse_rules=[RenameBlock("title", "heading")],
+            ),
+        ]
+
+    The operation is only reversible if `reverse_rules` is provided. If
+    `workers` is provided, values are transformed in that many worker
+    processes (see `transform_raw_data()`), in which case rules must be
+    picklable (e.g. `MapBlockValue` functions can't be lambdas).
+
+    The rules can also be applied to the field's values in Wagtail revisions
+    (see `transform_revisions()`), by setting `revisions` to `"latest"` (for
+    the latest revision of each object, and any scheduled revisions) or
+    `"all"`. The migration must then depend on a `wagtailcore` migration.
+
+    Long-running operations can be made resumable by providing a
+    `checkpoint` key that is unique to the operation, in a migration with
+    `atomic = False` that depends on `("mlstreamfield", "0001_initial")`.
+    Each batch is then committed along with a record of its progress, and
+    if the migration is interrupted, running it again resumes after the last
+    batch written (see `transform_raw_data()`).
+    """
+
+    REVISION_CHOICES = ("latest", "all")
+
+    reduces_to_sql = False
+
+    def __init__(
+        self,
+        model_name: str,
+        field_name: str,
+        rules: Sequence[BlockRule],
+        *,
+        reverse_rules: Sequence[BlockRule] | None = None,
+        batch_size: int = 500,
+        workers: int | None = None,
+        revisions: str | None = None,
+        checkpoint: str | None = None,
+        hints: dict[str, Any] | None = None,
+    ) -> None:
+        if revisions is not None and revisions not in self.REVISION_CHOICES:
+            raise ValueError(
+                f"revisions must be one of {self.REVISION_CHOICES} or None "
+                f"(got {revisions!r})."
+            )
+        self.model_name = model_name
+        self.field_name = field_name
+        self.rules = list(rules)
+        self.reverse_rules = None if reverse_rules is None else list(reverse_rules)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.revisions = revisions
+        self.checkpoint = checkpoint
+        self.hints = hints or {}
+
+    def deconstruct(self) -> tuple[str, list[Any], dict[str, Any]]:
+        kwargs: dict[str, Any] = {
+            "model_name": self.model_name,
+            "field_name": self.field_name,
+            "rules": self.rules,
+        }
+        if self.reverse_rules is not None:
+            kwargs["reverse_rules"] = self.reverse_rules
+        if self.batch_size != 500:
+            kwargs["batch_size"] = self.batch_size
+        if self.workers:
+            kwargs["workers"] = self.workers
+        if self.revisions is not None:
+            kwargs["revisions"] = self.revisions
+        if self.checkpoint is not None:
+            kwargs["checkpoint"] = self.checkpoint
+        if self.hints:
+            kwargs["hints"] = self.hints
+        return (self.__class__.__qualname__, [], kwargs)
+
+    @property
+    def reversible(self) -> bool:  # type: ignore[override]
+        return self.reverse_rules is not None
+
+    def state_forwards(self, app_label: str, state: Any) -> None:
+        pass
+
+    def _apply_rules(
+        self,
+        app_label: str,
+        schema_editor: Any,
+        state: Any,
+        rules: Sequence[BlockRule],
+        direction: str,
+    ) -> None:
+        connection = schema_editor.connection
+        if not router.allow_migrate(connection.alias, app_label, **self.hints):
+            return
+        model = state.apps.get_model(app_label, self.model_name)
+        # Checkpoints are kept until every step has completed (and then
+        # deleted together), so that resuming after an interruption never
+        # applies the rules to the values of a completed step again
+        checkpoints = [self.get_checkpoint_key(direction)]
+        self._transform_values(connection, model, rules, checkpoints[0])
+        if self.revisions is not None:
+            checkpoints.append(self.get_checkpoint_key(direction, "revisions"))
+            transform_revisions(
+                model._base_manager.using(connection.alias),
+                self.field_name,
+                RawDataTransformer(rules),
+                latest_only=self.revisions == "latest",
+                batch_size=self.batch_size,
+                workers=self.workers,
+                checkpoint=checkpoints[-1],
+                keep_checkpoint=True,
+            )
+        if self.checkpoint is not None:
+            delete_checkpoints(
+                model._base_manager.using(connection.alias),
+                *[key for key in checkpoints if key is not None],
+            )
+
+    def get_checkpoint_key(self, *parts: str) -> str | None:
+        if self.checkpoint is None:
+            return None
+        return ":".join([self.checkpoint, *parts])
+
+    def _transform_values(
+        self,
+        connection: Any,
+        model: Any,
+        rules: Sequence[BlockRule],
+        checkpoint: str | None,
+    ) -> None:
+        transform_raw_data(
+            model._base_manager.using(connection.alias),
+            self.field_name,
+            RawDataTransformer(rules),
+            batch_size=self.batch_size,
+            workers=self.workers,
+            checkpoint=checkpoint,
+            keep_checkpoint=True,
+        )
+
+    def database_forwards(
+        self, app_label: str, schema_editor: Any, from_state: Any, to_state: Any
+    ) -> None:
+        self._apply_rules(app_label, schema_editor, from_state, self.rules, "forwards")
+
+    def database_backwards(
+        self, app_label: str, schema_editor: Any, from_state: Any, to_state: Any
+    ) -> None:
+        # `reversible` is checked by Django before this is called
+        self._apply_rules(
+            app_label,
+            schema_editor,
+            from_state,
+            self.reverse_rules,  # type: ignore[arg-type]
+            "backwards",
+        )
+
+    def describe(self) -> str:
+        return (
+            f"Apply {len(self.rules)} raw data rule(s) to "
+            f"{self.model_name}.{self.field_name}"
+        )
+
+    @property
+    def migration_name_fragment(self) -> str:
+        return f"transform_{self.model_name.lower()}_{self.field_name.lower()}"
+
+
+class RawStreamFieldSQLOperation(RawStreamFieldOperation):
+    """
+    A version of `RawStreamFieldOperation` that applies its rules with a
+    single `UPDATE` statement, using the database's own JSON functions,
+    so that values never have to be loaded into Python. For example:
+
+        RawStreamFieldSQLOperation(
+            "blogpage",
+            "body",
+            [RenameBlock("heading", "title"), RemoveBlock("section.embed")],
+            reverse_rules=[RenameBlock("title", "heading")],
+        )
+
+    Only `RenameBlock` and `RemoveBlock` rules for top-level blocks, or the
+    children of top-level StructBlocks, are supported (see
+    `mlstreamfield.sql`), and other rules raise `ValueError`.
+
+    PostgreSQL and SQLite (3.38+) are supported. For other databases, values
+    are transformed in Python instead, in the same way as
+    `RawStreamFieldOperation`. The statement skips values that earlier
+    versions of this package stored as JSON strings holding the document
+    (which the Python version decodes), so rewrite them as documents first
+    with the `compact_streamfields` command, which does so on every
+    database. Values in revisions (see `revisions`) are always transformed
+    in Python, and a `checkpoint` only applies to them (and to other
+    databases), as the statement is atomic.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        get_block_plans(self.rules)
+        if self.reverse_rules is not None:
+            get_block_plans(self.reverse_rules)
+
+    def _transform_values(
+        self,
+        connection: Any,
+        model: Any,
+        rules: Sequence[BlockRule],
+        checkpoint: str | None,
+    ) -> None:
+        if not supports_json_updates(connection):
+            super()._transform_values(connection, model, rules, checkpoint)
+            return
+        quote_name = connection.ops.quote_name
+        sql, params = compile_update(
+            connection.vendor,
+            quote_name(model._meta.db_table),
+            quote_name(model._meta.get_field(self.field_name).column),
+            rules,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
@@ -0,0 +1,241 @@
+"""
+Compiles a restricted set of raw data rules (see `mlstreamfield.transforms`)
+into a single `UPDATE` statement that uses the database's own JSON functions,
+so that values never have to be loaded into Python.
+
+Only `RenameBlock` and `RemoveBlock` rules are supported, for top-level
+stream children (e.g. "heading") or the children of top-level StructBlocks
+(e.g. "section.title"). Only values stored as JSON arrays are updated, so
+values that earlier versions of this package stored as JSON strings holding
+the document are left as they are.
+"""
+
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from mlstreamfield.transforms import BlockRule, RemoveBlock, RenameBlock
+
+
+SUPPORTED_VENDORS = ("postgresql", "sqlite")
+
+# The version of SQLite that added the -> operator
+MIN_SQLITE_VERSION = (3, 38)
+
+
+def supports_json_updates(connection: Any) -> bool:
+    """
+    Return `True` if statements from `compile_update()` can be run on the
+    database of `connection`.
+    """
+    if connection.vendor == "sqlite":
+        version: tuple[int, ...] = connection.Database.sqlite_version_info
+        return version >= MIN_SQLITE_VERSION
+    return connection.vendor in SUPPORTED_VENDORS
+
+
+@dataclass
+class BlockPlan:
+    """
+    The combined effect of all of the rules for one top-level block type.
+    `child_names` maps the original names of StructBlock children to their
+    new names, or `None` if they are removed.
+    """
+
+    new_name: str | None
+    child_names: dict[str, str | None] = field(default_factory=dict)
+
+    @property
+    def renamed_children(self) -> dict[str, str]:
+        return {
+            old: new
+            for old, new in self.child_names.items()
+            if new is not None and new != old
+        }
+
+    @property
+    def removed_children(self) -> list[str]:
+        return [old for old, new in self.child_names.items() if new is None]
+
+
+def get_block_plans(rules: Iterable[BlockRule]) -> dict[str, BlockPlan]:
+    """
+    Return a `BlockPlan` for each top-level block type affected by `rules`,
+    raising `ValueError` for any rules that can't be compiled to SQL.
+    """
+    plans: dict[str, BlockPlan] = {}
+    for rule in rules:
+        if not isinstance(rule, RenameBlock | RemoveBlock) or len(rule.path) > 2:
+            raise ValueError(
+                f"{rule!r} can't be applied in the database. Only RenameBlock "
+                "and RemoveBlock rules for top-level blocks, or the children "
+                "of top-level StructBlocks, are supported."
+            )
+        block_name = rule.path[0]
+        plan = plans.setdefault(block_name, BlockPlan(new_name=block_name))
+        if len(rule.path) == 1:
+            if plan.new_name is not None:
+                plan.new_name = getattr(rule, "new_name", None)
+            continue
+        child_name = rule.path[1]
+        current_name = plan.child_names.get(child_name, child_name)
+        if current_name is not None:
+            plan.child_names[child_name] = getattr(rule, "new_name", None)
+    return plans
+
+
+def placeholders(values: list[Any]) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def compile_update(
+    vendor: str, table: str, column: str, rules: Iterable[BlockRule]
+) -> tuple[str, list[Any]]:
+    """
+    Return an `UPDATE` statement and its parameters, applying `rules` to
+    every value in `column` of `table` that contains an affected block.
+    `table` and `column` must already be quoted.
+    """
+    plans = get_block_plans(rules)
+    if vendor == "postgresql":
+        return compile_postgresql_update(table, column, plans)
+    if vendor == "sqlite":
+        return compile_sqlite_update(table, column, plans)
+    raise ValueError(f"JSON updates are not supported for {vendor!r} databases.")
+
+
+def compile_sqlite_update(
+    table: str, column: str, plans: dict[str, BlockPlan]
+) -> tuple[str, list[Any]]:
+    # JSON text for the current array item, whatever its type
+    item_json = f"({table}.{column} -> block.fullkey)"
+    block_type = (
+        "(CASE block.type WHEN 'object' "
+        "THEN json_extract(block.value, '$.type') END)"
+    )
+
+    cases = []
+    case_params: list[Any] = []
+    for block_name, plan in plans.items():
+        if plan.new_name is None:
+            continue
+        expr = item_json
+        expr_params: list[Any] = []
+        if plan.child_names:
+            renamed, removed = plan.renamed_children, plan.removed_children
+            child_key = "child.key"
+            if renamed:
+                child_key = (
+                    "CASE child.key "
+                    + " ".join("WHEN %s THEN %s" for _ in renamed)
+                    + " ELSE child.key END"
+                )
+                for item in renamed.items():
+                    expr_params.extend(item)
+            child_filter = ""
+            if removed:
+                child_filter = f"WHERE child.key NOT IN ({placeholders(removed)})"
+                expr_params.extend(removed)
+            # Subqueries lose the JSON subtype of their results, so json() is
+            # needed to stop the new struct from being inserted as a string
+            expr = (
+                f"CASE json_type(block.value, '$.value') WHEN 'object' THEN "  # noqa: S608
+                f"json_set({item_json}, '$.value', json(("
+                f"SELECT json_group_object({child_key}, "
+                f"json(block.value -> child.fullkey)) "
+                f"FROM json_each(block.value, '$.value') AS child "
+                f"{child_filter}))) ELSE {item_json} END"
+            )
+        if plan.new_name != block_name:
+            expr = f"json_set({expr}, '$.type', %s)"
+            expr_params.append(plan.new_name)
+        cases.append(f"WHEN %s THEN {expr}")
+        case_params.extend([block_name, *expr_params])
+
+    item_expr = item_json
+    if cases:
+        item_expr = f"CASE {block_type} {' '.join(cases)} ELSE {item_json} END"
+    removed_blocks = [name for name, plan in plans.items() if plan.new_name is None]
+    item_filter = ""
+    if removed_blocks:
+        item_filter = (
+            f"WHERE coalesce({block_type} NOT IN "
+            f"({placeholders(removed_blocks)}), 1)"
+        )
+    affected_blocks = list(plans)
+    sql = (
+        f"UPDATE {table} SET {column} = ("  # noqa: S608
+        f"SELECT json_group_array(json(item)) FROM ("
+        f"SELECT {item_expr} AS item "
+        f"FROM json_each({table}.{column}) AS block "
+        f"{item_filter} ORDER BY block.key)) "
+        f"WHERE json_valid({column}) AND json_type({column}) = 'array' "
+        f"AND EXISTS (SELECT 1 FROM json_each({table}.{column}) AS block "
+        f"WHERE {block_type} IN ({placeholders(affected_blocks)}))"
+    )
+    return sql, [*case_params, *removed_blocks, *affected_blocks]
+
+
+def compile_postgresql_update(
+    table: str, column: str, plans: dict[str, BlockPlan]
+) -> tuple[str, list[Any]]:
+    block_type = "(block.item ->> 'type')"
+
+    cases = []
+    case_params: list[Any] = []
+    for block_name, plan in plans.items():
+        if plan.new_name is None:
+            continue
+        expr = "block.item"
+        expr_params: list[Any] = []
+        if plan.child_names:
+            renamed, removed = plan.renamed_children, plan.removed_children
+            child_key = "child.key"
+            if renamed:
+                child_key = (
+                    "CASE child.key "
+                    + " ".join("WHEN %s THEN %s::text" for _ in renamed)
+                    + " ELSE child.key END"
+                )
+                for item in renamed.items():
+                    expr_params.extend(item)
+            child_filter = ""
+            if removed:
+                child_filter = f"WHERE child.key NOT IN ({placeholders(removed)})"
+                expr_params.extend(removed)
+            expr = (
+                "CASE jsonb_typeof(block.item -> 'value') WHEN 'object' THEN "  # noqa: S608
+                "jsonb_set(block.item, '{value}', ("
+                f"SELECT coalesce(jsonb_object_agg({child_key}, child.value), "
+                "'{}'::jsonb) "
+                f"FROM jsonb_each(block.item -> 'value') AS child {child_filter})) "
+                "ELSE block.item END"
+            )
+        if plan.new_name != block_name:
+            expr = f"jsonb_set({expr}, '{{type}}', to_jsonb(%s::text))"
+            expr_params.append(plan.new_name)
+        cases.append(f"WHEN %s THEN {expr}")
+        case_params.extend([block_name, *expr_params])
+
+    item_expr = "block.item"
+    if cases:
+        item_expr = f"CASE {block_type} {' '.join(cases)} ELSE block.item END"
+    removed_blocks = [name for name, plan in plans.items() if plan.new_name is None]
+    item_filter = ""
+    if removed_blocks:
+        item_filter = (
+            f"WHERE {block_type} IS NULL "
+            f"OR {block_type} NOT IN ({placeholders(removed_blocks)})"
+        )
+    affected_blocks = list(plans)
+    sql = (
+        f"UPDATE {table} SET {column} = ("  # noqa: S608
+        f"SELECT coalesce(jsonb_agg({item_expr} ORDER BY block.index), "
+        "'[]'::jsonb) "
+        f"FROM jsonb_array_elements({table}.{column}) "
+        f"WITH ORDINALITY AS block(item, index) {item_filter}) "
+        f"WHERE jsonb_typeof({column}) = 'array' "
+        f"AND EXISTS (SELECT 1 FROM jsonb_array_elements({table}.{column}) "
+        f"AS block(item) WHERE {block_type} IN ({placeholders(affected_blocks)}))"
+    )
+    return sql, [*case_params, *removed_blocks, *affected_blocks]
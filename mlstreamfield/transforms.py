@@ -0,0 +1,229 @@
+"""
+Declarative rules for changing raw StreamField data, applied by walking each
+value only once, regardless of how many rules there are.
+
+Rules are keyed by block path: a dot-separated list of block names from the
+top of the stream. Stream children are identified by their block type,
+StructBlock children by their name, and ListBlock children by "item". For
+example, given the following blocks:
+
+    body = StreamField([
+        ("heading", CharBlock()),
+        ("section", StructBlock([
+            ("title", CharBlock()),
+            ("links", ListBlock(PageChooserBlock())),
+            ("content", StreamBlock([("paragraph", RichTextBlock())])),
+        ])),
+    ])
+
+Valid paths include "heading", "section", "section.title", "section.links",
+"section.links.item" and "section.content.paragraph".
+
+Paths always refer to block names as they are before any of the rules are
+applied, and rules for nested blocks are applied before rules for the
+blocks that contain them.
+"""
+
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from django.utils.deconstruct import deconstructible
+
+
+Path = tuple[str, ...]
+
+
+class BlockRule:
+    def __init__(self, path: str) -> None:
+        self.path: Path = tuple(path.split("."))
+
+    def apply(self, name: str, value: Any) -> tuple[str, Any] | None:
+        """
+        Return a new `(name, value)` tuple for a matching block, or `None` if
+        the block should be removed.
+        """
+        raise NotImplementedError
+
+    def __eq__(self, other: object) -> bool:
+        return type(self) is type(other) and vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({'.'.join(self.path)!r})"
+
+
+@deconstructible(path="mlstreamfield.transforms.RenameBlock")
+class RenameBlock(BlockRule):
+    """
+    Rename matching stream children (by changing their `type`), or
+    StructBlock children (by changing their key).
+    """
+
+    def __init__(self, path: str, new_name: str) -> None:
+        super().__init__(path)
+        self.new_name = new_name
+
+    def apply(self, name: str, value: Any) -> tuple[str, Any] | None:
+        return self.new_name, value
+
+
+@deconstructible(path="mlstreamfield.transforms.RemoveBlock")
+class RemoveBlock(BlockRule):
+    """
+    Remove matching stream children, StructBlock children or ListBlock items.
+    """
+
+    def apply(self, name: str, value: Any) -> tuple[str, Any] | None:
+        return None
+
+
+@deconstructible(path="mlstreamfield.transforms.MapBlockValue")
+class MapBlockValue(BlockRule):
+    """
+    Replace the value of matching blocks with the result of calling
+    `function` with the existing value. `function` can also change the
+    existing value in place, and return it.
+    """
+
+    def __init__(self, path: str, function: Callable[[Any], Any]) -> None:
+        super().__init__(path)
+        self.function = function
+
+    def apply(self, name: str, value: Any) -> tuple[str, Any] | None:
+        return name, self.function(value)
+
+
+def is_stream_data(value: list[Any]) -> bool:
+    """
+    Return `True` if `value` looks like StreamBlock data (or ListBlock data
+    in the format used since Wagtail 2.16, which is structurally the same).
+    Only the first item is checked.
+    """
+    return bool(value) and isinstance(value[0], dict) and "type" in value[0]
+
+
+class RawDataTransformer:
+    """
+    A callable that applies a number of `BlockRule` objects to raw
+    StreamField data in place, walking the data only once. Branches of the
+    data that no rules apply to are skipped entirely.
+
+    Can be used as the `transform` argument to
+    `mlstreamfield.bulk.transform_raw_data()`.
+    """
+
+    def __init__(self, rules: Iterable[BlockRule]) -> None:
+        self.rules: dict[Path, list[BlockRule]] = defaultdict(list)
+        self.parent_paths: set[Path] = set()
+        for rule in rules:
+            self.rules[rule.path].append(rule)
+            for i in range(1, len(rule.path)):
+                self.parent_paths.add(rule.path[:i])
+
+    def __call__(self, raw_data: Any) -> None:
+        self.transform_children(raw_data, ())
+
+    def applies_to(self, raw_json: str) -> bool:
+        """
+        Return `False` if none of the rules can apply to the StreamField data
+        encoded in `raw_json`, because the name of the top-level block each
+        rule's path starts with doesn't appear anywhere in it (e.g. because
+        the data has already been converted). This is much cheaper than
+        decoding the data, so it's used to skip values in bulk transforms.
+        Returns `True` if the names may be written in some other way (e.g.
+        with escape sequences), or the data is double-encoded.
+        """
+        if raw_json.lstrip().startswith('"'):
+            return True
+        names = {path[0] for path in self.rules}
+        for name in names:
+            if not name.isascii() or not name.isprintable() or '"' in name:
+                return True
+            if "\\" in name:
+                return True
+        return any(f'"{name}"' in raw_json for name in names)
+
+    def apply_rules(self, path: Path, name: str, value: Any) -> tuple[str, Any] | None:
+        if path in self.parent_paths:
+            self.transform_children(value, path)
+        result = (name, value)
+        for rule in self.rules.get(path, ()):
+            applied = rule.apply(*result)
+            if applied is None:
+                return None
+            result = applied
+        return result
+
+    def transform_children(self, value: Any, path: Path) -> None:
+        if isinstance(value, dict):
+            self.transform_struct(value, path)
+        elif isinstance(value, list):
+            if is_stream_data(value):
+                self.transform_stream(value, path)
+            else:
+                self.transform_list(value, path)
+
+    def transform_stream(self, children: list[Any], path: Path) -> None:
+        new_children = []
+        removed = False
+        for child in children:
+            name = child["type"]
+            child_path = (*path, name)
+            if child_path not in self.rules and child_path not in self.parent_paths:
+                new_children.append(child)
+                continue
+            value = child.get("value")
+            result = self.apply_rules(child_path, name, value)
+            if result is None:
+                removed = True
+                continue
+            new_name, new_value = result
+            if new_name != name:
+                child["type"] = new_name
+            if new_value is not value:
+                child["value"] = new_value
+            new_children.append(child)
+        if removed:
+            children[:] = new_children
+
+    def transform_struct(self, struct: dict[str, Any], path: Path) -> None:
+        new_items = []
+        restructured = False
+        for name in list(struct):
+            child_path = (*path, name)
+            if child_path not in self.rules and child_path not in self.parent_paths:
+                new_items.append((name, struct[name]))
+                continue
+            value = struct[name]
+            result = self.apply_rules(child_path, name, value)
+            if result is None:
+                restructured = True
+                continue
+            new_name, new_value = result
+            if new_name != name:
+                restructured = True
+            elif new_value is not value:
+                struct[name] = new_value
+            new_items.append((new_name, new_value))
+        if restructured:
+            # Rebuild the dict to preserve the original key order
+            struct.clear()
+            struct.update(new_items)
+
+    def transform_list(self, items: list[Any], path: Path) -> None:
+        # ListBlock data in the format used before Wagtail 2.16
+        item_path = (*path, "item")
+        if item_path not in self.rules and item_path not in self.parent_paths:
+            return
+        new_items = []
+        removed = False
+        for i, item in enumerate(items):
+            result = self.apply_rules(item_path, "item", item)
+            if result is None:
+                removed = True
+                continue
+            if result[1] is not item:
+                items[i] = result[1]
+            new_items.append(result[1])
+        if removed:
+            items[:] = new_items
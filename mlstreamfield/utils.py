@@ -0,0 +1,98 @@
+import timeit
+
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from django.db import models
+from wagtail.fields import StreamField as WagtailStreamfield
+
+from mlstreamfield.fields import StreamField
+from mlstreamfield.values import RawStreamValue
+
+
+def stream_value_has_changed(value: object) -> bool:
+    """
+    Return `False` if `value` is a `RawStreamValue` that is unchanged since
+    it was loaded from the database, or `True` otherwise.
+    """
+    return not isinstance(value, RawStreamValue) or value.has_changed
+
+
+def prune_unchanged_stream_fields(
+    objs: Iterable[models.Model], field_names: Sequence[str] | None = None
+) -> list[str]:
+    """
+    Return `field_names` (or the names of all concrete, non-primary-key
+    fields on the objects' model if not provided), minus the names of any
+    `mlstreamfield` StreamFields whose values are unchanged for all of
+    `objs`. The result is intended to be used as the `update_fields` value
+    for `save()`, or the `fields` value for `bulk_update()`, so that large
+    values aren't needlessly written back to the database, e.g.:
+
+        page.save(update_fields=prune_unchanged_stream_fields([page]))
+
+        Page.objects.bulk_update(
+            pages, prune_unchanged_stream_fields(pages, ["title", "body"])
+        )
+
+    If every field is pruned, the returned list will be empty, in which
+    case `save()` does nothing, but `bulk_update()` raises an error.
+    """
+    objs = list(objs)
+    if not objs:
+        return list(field_names or [])
+
+    opts = objs[0]._meta
+    if field_names is None:
+        field_names = [
+            field.name
+            for field in opts.fields
+            if field.concrete
+            and not field.primary_key
+            and not getattr(field, "generated", False)
+        ]
+
+    result = []
+    for name in field_names:
+        field = opts.get_field(name)
+        if isinstance(field, StreamField) and not any(
+            stream_value_has_changed(field.value_from_object(obj)) for obj in objs
+        ):
+            continue
+        result.append(name)
+    return result
+
+
+def is_native_streamfield(field: "models.Field[Any, Any]") -> bool:
+    """
+    Return `True` if `field` is a Wagtail StreamField, but not an
+    `mlstreamfield` one.
+    """
+    return isinstance(field, WagtailStreamfield) and not isinstance(field, StreamField)
+
+
+def to_mlstreamfield(field: "models.Field[Any, Any]") -> StreamField:
+    """
+    Return an `mlstreamfield` StreamField equivalent to a native StreamField,
+    without any block definitions.
+    """
+    _, _, _, kwargs = field.deconstruct()
+    kwargs.pop("block_types", None)
+    kwargs.pop("block_lookup", None)
+    kwargs.pop("verbose_name", None)
+    return StreamField(**kwargs)
+
+
+def time_to_compile(sources: list[str]) -> float:
+    """
+    Return the fastest of five attempts to compile the source of a number of
+    migration modules (as a new process without cached bytecode would), in
+    milliseconds. The modules aren't executed, as that would run any side
+    effects they have (and relative imports fail outside their packages).
+    """
+
+    def compile_all() -> None:
+        for source in sources:
+            compile(source, "<migration>", "exec")
+
+    return min(timeit.repeat(compile_all, number=1, repeat=5)) * 1000
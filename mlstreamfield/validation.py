@@ -0,0 +1,261 @@
+"""
+Checks of stored StreamField data against the current block definitions,
+which work on the raw data (as `mlstreamfield.transforms` does), rather than
+building `StreamValue` objects. `StreamBlock.to_python()` silently drops
+blocks of unknown types, so values that no longer match their definitions
+(e.g. because a data migration missed them) are otherwise hard to find.
+
+Problems are reported by block path, in the same form as the paths of
+`mlstreamfield.transforms` rules (e.g. "section.links.item"), and are
+counted by the number of values they're found in.
+"""
+
+import multiprocessing
+
+from collections import Counter, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import cache
+from itertools import islice, repeat
+from typing import Any, NamedTuple
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import models
+from wagtail.blocks import (
+    Block,
+    ChooserBlock,
+    FieldBlock,
+    ListBlock,
+    StaticBlock,
+    StreamBlock,
+    StructBlock,
+)
+
+from mlstreamfield.bulk import RowBatch, init_worker, iter_raw_json_batches
+from mlstreamfield.codecs import JSONCodec
+from mlstreamfield.transforms import Path
+from mlstreamfield.values import decode_raw_json
+
+
+class Problem(NamedTuple):
+    path: str
+    message: str
+
+
+def join_path(path: Path) -> str:
+    return ".".join(path) or "(root)"
+
+
+def check_value(block: Block, value: Any) -> bool:
+    """
+    Return `True` if `value` can be converted to a value of `block`, which
+    is neither a stream, struct nor list block. Chooser blocks only check
+    that the value is a valid primary key, without fetching the object.
+    """
+    try:
+        if isinstance(block, ChooserBlock):
+            if value is not None:
+                block.model_class._meta.pk.to_python(value)
+        elif isinstance(block, FieldBlock):
+            block.field.to_python(value)
+        else:
+            block.to_python(value)
+    except (ValidationError, TypeError, ValueError, LookupError):
+        return False
+    return True
+
+
+def validate_raw_data(block: Block, value: Any, path: Path = ()) -> Iterator[Problem]:
+    """
+    Yield the problems found in the raw data `value` of `block`, whose block
+    path is `path`.
+    """
+    if isinstance(block, StreamBlock):
+        if not isinstance(value, list):
+            yield Problem(join_path(path), "expected a list of blocks")
+            return
+        for child in value:
+            if not isinstance(child, dict) or not isinstance(child.get("type"), str):
+                yield Problem(join_path(path), "expected a block")
+                continue
+            child_path = (*path, child["type"])
+            child_block = block.child_blocks.get(child["type"])
+            if child_block is None:
+                yield Problem(join_path(child_path), "unknown block type")
+            else:
+                yield from validate_raw_data(
+                    child_block, child.get("value"), child_path
+                )
+    elif isinstance(block, StructBlock):
+        if not isinstance(value, dict):
+            yield Problem(join_path(path), "expected a dict of values")
+            return
+        # Missing keys are fine, and take the child block's default value
+        for name, child_value in value.items():
+            child_path = (*path, name)
+            child_block = block.child_blocks.get(name)
+            if child_block is None:
+                yield Problem(join_path(child_path), "unknown key")
+            else:
+                yield from validate_raw_data(child_block, child_value, child_path)
+    elif isinstance(block, ListBlock):
+        if not isinstance(value, list):
+            yield Problem(join_path(path), "expected a list of items")
+            return
+        item_path = (*path, "item")
+        for item in value:
+            # Items are {"type": "item", "value": ..., "id": ...} dicts since
+            # Wagtail 2.16, and plain values before that
+            item_value = item
+            if isinstance(item, dict) and item.get("type") == "item":
+                item_value = item.get("value")
+            yield from validate_raw_data(block.child_block, item_value, item_path)
+    elif not isinstance(block, StaticBlock) and not check_value(block, value):
+        yield Problem(
+            join_path(path), f"value can't be converted by {type(block).__name__}"
+        )
+
+
+def validate_raw_json(
+    raw_json: str | None, stream_block: StreamBlock, codec: JSONCodec
+) -> list[Problem]:
+    """
+    Return the distinct problems found in a stored StreamField value.
+    """
+    if raw_json is None:
+        return []
+    raw_data, raw_text = decode_raw_json(raw_json, codec)
+    if raw_text is not None:
+        return [Problem("(root)", "not valid JSON")]
+    return list(dict.fromkeys(validate_raw_data(stream_block, raw_data)))
+
+
+@cache
+def get_stream_field(label: str) -> Any:
+    app_label, model_name, field_name = label.split(".")
+    return apps.get_model(app_label, model_name)._meta.get_field(field_name)
+
+
+def validate_rows(label: str, rows: RowBatch) -> list[tuple[Any, list[Problem]]]:
+    """
+    Validate `(pk, raw_json)` rows of the field with the label
+    "app_label.Model.field", returning the problems found in each invalid
+    row. The field is looked up by its label so that this can be called in
+    worker processes.
+    """
+    stream_field = get_stream_field(label)
+    stream_block = stream_field.stream_block
+    codec = stream_field.codec
+    results = []
+    for pk, raw_json in rows:
+        problems = validate_raw_json(raw_json, stream_block, codec)
+        if problems:
+            results.append((pk, problems))
+    return results
+
+
+@dataclass
+class ValidationReport:
+    """
+    The outcome of validating the stored values of a field. `problems`
+    counts the values each problem was found in, and `examples` holds the
+    primary key of the first of them.
+    """
+
+    label: str
+    total: int
+    processed: int = 0
+    invalid: int = 0
+    problems: Counter[Problem] = field(default_factory=Counter)
+    examples: dict[Problem, Any] = field(default_factory=dict)
+
+    def add(self, rows: RowBatch, results: list[tuple[Any, list[Problem]]]) -> None:
+        self.processed += len(rows)
+        self.invalid += len(results)
+        for pk, problems in results:
+            self.problems.update(problems)
+            for problem in problems:
+                self.examples.setdefault(problem, pk)
+
+    def summary(self) -> list[str]:
+        lines = [
+            f"{self.label}: {self.invalid} of {self.processed} value(s) invalid"
+            + (f" ({self.total} in total)" if self.processed != self.total else "")
+        ]
+        for problem, count in sorted(self.problems.items()):
+            lines.append(
+                f"  {problem.path}: {problem.message} ({count} value(s), e.g. "
+                f"pk {self.examples[problem]})"
+            )
+        return lines
+
+
+def roundrobin(iterables: Iterable[Iterator[Any]]) -> Iterator[Any]:
+    iterators = deque(iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        for item in islice(iterator, 1):
+            yield item
+            iterators.append(iterator)
+
+
+def validate_stream_fields(
+    fields: Iterable[tuple[models.QuerySet[Any], str]],
+    *,
+    sample: int | None = None,
+    batch_size: int = 500,
+    workers: int = 1,
+) -> list[ValidationReport]:
+    """
+    Validate the stored values of each of `fields` (`(queryset, field_name)`
+    tuples for installed models) against the fields' current block
+    definitions, returning a `ValidationReport` for each.
+
+    Values are fetched as JSON text in batches of `batch_size`, and never
+    decoded by the fields themselves. If `sample` is provided, only that many
+    randomly chosen values of each field are validated. If `workers` is more
+    than 1, batches are validated in that many worker processes, taking
+    batches from each field in turn, so that fields are validated in
+    parallel.
+    """
+    reports = []
+    batches = []
+    for queryset, field_name in fields:
+        opts = queryset.model._meta
+        report = ValidationReport(
+            label=f"{opts.label}.{field_name}", total=queryset.count()
+        )
+        if sample is not None:
+            pks = queryset.order_by("?").values_list("pk", flat=True)[:sample]
+            queryset = queryset.filter(pk__in=list(pks))
+        reports.append(report)
+        batches.append(
+            zip(repeat(report), iter_raw_json_batches(queryset, field_name, batch_size))
+        )
+
+    if workers <= 1:
+        for report, rows in roundrobin(batches):
+            report.add(rows, validate_rows(report.label, rows))
+        return reports
+
+    pending: deque[tuple[ValidationReport, RowBatch, Future[Any]]] = deque()
+    # As in `mlstreamfield.bulk.run_in_workers()`, workers are spawned so
+    # that they never share the database connections of this process
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+    ) as executor:
+        for report, rows in roundrobin(batches):
+            pending.append(
+                (report, rows, executor.submit(validate_rows, report.label, rows))
+            )
+            while len(pending) >= workers * 2:
+                report, rows, future = pending.popleft()
+                report.add(rows, future.result())
+        while pending:
+            report, rows, future = pending.popleft()
+            report.add(rows, future.result())
+    return reports
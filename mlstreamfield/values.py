@@ -0,0 +1,402 @@
+import json
+import re
+
+from collections.abc import Iterator
+from typing import Any, SupportsIndex
+
+from wagtail.blocks import StreamBlock, StreamValue
+
+from mlstreamfield import instrumentation
+from mlstreamfield.codecs import JSONCodec
+
+
+def decode_raw_json(raw_json: str, codec: JSONCodec) -> tuple[Any, str | None]:
+    """
+    Decode a stored StreamField value using `codec`, returning a
+    `(raw_data, raw_text)` tuple. `raw_text` is only set if the value
+    (or the string it contains) is not valid JSON, in which case `raw_data`
+    is an empty list.
+    """
+    try:
+        raw_data = codec.loads(raw_json)
+    except ValueError:
+        return [], raw_json
+    if isinstance(raw_data, str):
+        # Values written by earlier versions of this package were encoded
+        # twice, and values converted from text fields may not be JSON at all
+        try:
+            raw_data = codec.loads(raw_data)
+        except ValueError:
+            return [], raw_data
+    return raw_data, None
+
+
+class ChangeTracker:
+    """
+    Shared by all of the containers within a single decoded value, so that a
+    change at any depth marks the whole value as changed.
+    """
+
+    __slots__ = ("changed",)
+
+    def __init__(self) -> None:
+        self.changed = False
+
+
+def track_changes(item: Any, tracker: ChangeTracker) -> Any:
+    """
+    Return a change-tracking version of `item` if it is a plain `dict` or
+    `list`, or `item` unchanged otherwise. Nested containers are only
+    converted when they are accessed, so that reading part of a large value
+    doesn't involve copying all of it.
+    """
+    if type(item) is dict:
+        return TrackedDict(item, tracker)
+    if type(item) is list:
+        return TrackedList(item, tracker)
+    return item
+
+
+class TrackedList(list[Any]):
+    """
+    A `list` that reports any changes to itself (or the containers within it)
+    to a `ChangeTracker`.
+    """
+
+    def __init__(self, iterable: Any, tracker: ChangeTracker) -> None:
+        super().__init__(iterable)
+        self.tracker = tracker
+
+    def _track(self, i: int) -> Any:
+        item = super().__getitem__(i)
+        tracked = track_changes(item, self.tracker)
+        if tracked is not item:
+            super().__setitem__(i, tracked)
+        return tracked
+
+    def __getitem__(self, i: Any) -> Any:
+        if isinstance(i, slice):
+            return [self._track(j) for j in range(len(self))[i]]
+        return self._track(i)
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(len(self)):
+            yield self._track(i)
+
+    def __reversed__(self) -> Iterator[Any]:
+        for i in reversed(range(len(self))):
+            yield self._track(i)
+
+    def copy(self) -> list[Any]:
+        return list(self)
+
+    def __add__(self, other: Any) -> list[Any]:
+        return list(self) + other  # type: ignore[no-any-return]
+
+    def __mul__(self, n: SupportsIndex) -> list[Any]:
+        return list(self) * n
+
+    __rmul__ = __mul__
+
+    def pop(self, i: SupportsIndex = -1) -> Any:
+        self.tracker.changed = True
+        return track_changes(super().pop(i), self.tracker)
+
+    def __setitem__(self, i: Any, value: Any) -> None:
+        self.tracker.changed = True
+        super().__setitem__(i, value)
+
+    def __delitem__(self, i: Any) -> None:
+        self.tracker.changed = True
+        super().__delitem__(i)
+
+    def __iadd__(self, other: Any) -> "TrackedList":
+        self.tracker.changed = True
+        return super().__iadd__(other)
+
+    def __imul__(self, n: SupportsIndex) -> "TrackedList":
+        self.tracker.changed = True
+        return super().__imul__(n)
+
+    def append(self, value: Any) -> None:
+        self.tracker.changed = True
+        super().append(value)
+
+    def extend(self, values: Any) -> None:
+        self.tracker.changed = True
+        super().extend(values)
+
+    def insert(self, i: SupportsIndex, value: Any) -> None:
+        self.tracker.changed = True
+        super().insert(i, value)
+
+    def remove(self, value: Any) -> None:
+        self.tracker.changed = True
+        super().remove(value)
+
+    def clear(self) -> None:
+        self.tracker.changed = True
+        super().clear()
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        self.tracker.changed = True
+        super().sort(*args, **kwargs)
+
+    def reverse(self) -> None:
+        self.tracker.changed = True
+        super().reverse()
+
+
+class TrackedDict(dict[Any, Any]):
+    """
+    A `dict` that reports any changes to itself (or the containers within it)
+    to a `ChangeTracker`.
+    """
+
+    def __init__(self, mapping: Any, tracker: ChangeTracker) -> None:
+        super().__init__(mapping)
+        self.tracker = tracker
+
+    def __getitem__(self, key: Any) -> Any:
+        item = super().__getitem__(key)
+        tracked = track_changes(item, self.tracker)
+        if tracked is not item:
+            super().__setitem__(key, tracked)
+        return tracked
+
+    def __iter__(self) -> Iterator[Any]:
+        # Overriding __iter__ also stops dict(), {**value} and dict.update()
+        # from copying untracked containers via CPython's fast path
+        return iter(list(super().keys()))
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self) -> Any:
+        return [self[key] for key in self]
+
+    def items(self) -> Any:
+        return [(key, self[key]) for key in self]
+
+    def copy(self) -> dict[Any, Any]:
+        return dict(self.items())
+
+    def __or__(self, other: Any) -> dict[Any, Any]:
+        return self.copy() | other  # type: ignore[no-any-return]
+
+    def __ror__(self, other: Any) -> dict[Any, Any]:
+        return other | self.copy()  # type: ignore[no-any-return]
+
+    def pop(self, key: Any, *args: Any) -> Any:
+        self.tracker.changed = True
+        return track_changes(super().pop(key, *args), self.tracker)
+
+    def popitem(self) -> tuple[Any, Any]:
+        self.tracker.changed = True
+        key, value = super().popitem()
+        return key, track_changes(value, self.tracker)
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            self.tracker.changed = True
+            super().__setitem__(key, default)
+        return self[key]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self.tracker.changed = True
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        self.tracker.changed = True
+        super().__delitem__(key)
+
+    def __ior__(self, other: Any) -> "TrackedDict":
+        self.tracker.changed = True
+        return super().__ior__(other)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        self.tracker.changed = True
+        super().update(*args, **kwargs)
+
+    def clear(self) -> None:
+        self.tracker.changed = True
+        super().clear()
+
+
+class RawStreamValue(StreamValue):  # type: ignore[misc]
+    """
+    A `StreamValue` used when migrating, where block definitions are
+    unavailable and only the raw data is of any use.
+
+    Values loaded from the database (see `RawStreamValue.from_json()`) keep
+    the stored JSON string in `raw_json`, and only decode it the first time
+    `raw_data` (or `raw_text`) is accessed. Changes to the decoded data are
+    tracked, so that values that haven't changed (see `has_changed`) can be
+    written back to the database as-is, without being encoded again.
+    """
+
+    raw_json: str | None = None
+    is_decoded = True
+
+    def __init__(
+        self,
+        stream_block: StreamBlock,
+        raw_data: Any = None,
+        *,
+        raw_text: str | None = None,
+    ) -> None:
+        # StreamValue.__init__() isn't called, as it would assign the raw data
+        # and text through the setters below, which mark the value as changed
+        self.stream_block = stream_block
+        self.is_lazy = True
+        self._bound_blocks: list[Any] = []
+        self._tracker = ChangeTracker()
+        self._decoded_raw_data = [] if raw_data is None else raw_data
+        self._raw_text = raw_text
+
+    @classmethod
+    def from_json(
+        cls, stream_block: StreamBlock, raw_json: str, codec: JSONCodec
+    ) -> "RawStreamValue":
+        value = cls(stream_block)
+        value.raw_json = raw_json
+        value.is_decoded = False
+        value._codec = codec
+        return value
+
+    @property
+    def has_changed(self) -> bool:
+        """
+        Whether the value differs from the one loaded from the database.
+        Always `True` for values that weren't loaded from the database.
+        """
+        return self.raw_json is None or self._tracker.changed
+
+    def decode(self) -> None:
+        if not self.is_decoded and self.raw_json is not None:
+            started = instrumentation.start()
+            raw_data, raw_text = decode_raw_json(self.raw_json, self._codec)
+            instrumentation.record(
+                getattr(self, "_stream_field", None),
+                "decode",
+                started,
+                len(self.raw_json),
+            )
+            self.is_decoded = True
+            self._decoded_raw_data = track_changes(raw_data, self._tracker)
+            self._raw_text = raw_text
+
+    @property
+    def raw_data(self) -> Any:
+        # Wagtail's `RawDataView` keeps raw data in sync with bound blocks,
+        # which never exist when migrating (and it fails to delete or replace
+        # items as a result), so the raw data itself is returned instead
+        return self._raw_data
+
+    @property
+    def _raw_data(self) -> Any:
+        self.decode()
+        return self._decoded_raw_data
+
+    @_raw_data.setter
+    def _raw_data(self, value: Any) -> None:
+        self.decode()
+        self._tracker.changed = True
+        self._decoded_raw_data = value
+
+    @property
+    def raw_text(self) -> str | None:
+        self.decode()
+        return self._raw_text
+
+    @raw_text.setter
+    def raw_text(self, value: str | None) -> None:
+        self.decode()
+        self._tracker.changed = True
+        self._raw_text = value
+
+
+def copy_raw_data(item: Any) -> Any:
+    """
+    Return a deep copy of the raw data `item`, with plain dicts and lists in
+    place of change-tracking ones (which aren't converted along the way).
+    """
+    if isinstance(item, dict):
+        return {key: copy_raw_data(child) for key, child in dict.items(item)}
+    if isinstance(item, list):
+        return [copy_raw_data(child) for child in list.__iter__(item)]
+    return item
+
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def skip_whitespace(value: str, i: int = 0) -> int:
+    """
+    Return the index of the first character of `value` from `i` that isn't
+    JSON whitespace.
+    """
+    # The pattern matches the empty string, so it always matches
+    return WHITESPACE.match(value, i).end()  # type: ignore[union-attr]
+
+
+def iter_raw_blocks(value: RawStreamValue | str) -> Iterator[Any]:
+    """
+    Yield the top-level blocks of a stored StreamField value (a
+    `RawStreamValue` or the JSON string itself) one at a time, decoding each
+    block only when it is reached, so that memory use depends on the size of
+    the largest block rather than the size of the whole value.
+
+    Blocks are yielded as plain data, and changing them doesn't change
+    `value`. Iterating over a `RawStreamValue` that hasn't been decoded yet
+    doesn't decode it, so it is still written back unchanged when saved.
+    For values that have been decoded and changed, copies of their blocks
+    are yielded.
+
+    Values that aren't JSON arrays (e.g. plain text) have no blocks. As
+    blocks are decoded in turn, a `ValueError` for invalid JSON may only be
+    raised after some blocks have already been yielded. Python's `json`
+    module is always used, as other codecs can't decode part of a document.
+    """
+    if isinstance(value, RawStreamValue):
+        if value.raw_json is None or (value.is_decoded and value.has_changed):
+            if isinstance(value.raw_data, list):
+                for block in list.__iter__(value.raw_data):
+                    yield copy_raw_data(block)
+            return
+        # Unchanged values are decoded again, one block at a time
+        value = value.raw_json
+    decoder = json.JSONDecoder()
+    i = skip_whitespace(value)
+    if value.startswith('"', i):
+        # Values written by earlier versions of this package were encoded
+        # twice (see `decode_raw_json()`)
+        try:
+            value = decoder.decode(value)
+        except ValueError:
+            return
+        if not isinstance(value, str):
+            return
+        i = skip_whitespace(value)
+    if not value.startswith("[", i):
+        return
+    i = skip_whitespace(value, i + 1)
+    if value.startswith("]", i):
+        i += 1
+    else:
+        while True:
+            block, i = decoder.raw_decode(value, i)
+            yield block
+            i = skip_whitespace(value, i)
+            if value.startswith(",", i):
+                i = skip_whitespace(value, i + 1)
+            elif value.startswith("]", i):
+                i += 1
+                break
+            else:
+                raise json.JSONDecodeError("Expecting ',' delimiter", value, i)
+    i = skip_whitespace(value, i)
+    if i != len(value):
+        raise json.JSONDecodeError("Extra data", value, i)
@@ -0,0 +1,542 @@
+import asyncio
+import json
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.utils import timezone
+from testapp.constants import ORIGINAL_BODY_VALUE, TEXT_BLOCK_ID
+from testapp.models import TestPage, TestSnippet
+from testapp.utils import get_historical_model
+from wagtail.models import Revision
+
+from mlstreamfield.bulk import (
+    Checkpoint,
+    atransform_raw_data,
+    get_revisions,
+    init_worker,
+    iter_batches,
+    preview_transform,
+    replay_reverse_patches,
+    rewrite_raw_json,
+    transform_raw_data,
+    transform_revisions,
+)
+from mlstreamfield.codecs import get_codec
+from mlstreamfield.transforms import RawDataTransformer, RenameBlock
+
+
+def shout(raw_data):
+    for block in raw_data:
+        if block["type"] == "text":
+            block["value"] = block["value"].upper()
+
+
+def read_only(raw_data):
+    for block in raw_data:
+        block["value"]
+
+
+class TestTransformRawData(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestPage = get_historical_model("TestPage")
+        cls.TestSnippet = get_historical_model("TestSnippet")
+
+    def get_text_values(self, model):
+        return [obj.body.raw_data[0]["value"] for obj in model.objects.order_by("pk")]
+
+    def test_iter_batches_only_loads_pk_and_field(self):
+        batches = list(iter_batches(self.TestSnippet.objects.all(), "body", 3))
+        self.assertEqual([len(batch) for batch in batches], [3, 1])
+        for obj in batches[0]:
+            self.assertEqual(obj.get_deferred_fields(), {"title"})
+
+    def test_transform_in_place(self):
+        for model in [self.TestPage, self.TestSnippet]:
+            with self.subTest(model=model):
+                result = transform_raw_data(model, "body", shout, batch_size=3)
+                self.assertEqual(result.processed, 4)
+                self.assertEqual(result.changed, 4)
+                self.assertEqual(
+                    self.get_text_values(model),
+                    ["HELLO WORLD!", "GOODBYE GALAXY!"] * 2,
+                )
+
+    def test_transform_returning_new_value(self):
+        result = transform_raw_data(
+            self.TestSnippet.objects.filter(title__contains="Tres"),
+            "body",
+            lambda raw_data: raw_data[:1],
+        )
+        self.assertEqual(result, (1, 1))
+        snippet = self.TestSnippet.objects.get(title__contains="Tres")
+        self.assertEqual(list(snippet.body.raw_data), ORIGINAL_BODY_VALUE[:1])
+
+    def test_unchanged_values_are_not_written(self):
+        with self.assertNumQueries(3):
+            # One query per batch, plus a final empty one, and no updates
+            result = transform_raw_data(
+                self.TestSnippet, "body", lambda raw_data: None, batch_size=2
+            )
+        self.assertEqual(result, (4, 0))
+
+    def test_transform_in_worker_processes(self):
+        result = transform_raw_data(
+            self.TestSnippet, "body", shout, batch_size=1, workers=2
+        )
+        self.assertEqual(result, (4, 4))
+        self.assertEqual(
+            self.get_text_values(self.TestSnippet),
+            ["HELLO WORLD!", "GOODBYE GALAXY!"] * 2,
+        )
+        # Unchanged values are still not written
+        with self.assertNumQueries(1):
+            result = transform_raw_data(self.TestSnippet, "body", read_only, workers=2)
+        self.assertEqual(result, (4, 0))
+
+
+class Interrupted(Exception):
+    pass
+
+
+def exclaim(raw_data):
+    raw_data[0]["value"] += "!"
+
+
+def exclaim_until_goodbye(raw_data):
+    if raw_data[0]["value"].startswith("Goodbye"):
+        raise Interrupted
+    exclaim(raw_data)
+
+
+class TestAsyncTransformRawData(TestCase):
+    def get_text_values(self, model):
+        return [obj.body.raw_data[0]["value"] for obj in model.objects.order_by("pk")]
+
+    async def test_transform_several_models_at_once(self):
+        # Historical models, as in data migrations, work too
+        HistoricalSnippet = await sync_to_async(get_historical_model)("TestSnippet")
+        results = await asyncio.gather(
+            atransform_raw_data(TestPage, "body", shout, batch_size=3),
+            atransform_raw_data(HistoricalSnippet.objects.all(), "body", shout),
+        )
+        self.assertEqual(results, [(4, 4), (4, 4)])
+        for model in [TestPage, HistoricalSnippet]:
+            values = await sync_to_async(self.get_text_values)(model)
+            self.assertEqual(values, ["HELLO WORLD!", "GOODBYE GALAXY!"] * 2)
+
+    async def test_unchanged_values_are_not_written(self):
+        with mock.patch.object(QuerySet, "abulk_update") as abulk_update:
+            result = await atransform_raw_data(
+                TestSnippet, "body", read_only, batch_size=3
+            )
+        self.assertEqual(result, (4, 0))
+        abulk_update.assert_not_called()
+
+    async def test_process_pool_executor(self):
+        with ProcessPoolExecutor(
+            max_workers=2,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        ) as executor:
+            result = await atransform_raw_data(
+                TestSnippet.objects.filter(title__contains="Tres"),
+                "body",
+                shout,
+                executor=executor,
+            )
+        self.assertEqual(result, (1, 1))
+        snippet = await TestSnippet.objects.aget(title__contains="Tres")
+        self.assertEqual(snippet.body[0].value, "HELLO WORLD!")
+
+
+class TestCheckpoints(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestSnippet = get_historical_model("TestSnippet")
+        cls.TransformCheckpoint = get_historical_model(
+            "TransformCheckpoint", "mlstreamfield"
+        )
+
+    def get_text_values(self):
+        return [
+            obj.body.raw_data[0]["value"]
+            for obj in self.TestSnippet.objects.order_by("pk")
+        ]
+
+    def test_resume_after_interruption(self):
+        with self.assertRaises(Interrupted):
+            transform_raw_data(
+                self.TestSnippet,
+                "body",
+                exclaim_until_goodbye,
+                batch_size=1,
+                checkpoint="exclaim",
+            )
+        first_pk = self.TestSnippet.objects.order_by("pk")[0].pk
+        checkpoint = self.TransformCheckpoint.objects.get(key="exclaim")
+        self.assertEqual(
+            (checkpoint.model, checkpoint.field_name, checkpoint.last_pk),
+            ("testapp.testsnippet", "body", str(first_pk)),
+        )
+        self.assertEqual((checkpoint.processed, checkpoint.changed), (1, 1))
+
+        result = transform_raw_data(
+            self.TestSnippet, "body", exclaim, batch_size=1, checkpoint="exclaim"
+        )
+        # The counts include the interrupted run, and the first value was
+        # only changed once
+        self.assertEqual(result, (4, 4))
+        self.assertEqual(
+            self.get_text_values(), ["Hello World!!", "Goodbye Galaxy!!"] * 2
+        )
+        self.assertFalse(self.TransformCheckpoint.objects.exists())
+
+    def test_resume_in_worker_processes(self):
+        first_pk = self.TestSnippet.objects.order_by("pk")[0].pk
+        self.TransformCheckpoint.objects.create(
+            key="shout",
+            model="testapp.testsnippet",
+            field_name="body",
+            last_pk=str(first_pk),
+            processed=1,
+        )
+        result = transform_raw_data(
+            self.TestSnippet, "body", shout, workers=2, checkpoint="shout"
+        )
+        self.assertEqual(result, (4, 3))
+        self.assertEqual(
+            self.get_text_values(),
+            ["Hello World!", "GOODBYE GALAXY!", "HELLO WORLD!", "GOODBYE GALAXY!"],
+        )
+        self.assertFalse(self.TransformCheckpoint.objects.exists())
+
+    def test_key_for_another_field(self):
+        self.TransformCheckpoint.objects.create(
+            key="shout", model="testapp.testpage", field_name="body", last_pk="1"
+        )
+        with self.assertRaisesMessage(ValueError, "is for testapp.testpage.body"):
+            transform_raw_data(self.TestSnippet, "body", shout, checkpoint="shout")
+
+    def test_requires_mlstreamfield_app(self):
+        apps = self.TestSnippet._meta.apps
+        with (
+            mock.patch.object(apps, "get_model", side_effect=LookupError),
+            self.assertRaisesMessage(ValueError, "('mlstreamfield', '0001_initial')"),
+        ):
+            Checkpoint(self.TestSnippet.objects.all(), "body", "shout")
+
+    def test_skips_values_transform_does_not_apply_to(self):
+        transform = RawDataTransformer([RenameBlock("text", "heading")])
+        self.assertEqual(
+            transform_raw_data(self.TestSnippet, "body", transform), (4, 4)
+        )
+        with mock.patch.object(transform, "transform_children") as transform_children:
+            result = transform_raw_data(self.TestSnippet, "body", transform)
+        self.assertEqual(result, (4, 0))
+        transform_children.assert_not_called()
+
+
+def replace_body(raw_data):
+    return [{"type": "text", "value": "Replaced", "id": "replaced"}]
+
+
+class TestReversePatches(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestSnippet = get_historical_model("TestSnippet")
+        cls.ReversePatch = get_historical_model("ReversePatch", "mlstreamfield")
+
+    def get_raw_data(self):
+        return [
+            list(obj.body.raw_data) for obj in self.TestSnippet.objects.order_by("pk")
+        ]
+
+    def test_replay(self):
+        original = self.get_raw_data()
+        result = transform_raw_data(
+            self.TestSnippet, "body", replace_body, reverse_patches="replace"
+        )
+        self.assertEqual(result, (4, 4))
+        patch = self.ReversePatch.objects.order_by("pk").first()
+        self.assertEqual(
+            (patch.key, patch.model, patch.field_name),
+            ("replace", "testapp.testsnippet", "body"),
+        )
+        self.assertEqual(patch.patch[0], ["remove", "replaced"])
+
+        result = replay_reverse_patches(
+            self.TestSnippet, "body", "replace", batch_size=3
+        )
+        self.assertEqual(result, (4, 4))
+        self.assertEqual(self.get_raw_data(), original)
+        self.assertFalse(self.ReversePatch.objects.exists())
+
+    def test_replay_raw_text(self):
+        # As converted from a text field
+        snippet = self.TestSnippet.objects.order_by("pk").first()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE testapp_testsnippet SET body = %s WHERE id = %s",
+                [json.dumps("Not StreamField data"), snippet.pk],
+            )
+        snippet.refresh_from_db()
+        stored = snippet.body.raw_json
+        original = self.get_raw_data()[1:]
+
+        transform_raw_data(
+            self.TestSnippet, "body", replace_body, reverse_patches="replace"
+        )
+        self.assertEqual(
+            self.ReversePatch.objects.get(object_pk=str(snippet.pk)).patch,
+            [["raw", stored]],
+        )
+        replay_reverse_patches(self.TestSnippet, "body", "replace")
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.body.raw_text, "Not StreamField data")
+        self.assertEqual(self.get_raw_data()[1:], original)
+
+    def test_replay_in_worker_processes(self):
+        original = self.get_raw_data()
+        transform_raw_data(
+            self.TestSnippet, "body", shout, workers=2, reverse_patches="shout"
+        )
+        # Patches only include what was changed
+        self.assertEqual(
+            sorted(self.ReversePatch.objects.values_list("patch", flat=True)),
+            [
+                [["change", TEXT_BLOCK_ID, "value", "Goodbye Galaxy!"]],
+                [["change", TEXT_BLOCK_ID, "value", "Goodbye Galaxy!"]],
+                [["change", TEXT_BLOCK_ID, "value", "Hello World!"]],
+                [["change", TEXT_BLOCK_ID, "value", "Hello World!"]],
+            ],
+        )
+        replay_reverse_patches(self.TestSnippet, "body", "shout")
+        self.assertEqual(self.get_raw_data(), original)
+
+    def test_unchanged_values(self):
+        result = transform_raw_data(
+            self.TestSnippet, "body", read_only, reverse_patches="read"
+        )
+        self.assertEqual(result, (4, 0))
+        self.assertFalse(self.ReversePatch.objects.exists())
+
+    def test_resume_after_interruption(self):
+        original = self.get_raw_data()
+        with self.assertRaises(Interrupted):
+            transform_raw_data(
+                self.TestSnippet,
+                "body",
+                exclaim_until_goodbye,
+                batch_size=1,
+                checkpoint="exclaim",
+                reverse_patches="exclaim",
+            )
+        self.assertEqual(self.ReversePatch.objects.count(), 1)
+        # A new run with the same key (rather than a resumed one) isn't allowed
+        with self.assertRaisesMessage(ValueError, "'exclaim' already exist"):
+            transform_raw_data(
+                self.TestSnippet, "body", exclaim, reverse_patches="exclaim"
+            )
+
+        transform_raw_data(
+            self.TestSnippet,
+            "body",
+            exclaim,
+            batch_size=1,
+            checkpoint="exclaim",
+            reverse_patches="exclaim",
+        )
+        self.assertEqual(self.ReversePatch.objects.count(), 4)
+        self.assertEqual(
+            replay_reverse_patches(self.TestSnippet, "body", "exclaim"), (4, 4)
+        )
+        self.assertEqual(self.get_raw_data(), original)
+
+    def test_patches_for_another_field(self):
+        transform_raw_data(self.TestSnippet, "body", shout, reverse_patches="shout")
+        TestPage = get_historical_model("TestPage")
+        with self.assertRaisesMessage(ValueError, "are for testapp.testsnippet.body"):
+            replay_reverse_patches(TestPage, "body", "shout")
+
+    def test_patch_does_not_apply(self):
+        transform_raw_data(
+            self.TestSnippet, "body", replace_body, reverse_patches="replace"
+        )
+        snippet = self.TestSnippet.objects.order_by("pk").first()
+        snippet.body = []
+        snippet.save()
+        with self.assertRaisesMessage(ValueError, "can't be applied"):
+            replay_reverse_patches(self.TestSnippet, "body", "replace")
+
+    def test_requires_mlstreamfield_app(self):
+        apps = self.TestSnippet._meta.apps
+        with (
+            mock.patch.object(apps, "get_model", side_effect=LookupError),
+            self.assertRaisesMessage(
+                ValueError, "('mlstreamfield', '0002_reversepatch')"
+            ),
+        ):
+            replay_reverse_patches(self.TestSnippet, "body", "shout")
+
+
+class TestRewriteRawJSON(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestPage = get_historical_model("TestPage")
+        for page in TestPage.objects.all():
+            page.save_revision()
+
+    def test_rewrite(self):
+        codec = get_codec(compact=True)
+        with self.assertNumQueries(1):
+            preview = rewrite_raw_json(self.TestPage, "body", codec=codec, dry_run=True)
+        self.assertEqual(preview[:2], (4, 4))
+        self.assertLess(preview.bytes_after, preview.bytes_before)
+
+        result = rewrite_raw_json(self.TestPage, "body", codec=codec)
+        self.assertEqual(result, preview)
+        self.assertEqual(result.bytes_saved, preview.bytes_before - preview.bytes_after)
+        for page in self.TestPage.objects.all():
+            self.assertEqual(page.body.raw_json, codec.dumps(page.body.raw_data))
+        self.assertEqual(
+            [page.body.raw_data[0]["value"] for page in self.TestPage.objects.all()],
+            ["Hello World!", "Goodbye Galaxy!"] * 2,
+        )
+        # Values already in the same form are not written again
+        result = rewrite_raw_json(self.TestPage, "body", codec=codec)
+        self.assertEqual(result[:2], (4, 0))
+        self.assertEqual(result.bytes_saved, 0)
+
+    def test_rewrite_revisions(self):
+        codec = get_codec(compact=True)
+        result = rewrite_raw_json(self.TestPage, "body", codec=codec, revisions=True)
+        self.assertEqual(result[:2], (4, 4))
+        self.assertGreater(result.bytes_saved, 0)
+        for revision in Revision.objects.all():
+            body = revision.content["body"]
+            self.assertEqual(body, codec.dumps(json.loads(body)))
+
+
+class TestPreviewTransform(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestSnippet = get_historical_model("TestSnippet")
+
+    def test_nothing_is_written(self):
+        with self.assertNumQueries(3):
+            # A count, and two batches
+            preview = preview_transform(self.TestSnippet, "body", shout, batch_size=3)
+        self.assertEqual((preview.total, preview.processed, preview.changed), (4, 4, 4))
+        self.assertEqual(preview.changed_ratio, 1)
+        self.assertGreater(preview.rows_per_second, 0)
+        self.assertEqual(preview.bytes_after, preview.bytes_before)
+        self.assertEqual(preview.bytes_written, preview.bytes_after)
+        self.assertEqual(len(preview.examples), 3)
+        pk, diff = preview.examples[0]
+        self.assertIn(f"--- {pk} (before)", diff)
+        self.assertIn('-    "value": "Hello World!",', diff)
+        self.assertIn('+    "value": "HELLO WORLD!",', diff)
+        self.assertEqual(
+            [obj.body.raw_data[0]["value"] for obj in self.TestSnippet.objects.all()],
+            ["Hello World!", "Goodbye Galaxy!"] * 2,
+        )
+
+    def test_unchanged_values(self):
+        preview = preview_transform(self.TestSnippet, "body", read_only)
+        self.assertEqual((preview.changed, preview.bytes_written), (0, 0))
+        self.assertEqual(preview.bytes_after, preview.bytes_before)
+        self.assertEqual(preview.examples, [])
+
+    def test_sample(self):
+        preview = preview_transform(
+            self.TestSnippet,
+            "body",
+            lambda raw_data: raw_data[:1],
+            sample=2,
+            examples=1,
+        )
+        self.assertEqual((preview.total, preview.processed), (4, 2))
+        self.assertEqual(preview.changed, 2)
+        self.assertLess(preview.bytes_after, preview.bytes_before)
+        self.assertEqual(len(preview.examples), 1)
+        self.assertEqual(len(preview.summary()), 3)
+
+
+class TestTransformRevisions(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestPage = get_historical_model("TestPage")
+        cls.pages = list(TestPage.objects.order_by("pk"))
+        for page in cls.pages:
+            # An older revision, and the latest one
+            page.save_revision()
+            page.save_revision()
+
+    def get_text_values(self, **filters):
+        return [
+            json.loads(revision.content["body"])[0]["value"]
+            for revision in Revision.objects.filter(**filters).order_by("pk")
+        ]
+
+    def test_all_revisions(self):
+        original = self.get_text_values()
+        result = transform_revisions(self.TestPage, "body", shout, batch_size=3)
+        self.assertEqual(result, (8, 8))
+        self.assertEqual(self.get_text_values(), [v.upper() for v in original])
+        # Unchanged values are not written
+        with self.assertNumQueries(3):
+            result = transform_revisions(self.TestPage, "body", read_only, batch_size=3)
+        self.assertEqual(result, (8, 0))
+
+    def test_latest_revisions_only(self):
+        scheduled = self.pages[0].revisions.order_by("pk").first()
+        scheduled.approved_go_live_at = timezone.now() + timedelta(days=1)
+        scheduled.save()
+        original = self.get_text_values()
+
+        result = transform_revisions(self.TestPage, "body", shout, latest_only=True)
+        self.assertEqual(result, (5, 5))
+        # Revisions were created in pairs, with the latest second
+        self.assertEqual(
+            self.get_text_values(),
+            [
+                value if i % 2 == 0 and i > 0 else value.upper()
+                for i, value in enumerate(original)
+            ],
+        )
+
+    def test_filtered_queryset(self):
+        page = self.pages[1]
+        result = transform_revisions(
+            self.TestPage.objects.filter(pk=page.pk), "body", shout
+        )
+        self.assertEqual(result, (2, 2))
+        self.assertEqual(
+            self.get_text_values(object_id=str(page.pk)), ["GOODBYE GALAXY!"] * 2
+        )
+        self.assertEqual(
+            self.get_text_values(object_id=str(self.pages[0].pk)),
+            ["Hello World!"] * 2,
+        )
+
+    def test_transform_in_worker_processes(self):
+        original = self.get_text_values()
+        result = transform_revisions(
+            self.TestPage, "body", shout, batch_size=1, workers=2
+        )
+        self.assertEqual(result, (8, 8))
+        self.assertEqual(self.get_text_values(), [v.upper() for v in original])
+
+    def test_latest_only_requires_latest_revision_field(self):
+        with self.assertRaisesMessage(ValueError, "latest revision"):
+            get_revisions(
+                get_historical_model("TestSnippet").objects.all(), latest_only=True
+            )
@@ -0,0 +1,139 @@
+import json
+import pickle
+
+from unittest import skipUnless
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from testapp.constants import ORIGINAL_BODY_VALUE
+from testapp.models import TestSnippet
+from wagtail.blocks import CharBlock
+
+from mlstreamfield.codecs import CODECS, JSONCodec, _get_codec, get_codec
+from mlstreamfield.fields import StreamField
+
+
+class TestCodecs(SimpleTestCase):
+    def setUp(self):
+        _get_codec.cache_clear()
+        self.addCleanup(_get_codec.cache_clear)
+
+    def test_get_codec_uses_setting(self):
+        with override_settings(MLSTREAMFIELD_JSON_CODEC="json"):
+            self.assertIs(type(get_codec()), JSONCodec)
+
+    def test_get_codec_with_import_path(self):
+        codec = get_codec("mlstreamfield.codecs.JSONCodec")
+        self.assertIs(type(codec), JSONCodec)
+
+    def test_get_codec_with_invalid_name(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_codec("not-a-codec")
+
+    def test_auto_codec_is_available(self):
+        self.assertTrue(type(get_codec("auto")).is_available())
+
+    def test_all_available_codecs_produce_identical_results(self):
+        # Every installed codec must decode to the same value, and encode
+        # to exactly the same string as the standard library
+        values = [
+            json.dumps(ORIGINAL_BODY_VALUE),
+            '[{"type": "text", "value": "Caf\\u00e9 \\ud83d\\ude00 / <b>"}]',
+            '[{"type": "big", "value": 123456789012345678901234567890}]',
+            '[{"type": "float", "value": 0.1, "other": 1e100, "nan": NaN}]',
+        ]
+        for name, codec_class in CODECS.items():
+            if not codec_class.is_available():
+                continue
+            codec = get_codec(name)
+            for value in values:
+                with self.subTest(codec=name, value=value):
+                    decoded = codec.loads(value)
+                    self.assertEqual(repr(decoded), repr(json.loads(value)))
+                    self.assertEqual(codec.dumps(decoded), json.dumps(decoded))
+
+    def test_all_available_codecs_reject_invalid_json(self):
+        for name, codec_class in CODECS.items():
+            if not codec_class.is_available():
+                continue
+            with self.subTest(codec=name), self.assertRaises(ValueError):
+                get_codec(name).loads("invalid json")
+
+    @skipUnless(CODECS["msgspec"].is_available(), "msgspec is not installed")
+    def test_field_json_codec_kwarg(self):
+        field = StreamField(json_codec="msgspec")
+        self.assertEqual(field.codec.name, "msgspec")
+        _, _, _, kwargs = field.deconstruct()
+        self.assertEqual(kwargs["json_codec"], "msgspec")
+
+    def test_field_json_codec_kwarg_omitted_from_deconstruct_by_default(self):
+        _, _, _, kwargs = StreamField().deconstruct()
+        self.assertNotIn("json_codec", kwargs)
+
+    def test_compact_codec(self):
+        value = [{"type": "text", "value": "Café", "id": "1"}]
+        self.assertEqual(get_codec().dumps(value), json.dumps(value))
+        compact = get_codec(compact=True)
+        self.assertEqual(
+            compact.dumps(value), '[{"id":"1","type":"text","value":"Caf\\u00e9"}]'
+        )
+        self.assertEqual(
+            get_codec(compact=True, ensure_ascii=False).dumps(value),
+            '[{"id":"1","type":"text","value":"Café"}]',
+        )
+        self.assertIsNot(compact, get_codec())
+        # Options survive being sent to worker processes
+        restored = pickle.loads(pickle.dumps(compact))  # noqa: S301
+        self.assertIs(type(restored), type(compact))
+        self.assertEqual(restored.dumps(value), compact.dumps(value))
+
+    def test_field_compact_json_kwargs(self):
+        field = StreamField(
+            [("text", CharBlock())], compact_json=True, json_ensure_ascii=False
+        )
+        field.set_attributes_from_name("body")
+        _, _, _, kwargs = field.deconstruct()
+        self.assertEqual(kwargs["compact_json"], True)
+        self.assertEqual(kwargs["json_ensure_ascii"], False)
+        self.assertTrue(field.clone().codec.compact)
+        self.assertNotIn("compact_json", StreamField().deconstruct()[3])
+
+        # Values are written in the same form outside migrations, including in
+        # revisions (using value_to_string())
+        value = field.to_python([{"type": "text", "value": "Café", "id": "1"}])
+        expected = '[{"id":"1","type":"text","value":"Café"}]'
+        self.assertEqual(field.get_prep_value(value), expected)
+        snippet = TestSnippet(body=[])
+        snippet.body = value
+        self.assertEqual(field.value_to_string(snippet), expected)
+
+
+class TestStoredFormat(TestCase):
+    def get_stored_value(self, snippet):
+        table = connection.ops.quote_name(TestSnippet._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT body FROM {table} WHERE id = %s",  # noqa: S608
+                [snippet.id],
+            )
+            stored = cursor.fetchone()[0]
+        if isinstance(stored, str):
+            stored = json.loads(stored)
+        return stored
+
+    def test_values_written_in_migrations_are_stored_as_json_documents(self):
+        # Values written in `0004_modify_body_values` must not be encoded twice
+        snippet = TestSnippet.objects.order_by("id")[1]
+        self.assertIsInstance(self.get_stored_value(snippet), list)
+
+    def test_saved_values_are_stored_as_json_documents(self):
+        # Before Wagtail 6.0, Wagtail's get_prep_value() returns JSON strings
+        snippet = TestSnippet.objects.create(title="Saved", body=[("text", "Hi")])
+        self.assertEqual(self.get_stored_value(snippet)[0]["value"], "Hi")
+
+    def test_double_encoded_values_are_decoded_during_migration(self):
+        field = StreamField().clone()  # Rebuilt from deconstruct(), as when migrating
+        value = json.dumps(json.dumps(ORIGINAL_BODY_VALUE))
+        result = field.from_db_value(value, None, connection)
+        self.assertEqual(list(result.raw_data), ORIGINAL_BODY_VALUE)
@@ -0,0 +1,89 @@
+import json
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from testapp.models import TestPage, TestSnippet
+from testapp.utils import get_historical_model
+
+
+class TestCompactStreamFields(TestCase):
+    def call_command(self, *args, **kwargs):
+        stdout = StringIO()
+        call_command("compact_streamfields", *args, stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def compact_json(self, model):
+        field = model._meta.get_field("body")
+        return mock.patch.object(field, "compact_json", new=True)
+
+    def test_no_fields(self):
+        output = self.call_command()
+        self.assertIn("No StreamFields with compact_json", output)
+
+    def test_rewrite(self):
+        for page in TestPage.objects.all():
+            page.save_revision()
+        with self.compact_json(TestPage), self.compact_json(TestSnippet):
+            output = self.call_command(
+                "--field", "testapp.TestPage.body", revisions=True, dry_run=True
+            )
+            self.assertIn("testapp.TestPage.body: 4 of 4 value(s) would be", output)
+            self.assertIn("testapp.TestPage.body (revisions): 4 of 4 value(s)", output)
+            self.assertNotIn("TestSnippet", output)
+            self.assertIn("Total: 8 of 8 value(s)", output)
+            HistoricalSnippet = get_historical_model("TestSnippet")
+            stored = [
+                snippet.body.raw_json for snippet in HistoricalSnippet.objects.all()
+            ]
+
+            output = self.call_command("testapp")
+            self.assertIn("testapp.TestSnippet.body: 4 of 4 value(s) rewritten", output)
+            self.assertIn("testapp.TestPage.body: 4 of 4 value(s) rewritten", output)
+            self.assertNotIn("(revisions)", output)
+            for snippet, before in zip(
+                HistoricalSnippet.objects.all(), stored, strict=True
+            ):
+                self.assertLess(len(snippet.body.raw_json), len(before))
+
+            output = self.call_command("--field", "testapp.testsnippet.body")
+            self.assertIn("0 of 4 value(s) rewritten", output)
+            self.assertIn("(0 saved, 0.0%)", output)
+
+    def test_json_strings_are_rewritten_on_every_vendor(self):
+        # As written by earlier versions of this package
+        snippet = TestSnippet.objects.first()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE testapp_testsnippet SET body = %s WHERE id = %s",
+                [json.dumps(json.dumps(snippet.body.get_prep_value())), snippet.pk],
+            )
+        HistoricalSnippet = get_historical_model("TestSnippet")
+        stored = {
+            snippet.pk: snippet.body.raw_json
+            for snippet in HistoricalSnippet.objects.all()
+        }
+        with (
+            self.compact_json(TestSnippet),
+            mock.patch(
+                "mlstreamfield.management.commands.compact_streamfields"
+                ".stores_json_as_text",
+                return_value=False,
+            ),
+        ):
+            output = self.call_command("--field", "testapp.TestSnippet.body")
+        self.assertIn("only values stored as JSON strings", output)
+        self.assertIn("testapp.TestSnippet.body: 1 of 4 value(s) rewritten", output)
+        for obj in HistoricalSnippet.objects.all():
+            if obj.pk == snippet.pk:
+                self.assertTrue(obj.body.raw_json.startswith("["))
+                self.assertEqual(obj.body.raw_data, snippet.body.get_prep_value())
+            else:
+                self.assertEqual(obj.body.raw_json, stored[obj.pk])
+
+    def test_unknown_field(self):
+        with self.assertRaisesMessage(CommandError, "testapp.testsnippet.title"):
+            self.call_command("--field", "testapp.TestSnippet.title")
@@ -0,0 +1,168 @@
+import copy
+import random
+
+from django.test import SimpleTestCase
+from testapp.constants import (
+    DATE_BLOCK_ID,
+    INTEGER_BLOCK_ID,
+    MODIFIED_BODY_VALUE,
+    ORIGINAL_BODY_VALUE,
+    TEXT_BLOCK_ID,
+)
+
+from mlstreamfield.diff import (
+    apply_diff,
+    describe_diff,
+    diff_raw_data,
+    longest_increasing_subsequence,
+)
+
+
+def make_stream(rng, count, prefix="", depth=0):
+    stream = []
+    for i in range(count):
+        if depth < 1 and rng.random() < 0.2:
+            value = make_stream(rng, rng.randint(0, 5), f"{prefix}{i}.", depth + 1)
+        else:
+            value = rng.randint(0, 3)
+        stream.append({"type": rng.choice("ab"), "value": value, "id": f"{prefix}{i}"})
+    return stream
+
+
+def mutate(rng, stream, prefix="new"):
+    stream = copy.deepcopy(stream)
+    if rng.random() < 0.3:
+        rng.shuffle(stream)
+    result = []
+    for i, block in enumerate(stream):
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        if roll < 0.2:
+            result.append({"type": "a", "value": 0, "id": f"{prefix}{i}"})
+        if roll < 0.3 and isinstance(block["value"], list):
+            block["value"] = mutate(rng, block["value"], f"{prefix}{i}.")
+        elif roll < 0.4:
+            block["value"] = rng.randint(0, 3)
+        elif roll < 0.45:
+            block["type"] = "c"
+        result.append(block)
+    if rng.random() < 0.5 and len(result) > 1:
+        i, j = rng.sample(range(len(result)), 2)
+        result.insert(j, result.pop(i))
+    return result
+
+
+class TestDiff(SimpleTestCase):
+    def assertApplies(self, old, new):
+        original = copy.deepcopy(old)
+        diff = diff_raw_data(old, new)
+        self.assertEqual(apply_diff(old, diff), new)
+        self.assertEqual(old, original)
+        return diff
+
+    def test_equal_values(self):
+        self.assertEqual(diff_raw_data(ORIGINAL_BODY_VALUE, ORIGINAL_BODY_VALUE), [])
+        self.assertIs(apply_diff(ORIGINAL_BODY_VALUE, []), ORIGINAL_BODY_VALUE)
+
+    def test_changed_values(self):
+        diff = self.assertApplies(ORIGINAL_BODY_VALUE, MODIFIED_BODY_VALUE)
+        self.assertEqual(
+            diff,
+            [
+                ["change", TEXT_BLOCK_ID, "value", "Goodbye Galaxy!"],
+                ["change", INTEGER_BLOCK_ID, "value", "321"],
+                ["change", DATE_BLOCK_ID, "value", "3024-12-25"],
+            ],
+        )
+
+    def test_insert_remove_and_move(self):
+        text, integer, date = ORIGINAL_BODY_VALUE
+        heading = {"type": "heading", "value": "Title", "id": "heading"}
+        renamed = {**integer, "type": "number"}
+        diff = self.assertApplies(ORIGINAL_BODY_VALUE, [heading, date, renamed])
+        self.assertEqual(
+            diff,
+            [
+                ["remove", TEXT_BLOCK_ID],
+                ["insert", 0, heading],
+                ["move", DATE_BLOCK_ID, 1],
+                ["change", INTEGER_BLOCK_ID, "type", "number"],
+            ],
+        )
+        self.assertEqual(
+            describe_diff(diff),
+            [
+                f"remove block {TEXT_BLOCK_ID}",
+                "insert heading block heading at 0",
+                f"move block {DATE_BLOCK_ID} to 1",
+                f"change type of block {INTEGER_BLOCK_ID}",
+            ],
+        )
+
+    def test_nested_streams(self):
+        old = [
+            {
+                "type": "section",
+                "value": [
+                    {"type": "item", "value": 1, "id": "a"},
+                    {"type": "item", "value": 2, "id": "b"},
+                ],
+                "id": "s",
+            }
+        ]
+        new = copy.deepcopy(old)
+        new[0]["value"].reverse()
+        del new[0]["value"][0]
+        diff = self.assertApplies(old, new)
+        self.assertEqual(diff, [["patch", "s", [["remove", "b"]]]])
+        self.assertEqual(
+            describe_diff(diff),
+            ["change value of block s:", "  remove block b"],
+        )
+
+    def test_unmatched_blocks(self):
+        # Blocks without ids, duplicate ids and values that aren't streams
+        for old, new in [
+            ([{"type": "a", "value": 1}], [{"type": "a", "value": 2}]),
+            ([{"type": "a", "id": "1"}] * 2, [{"type": "a", "id": "1"}]),
+            ("raw text", ORIGINAL_BODY_VALUE),
+            (ORIGINAL_BODY_VALUE, None),
+        ]:
+            with self.subTest(old=old, new=new):
+                self.assertEqual(self.assertApplies(old, new), [["set", new]])
+
+    def test_removed_key(self):
+        old = [{"type": "a", "value": 1, "id": "1", "extra": True}]
+        new = [{"type": "a", "value": 1, "id": "1"}]
+        self.assertEqual(
+            self.assertApplies(old, new), [["remove", "1"], ["insert", 0, new[0]]]
+        )
+
+    def test_missing_blocks(self):
+        for diff in [
+            [["remove", "1"]],
+            [["move", "1", 0]],
+            [["change", "1", "value", 2]],
+        ]:
+            with self.subTest(diff=diff), self.assertRaises(KeyError):
+                apply_diff([{"type": "a", "value": 1, "id": "2"}], diff)
+
+    def test_random_values(self):
+        rng = random.Random(42)  # noqa: S311
+        for _ in range(200):
+            old = make_stream(rng, rng.randint(0, 30))
+            new = mutate(rng, old)
+            self.assertApplies(old, new)
+            self.assertApplies(new, old)
+
+    def test_only_blocks_out_of_order_are_moved(self):
+        old = [{"type": "a", "value": i, "id": str(i)} for i in range(1000)]
+        new = [*old[1:500], old[0], *old[500:]]
+        self.assertEqual(self.assertApplies(old, new), [["move", "0", 499]])
+
+    def test_longest_increasing_subsequence(self):
+        self.assertEqual(longest_increasing_subsequence([]), set())
+        self.assertEqual(
+            longest_increasing_subsequence([3, 0, 1, 5, 2, 4]), {0, 1, 2, 4}
+        )
@@ -1,7 +1,13 @@
-from django.test import TestCase
-from wagtail.blocks import StreamBlock, StreamValue, TextBlock
+import gc
 
-from mlstreamfield.fields import StreamField
+from unittest import skipIf
+
+from django.test import TestCase, override_settings
+from wagtail import __version__ as wagtail_version
+from wagtail.blocks import CharBlock, StreamBlock, StreamValue, TextBlock
+
+from mlstreamfield.fields import StreamField, shared_stream_blocks
+from mlstreamfield.values import RawStreamValue
 
 
 class TestStreamField(TestCase):
@@ -60,7 +66,7 @@ class TestStreamField(TestCase):
     def test_to_python_with_list_value_during_migration(self):
         # Test handling of list data during database migrations
         # Should preserve raw data for later processing
-        field = StreamField()  # Empty field to simulate migration
+        field = StreamField().clone()  # Rebuilt from deconstruct(), as when migrating
         value = [{"type": "text", "value": "test"}]
         result = field.to_python(value)
         self.assertEqual(result._raw_data, value)
@@ -68,7 +74,7 @@ class TestStreamField(TestCase):
     def test_to_python_with_json_string_during_migration(self):
         # Test handling of JSON string data during database migrations
         # Should parse JSON and store as raw data
-        field = StreamField()  # Empty field to simulate migration
+        field = StreamField().clone()  # Rebuilt from deconstruct(), as when migrating
         value = '[{"type": "text", "value": "test"}]'
         result = field.to_python(value)
         self.assertEqual(result._raw_data, [{"type": "text", "value": "test"}])
@@ -76,7 +82,7 @@ class TestStreamField(TestCase):
     def test_to_python_with_invalid_json_string_during_migration(self):
         # Test handling of invalid JSON during database migrations
         # Should store invalid JSON as raw text for error handling
-        field = StreamField()  # Empty field to simulate migration
+        field = StreamField().clone()  # Rebuilt from deconstruct(), as when migrating
         value = "invalid json"
         result = field.to_python(value)
         self.assertEqual(result.raw_text, value)
@@ -84,7 +90,7 @@ class TestStreamField(TestCase):
     def test_get_prep_value_with_raw_text_during_migration(self):
         # Test preparation of raw text data for database storage during migration
         # Should preserve raw text as-is
-        field = StreamField()  # Empty field to simulate migration
+        field = StreamField().clone()  # Rebuilt from deconstruct(), as when migrating
         stream_value = StreamValue(StreamBlock([]), stream_data=[])
         stream_value.raw_text = "test value"
         result = field.get_prep_value(stream_value)
@@ -93,7 +99,7 @@ class TestStreamField(TestCase):
     def test_get_prep_value_with_raw_data_during_migration(self):
         # Test preparation of raw data for database storage during migration
         # Should convert raw data back to JSON string
-        field = StreamField()  # Empty field to simulate migration
+        field = StreamField().clone()  # Rebuilt from deconstruct(), as when migrating
         stream_value = StreamValue(StreamBlock([]), stream_data=[])
         stream_value._raw_data = [{"type": "text", "value": "test"}]
         result = field.get_prep_value(stream_value)
@@ -150,6 +156,46 @@ class TestStreamField(TestCase):
         name, path, args, kwargs = field.deconstruct()
         self.assertNotIn("block_types", kwargs)
 
+    @skipIf(wagtail_version < "6.0", "Blocks are built by __init__() before 6.0")
+    def test_deconstruct_does_not_build_blocks(self):
+        # Block definitions are discarded, so there's no need to build them
+        field = StreamField(self.block_types, blank=True)
+        field.deconstruct()
+        self.assertNotIn("stream_block", field.__dict__)
+
+    def test_deconstruct_is_cached(self):
+        field = StreamField(self.block_types, blank=True)
+        name, path, args, kwargs = field.deconstruct()
+        self.assertEqual(kwargs, {"blank": True})
+        # Changing the returned values doesn't affect later calls
+        kwargs["null"] = True
+        args.append("value")
+        self.assertEqual(field.deconstruct(), (name, path, [], {"blank": True}))
+
+    def test_deconstruct_cache_is_invalidated(self):
+        field = StreamField(self.block_types)
+        field.deconstruct()
+        field.set_attributes_from_name("body")
+        field.help_text = "Help"
+        name, _, _, kwargs = field.deconstruct()
+        self.assertEqual(name, "body")
+        self.assertEqual(kwargs, {"help_text": "Help"})
+
+    def test_migration_mode(self):
+        # Only fields rebuilt from deconstruct() output work with raw data
+        self.assertFalse(StreamField().migration_mode)
+        self.assertFalse(self.field.migration_mode)
+        self.assertTrue(StreamField().clone().migration_mode)
+        self.assertTrue(self.field.clone().migration_mode)
+
+    def test_to_python_with_empty_runtime_field(self):
+        # Runtime fields with no blocks should not be mistaken for migrating ones
+        field = StreamField()
+        value = [{"type": "text", "value": "test"}]
+        result = field.to_python(value)
+        self.assertNotIsInstance(result, RawStreamValue)
+        self.assertEqual(len(result), 0)
+
     def test_to_python_with_child_blocks(self):
         # Test that to_python uses the parent class implementation when child_blocks exist
         field = StreamField(self.block_types)  # Field with child blocks
@@ -159,3 +205,51 @@ class TestStreamField(TestCase):
         self.assertIsInstance(result, StreamValue)
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].value, "test")
+
+    @skipIf(wagtail_version < "6.0", "Blocks are built by __init__() before 6.0")
+    def test_stream_block_is_shared(self):
+        # Fields with the same block types and options share one StreamBlock
+        field = StreamField(self.block_types, verbose_name="Body", help_text="A")
+        other = StreamField(list(self.block_types), help_text="B")
+        self.assertIs(field.stream_block, self.field.stream_block)
+        self.assertIs(other.stream_block, self.field.stream_block)
+        self.assertEqual((field.help_text, other.help_text), ("A", "B"))
+
+        class BodyBlock(StreamBlock):
+            text = TextBlock()
+
+        self.assertIs(
+            StreamField(BodyBlock).stream_block, StreamField(BodyBlock).stream_block
+        )
+        self.assertIsInstance(StreamField(BodyBlock).stream_block, BodyBlock)
+
+    @skipIf(wagtail_version < "6.0", "Blocks are built by __init__() before 6.0")
+    def test_shared_stream_blocks_are_released(self):
+        field = StreamField([("text", TextBlock())])
+        key = field.get_shared_block_key()
+        self.assertIs(field.stream_block, shared_stream_blocks[key])
+        del field
+        gc.collect()
+        self.assertNotIn(key, shared_stream_blocks)
+
+    def test_stream_block_is_not_shared_with_different_definitions(self):
+        stream_block = self.field.stream_block
+        for field in [
+            StreamField([("text", CharBlock())]),
+            StreamField([("paragraph", self.block_types[0][1])]),
+            StreamField(self.block_types, blank=True),
+            StreamField(self.block_types, max_num=2),
+            StreamField(self.block_types, block_counts={"text": {"max_num": 1}}),
+        ]:
+            with self.subTest(field=field):
+                self.assertIsNot(field.stream_block, stream_block)
+        self.assertTrue(stream_block.meta.required)
+        self.assertIsNone(stream_block.meta.max_num)
+        # Fields built for migrations don't share blocks
+        self.assertIsNone(self.field.clone().get_shared_block_key())
+
+    @override_settings(MLSTREAMFIELD_SHARE_STREAM_BLOCKS=False)
+    def test_stream_block_sharing_can_be_disabled(self):
+        field = StreamField(self.block_types)
+        self.assertIsNot(field.stream_block, StreamField(self.block_types).stream_block)
+        self.assertEqual(list(field.stream_block.child_blocks), ["text"])
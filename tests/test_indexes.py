@@ -0,0 +1,63 @@
+from django.db import connection
+from django.test import SimpleTestCase
+from testapp.models import TestSnippet
+
+from mlstreamfield.indexes import BlockTypeIndex
+
+
+class PostgreSQLConnection:
+    """
+    Compiles expressions as they would be for PostgreSQL, without needing a
+    PostgreSQL database (or driver).
+    """
+
+    vendor = "postgresql"
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class TestBlockTypeIndex(SimpleTestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        self.index = BlockTypeIndex(field="body", name="snippet_body_types")
+
+    def test_deconstruct(self):
+        path, args, kwargs = self.index.deconstruct()
+        self.assertEqual(path, "mlstreamfield.indexes.BlockTypeIndex")
+        self.assertEqual(args, ())
+        self.assertEqual(kwargs, {"field": "body", "name": "snippet_body_types"})
+        self.assertEqual(self.index.clone(), self.index)
+
+    def test_does_nothing_on_other_databases(self):
+        with connection.schema_editor(collect_sql=True) as editor:
+            editor.add_index(TestSnippet, self.index)
+            editor.remove_index(TestSnippet, self.index)
+        self.assertEqual(
+            editor.collected_sql,
+            [
+                "-- Index snippet_body_types is only created on PostgreSQL "
+                "(using sqlite);"
+            ]
+            * 2,
+        )
+        # The statements can also be executed
+        with connection.schema_editor() as editor:
+            editor.add_index(TestSnippet, self.index)
+            editor.remove_index(TestSnippet, self.index)
+
+    def test_lookup_matches_indexed_expression(self):
+        query = TestSnippet.objects.filter(body__has_block_type="video").query
+        compiler = query.get_compiler(connection=connection)
+        compiler.connection = PostgreSQLConnection(connection)
+        sql, params = compiler.compile(query.where)
+        self.assertEqual(
+            sql,
+            """jsonb_path_query_array("testapp_testsnippet"."body", '$[*].type') """
+            "@> jsonb_build_array((%s)::text)",
+        )
+        self.assertEqual(list(params), ["video"])
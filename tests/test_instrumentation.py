@@ -0,0 +1,133 @@
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.db.models.signals import post_migrate
+from django.test import TestCase
+from testapp.models import TestSnippet
+from testapp.utils import get_historical_model
+
+from mlstreamfield import instrumentation
+from mlstreamfield.bulk import transform_raw_data
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.HistoricalSnippet = get_historical_model("TestSnippet")
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(instrumentation.recorder)
+        self.assertIsNone(instrumentation.start())
+        # Does nothing
+        instrumentation.record(None, "decode", None, 10)
+
+    def test_methods_are_only_wrapped_while_recording(self):
+        methods = [
+            (owner, name, method)
+            for owner, name, _, method in instrumentation.instrumented_methods
+        ]
+        self.assertEqual(len(methods), 3)
+        for owner, name, method in methods:
+            self.assertIs(owner.__dict__[name], method)
+        with instrumentation.recording():
+            for owner, name, method in methods:
+                self.assertIsNot(owner.__dict__[name], method)
+                self.assertIs(owner.__dict__[name].__wrapped__, method)
+        for owner, name, method in methods:
+            self.assertIs(owner.__dict__[name], method)
+
+        instrumentation.enable()
+        self.addCleanup(instrumentation.disable)
+        for owner, name, method in methods:
+            self.assertIsNot(owner.__dict__[name], method)
+        instrumentation.disable()
+        for owner, name, method in methods:
+            self.assertIs(owner.__dict__[name], method)
+
+    def test_migration_operations(self):
+        raw_json = [
+            snippet.body.raw_json for snippet in self.HistoricalSnippet.objects.all()
+        ]
+        with instrumentation.recording() as recorder:
+            transform_raw_data(self.HistoricalSnippet, "body", lambda raw_data: None)
+        self.assertIsNone(instrumentation.recorder)
+
+        stats = recorder.stats
+        self.assertEqual(
+            {operation for _, operation in stats},
+            {"from_db_value", "to_python", "decode", "transform"},
+        )
+        self.assertEqual({label for label, _ in stats}, {"testapp.TestSnippet.body"})
+        decode = stats["testapp.TestSnippet.body", "decode"]
+        self.assertEqual(decode.calls, 4)
+        self.assertEqual(decode.bytes, sum(map(len, raw_json)))
+        self.assertGreater(decode.seconds, 0)
+        self.assertEqual(stats["testapp.TestSnippet.body", "from_db_value"].calls, 4)
+        self.assertEqual(stats["testapp.TestSnippet.body", "transform"].calls, 4)
+
+    def test_runtime_operations(self):
+        snippet = TestSnippet.objects.first()
+        with instrumentation.recording() as recorder:
+            snippet.save()
+        prep = recorder.stats["testapp.TestSnippet.body", "get_prep_value"]
+        self.assertEqual(prep.calls, 1)
+        # The value is encoded by the database backend
+        self.assertEqual(prep.bytes, 0)
+
+        field = TestSnippet._meta.get_field("body")
+        with (
+            mock.patch.object(field, "compact_json", new=True),
+            instrumentation.recording() as recorder,
+        ):
+            snippet.save()
+            size = len(field.get_prep_value(snippet.body))
+        prep = recorder.stats["testapp.TestSnippet.body", "get_prep_value"]
+        self.assertEqual((prep.calls, prep.bytes), (2, size * 2))
+
+    def test_summary(self):
+        recorder = instrumentation.Recorder()
+        self.assertEqual(recorder.summary(), ["No StreamField operations recorded."])
+        recorder.add("app.Model.body", "get_prep_value", 0.5, 100)
+        recorder.add("app.Model.body", "decode", 0.25, 50)
+        recorder.add("app.Model.body", "decode", 0.25, 50)
+        self.assertEqual(
+            recorder.summary(),
+            [
+                "field          operation          calls        bytes         ms",
+                "app.Model.body decode                 2          100      500.0",
+                "app.Model.body get_prep_value         1          100      500.0",
+            ],
+        )
+
+    def test_summary_printed_after_migrate(self):
+        stdout = StringIO()
+        app_config = apps.get_app_config("mlstreamfield")
+        with instrumentation.recording() as recorder:
+            post_migrate.send(
+                sender=app_config, app_config=app_config, plan=[], stdout=stdout
+            )
+            self.assertEqual(stdout.getvalue(), "")
+
+            recorder.add("app.Model.body", "decode", 0.25, 50)
+            post_migrate.send(
+                sender=app_config, app_config=app_config, plan=[], stdout=stdout
+            )
+            self.assertEqual(
+                stdout.getvalue().splitlines()[:2],
+                [
+                    "StreamField instrumentation:",
+                    "  field          operation          calls        bytes         ms",
+                ],
+            )
+            # Stats are reset afterwards
+            self.assertEqual(recorder.stats, {})
+
+    def test_summary_not_printed_after_flush(self):
+        stdout = StringIO()
+        app_config = apps.get_app_config("mlstreamfield")
+        with instrumentation.recording() as recorder:
+            recorder.add("app.Model.body", "decode", 0.25, 50)
+            # As sent by flush, which has no migration plan
+            post_migrate.send(sender=app_config, app_config=app_config, stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "")
+            self.assertNotEqual(recorder.stats, {})
@@ -0,0 +1,115 @@
+import json
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import NotSupportedError, connection
+from django.db.models import F
+from django.test import TestCase
+from testapp.models import TestSnippet
+from testapp.utils import get_historical_model
+
+from mlstreamfield.lookups import BlockCount
+
+
+class TestBlockTypeQueries(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mixed = TestSnippet.objects.create(
+            title="Mixed",
+            body=[("text", "One"), ("integer", 1), ("text", "Two")],
+        )
+        cls.dates = TestSnippet.objects.create(
+            title="date", body=[("date", "2024-12-25")]
+        )
+        cls.empty = TestSnippet.objects.create(title="Empty", body=[])
+        cls.queryset = TestSnippet.objects.filter(
+            pk__in=[cls.mixed.pk, cls.dates.pk, cls.empty.pk]
+        )
+
+    def test_has_block_type(self):
+        self.assertQuerySetEqual(
+            self.queryset.filter(body__has_block_type="text"), [self.mixed]
+        )
+        self.assertQuerySetEqual(
+            self.queryset.exclude(body__has_block_type="text").order_by("pk"),
+            [self.dates, self.empty],
+        )
+        self.assertFalse(self.queryset.filter(body__has_block_type="video").exists())
+
+    def test_has_block_type_with_expression(self):
+        self.assertQuerySetEqual(
+            self.queryset.filter(body__has_block_type=F("title")), [self.dates]
+        )
+
+    def test_has_block_type_only_accepts_names(self):
+        with self.assertRaisesMessage(ValueError, "must be a block name"):
+            self.queryset.filter(body__has_block_type=["text"])
+
+    def test_has_block_type_when_migrating(self):
+        HistoricalSnippet = get_historical_model("TestSnippet")
+        self.assertEqual(
+            HistoricalSnippet.objects.filter(
+                pk__in=[self.mixed.pk, self.dates.pk], body__has_block_type="date"
+            )
+            .get()
+            .pk,
+            self.dates.pk,
+        )
+
+    def test_block_count(self):
+        counts = self.queryset.annotate(
+            blocks=BlockCount("body"), texts=BlockCount("body", "text")
+        ).order_by("pk")
+        self.assertEqual(
+            [(obj.title, obj.blocks, obj.texts) for obj in counts],
+            [("Mixed", 3, 2), ("date", 1, 0), ("Empty", 0, 0)],
+        )
+        self.assertQuerySetEqual(
+            self.queryset.alias(texts=BlockCount("body", "text")).filter(texts__gt=1),
+            [self.mixed],
+        )
+
+    def test_block_count_ignores_values_that_are_not_streams(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE testapp_testsnippet SET body = %s WHERE id = %s",
+                ['"Not a stream"', self.dates.pk],
+            )
+        # Only the count is loaded, as Wagtail can't load the value itself
+        count = (
+            self.queryset.annotate(blocks=BlockCount("body"))
+            .values_list("blocks", flat=True)
+            .get(pk=self.dates.pk)
+        )
+        self.assertEqual(count, 0)
+        self.assertFalse(
+            self.queryset.filter(
+                pk=self.dates.pk, body__has_block_type="Not a stream"
+            ).exists()
+        )
+
+    def test_double_encoded_values_are_not_matched(self):
+        # As written by earlier versions of this package, until rewritten
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE testapp_testsnippet SET body = %s WHERE id = %s",
+                [
+                    json.dumps(json.dumps(self.dates.body.get_prep_value())),
+                    self.dates.pk,
+                ],
+            )
+        queryset = self.queryset.filter(body__has_block_type="date")
+        self.assertFalse(queryset.exists())
+        call_command(
+            "compact_streamfields",
+            "--field",
+            "testapp.testsnippet.body",
+            stdout=StringIO(),
+        )
+        self.assertQuerySetEqual(queryset, [self.dates])
+
+    def test_unsupported_vendor(self):
+        compiler = self.queryset.query.get_compiler(connection=connection)
+        with self.assertRaises(NotSupportedError):
+            BlockCount("body").as_sql(compiler, connection)
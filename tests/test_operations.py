@@ -0,0 +1,254 @@
+import json
+
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.test import TestCase
+from testapp.models import TestPage
+from testapp.utils import get_historical_apps, get_historical_model
+
+from mlstreamfield.operations import (
+    RawStreamFieldOperation,
+    RawStreamFieldSQLOperation,
+)
+from mlstreamfield.sql import compile_update
+from mlstreamfield.transforms import (
+    MapBlockValue,
+    RawDataTransformer,
+    RemoveBlock,
+    RenameBlock,
+)
+
+
+STRUCT_BODY_VALUE = [
+    {"type": "heading", "value": "Title", "id": "1"},
+    {
+        "type": "section",
+        "value": {"title": "A", "embed": None, "flag": True, "links": [1, 2]},
+        "id": "2",
+    },
+    {"type": "embed", "value": {"url": "https://example.com"}, "id": "3"},
+    {"type": "section", "value": "not a struct", "id": "4"},
+    {"type": "heading", "value": {"title": "Not a section"}, "id": "5"},
+]
+
+
+class TestRawStreamFieldOperation(TestCase):
+    def setUp(self):
+        self.state = ProjectState.from_apps(get_historical_apps())
+        self.operation = RawStreamFieldOperation(
+            "testsnippet",
+            "body",
+            [RenameBlock("text", "heading"), MapBlockValue("integer", int)],
+            reverse_rules=[RenameBlock("heading", "text")],
+        )
+
+    def get_first_blocks(self):
+        TestSnippet = get_historical_model("TestSnippet")
+        return [
+            snippet.body.raw_data[:2] for snippet in TestSnippet.objects.order_by("pk")
+        ]
+
+    def test_forwards_and_backwards(self):
+        # Only the connection is used, and SQLite's schema editor can't be used
+        # inside the transaction TestCase wraps tests in
+        editor = SimpleNamespace(connection=connection)
+        self.operation.database_forwards("testapp", editor, self.state, self.state)
+        for text_block, integer_block in self.get_first_blocks():
+            self.assertEqual(text_block["type"], "heading")
+            self.assertIsInstance(integer_block["value"], int)
+
+        self.operation.database_backwards("testapp", editor, self.state, self.state)
+        for text_block, _ in self.get_first_blocks():
+            self.assertEqual(text_block["type"], "text")
+
+    def test_reversible(self):
+        self.assertTrue(self.operation.reversible)
+        self.assertFalse(RawStreamFieldOperation("a", "b", []).reversible)
+
+    def test_deconstruct(self):
+        name, args, kwargs = self.operation.deconstruct()
+        self.assertEqual(name, "RawStreamFieldOperation")
+        self.assertEqual(
+            RawStreamFieldOperation(*args, **kwargs).rules, self.operation.rules
+        )
+
+    def test_revisions(self):
+        page = TestPage.objects.order_by("pk").first()
+        old_revision = page.save_revision()
+        latest_revision = page.save_revision()
+        operation = RawStreamFieldSQLOperation(
+            "testpage", "body", [RenameBlock("text", "heading")], revisions="latest"
+        )
+        self.assertEqual(operation.deconstruct()[2]["revisions"], "latest")
+
+        editor = SimpleNamespace(connection=connection)
+        operation.database_forwards("testapp", editor, self.state, self.state)
+        for revision, block_type in [
+            (old_revision, "text"),
+            (latest_revision, "heading"),
+        ]:
+            revision.refresh_from_db()
+            body = json.loads(revision.content["body"])
+            self.assertEqual(body[0]["type"], block_type)
+
+    def test_checkpoint(self):
+        operation = RawStreamFieldOperation(
+            "testsnippet",
+            "body",
+            [RenameBlock("text", "heading")],
+            checkpoint="rename_text",
+        )
+        self.assertEqual(operation.deconstruct()[2]["checkpoint"], "rename_text")
+        self.assertEqual(
+            operation.get_checkpoint_key("forwards"), "rename_text:forwards"
+        )
+        self.assertIsNone(self.operation.get_checkpoint_key("forwards"))
+
+        # A checkpoint left by an interrupted run is resumed from, and deleted
+        TestSnippet = get_historical_model("TestSnippet")
+        TransformCheckpoint = get_historical_model(
+            "TransformCheckpoint", "mlstreamfield"
+        )
+        TransformCheckpoint.objects.create(
+            key="rename_text:forwards",
+            model="testapp.testsnippet",
+            field_name="body",
+            last_pk=str(TestSnippet.objects.order_by("pk")[0].pk),
+            processed=1,
+        )
+        editor = SimpleNamespace(connection=connection)
+        operation.database_forwards("testapp", editor, self.state, self.state)
+        self.assertEqual(
+            [text_block["type"] for text_block, _ in self.get_first_blocks()],
+            ["text", "heading", "heading", "heading"],
+        )
+        self.assertFalse(TransformCheckpoint.objects.exists())
+
+    def test_checkpoint_kept_until_revisions_finish(self):
+        page = TestPage.objects.order_by("pk").first()
+        revision = page.save_revision()
+        HistoricalTestPage = get_historical_model("TestPage")
+        texts = {
+            obj.pk: obj.body.raw_data[0]["value"]
+            for obj in HistoricalTestPage.objects.all()
+        }
+        operation = RawStreamFieldOperation(
+            "testpage",
+            "body",
+            [MapBlockValue("text", lambda value: value + "!")],
+            revisions="all",
+            checkpoint="exclaim",
+        )
+        editor = SimpleNamespace(connection=connection)
+        TransformCheckpoint = get_historical_model(
+            "TransformCheckpoint", "mlstreamfield"
+        )
+
+        # The values checkpoint outlives an interrupted revisions phase...
+        with (
+            mock.patch(
+                "mlstreamfield.operations.transform_revisions",
+                side_effect=KeyboardInterrupt,
+            ),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            operation.database_forwards("testapp", editor, self.state, self.state)
+        self.assertTrue(
+            TransformCheckpoint.objects.filter(key="exclaim:forwards").exists()
+        )
+
+        # ...so resuming only transforms the revisions, and deletes both
+        operation.database_forwards("testapp", editor, self.state, self.state)
+        for obj in HistoricalTestPage.objects.all():
+            self.assertEqual(obj.body.raw_data[0]["value"], texts[obj.pk] + "!")
+        revision.refresh_from_db()
+        body = json.loads(revision.content["body"])
+        self.assertEqual(body[0]["value"], texts[page.pk] + "!")
+        self.assertFalse(TransformCheckpoint.objects.exists())
+
+    def test_invalid_revisions(self):
+        with self.assertRaisesMessage(ValueError, "revisions must be one of"):
+            RawStreamFieldOperation("testpage", "body", [], revisions="draft")
+
+
+class TestRawStreamFieldSQLOperation(TestCase):
+    rules = [
+        RenameBlock("heading", "title"),
+        RenameBlock("section.title", "heading"),
+        RenameBlock("section.links", "pages"),
+        RemoveBlock("section.embed"),
+        RemoveBlock("embed"),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestSnippet = get_historical_model("TestSnippet")
+        cls.TestSnippet.objects.create(title="Struct", body=STRUCT_BODY_VALUE)
+
+    def setUp(self):
+        self.state = ProjectState.from_apps(get_historical_apps())
+        self.editor = SimpleNamespace(connection=connection)
+
+    def get_values(self):
+        return [
+            snippet.body.raw_data for snippet in self.TestSnippet.objects.order_by("pk")
+        ]
+
+    def test_matches_python_version(self):
+        expected = self.get_values()
+        for value in expected:
+            RawDataTransformer(self.rules)(value)
+
+        operation = RawStreamFieldSQLOperation("testsnippet", "body", self.rules)
+        with self.assertNumQueries(1):
+            operation.database_forwards("testapp", self.editor, self.state, self.state)
+        self.assertEqual(self.get_values(), expected)
+        self.assertEqual(
+            [block["type"] for block in expected[-1]],
+            ["title", "section", "section", "title"],
+        )
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite only")
+    def test_falls_back_to_python_before_sqlite_3_38(self):
+        expected = self.get_values()
+        for value in expected:
+            RawDataTransformer(self.rules)(value)
+
+        operation = RawStreamFieldSQLOperation("testsnippet", "body", self.rules)
+        with (
+            mock.patch.object(connection.Database, "sqlite_version_info", (3, 37, 2)),
+            mock.patch("mlstreamfield.operations.compile_update") as compile_update,
+        ):
+            operation.database_forwards("testapp", self.editor, self.state, self.state)
+        compile_update.assert_not_called()
+        self.assertEqual(self.get_values(), expected)
+
+    def test_unchanged_values_are_not_written(self):
+        operation = RawStreamFieldSQLOperation(
+            "testsnippet", "body", [RenameBlock("missing", "other")]
+        )
+        with connection.cursor() as cursor:
+            sql, params = compile_update(
+                connection.vendor,
+                connection.ops.quote_name("testapp_testsnippet"),
+                connection.ops.quote_name("body"),
+                operation.rules,
+            )
+            cursor.execute(sql, params)
+            self.assertEqual(cursor.rowcount, 0)
+
+    def test_unsupported_rules(self):
+        for rule in [
+            MapBlockValue("heading", str.upper),
+            RenameBlock("section.content.paragraph", "text"),
+        ]:
+            with self.subTest(rule=rule), self.assertRaises(ValueError):
+                RawStreamFieldSQLOperation("testsnippet", "body", [rule])
+
+    def test_compiles_for_postgresql(self):
+        sql, params = compile_update("postgresql", '"table"', '"body"', self.rules)
+        self.assertIn("jsonb_agg", sql)
+        self.assertEqual(sql.count("%s"), len(params))
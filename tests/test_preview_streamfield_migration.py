@@ -0,0 +1,60 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import migrations
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase
+from testapp.utils import get_historical_model
+
+from mlstreamfield.operations import RawStreamFieldOperation
+from mlstreamfield.transforms import RemoveBlock, RenameBlock
+
+
+class TestPreviewStreamFieldMigration(TestCase):
+    def call_command(self, *args, **kwargs):
+        stdout = StringIO()
+        call_command("preview_streamfield_migration", *args, stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def test_preview(self):
+        # Added to the latest migration, so that it runs against current data
+        migration = migrations.Migration(
+            "0008_modify_title_values_with_bulk_update", "testapp"
+        )
+        migration.operations = [
+            RawStreamFieldOperation(
+                "testsnippet", "body", [RenameBlock("missing", "other")]
+            ),
+            migrations.RunPython(migrations.RunPython.noop),
+            RawStreamFieldOperation(
+                "testsnippet", "body", [RemoveBlock("date")], revisions="all"
+            ),
+        ]
+        with mock.patch.object(
+            MigrationLoader, "get_migration_by_prefix", return_value=migration
+        ):
+            output = self.call_command("testapp", "0008", examples=1)
+
+        first, second = output.split("Apply 1 raw data rule(s)")[1:]
+        self.assertIn("to testsnippet.body", first)
+        self.assertIn("Rows: 4 of 4 processed, 0 changed (0.0%)", first)
+        self.assertIn("to testsnippet.body", second)
+        self.assertIn("Rows: 4 of 4 processed, 4 changed (100.0%)", second)
+        self.assertIn("Values in revisions (all) are not included.", second)
+        self.assertEqual(second.count("(before)"), 1)
+        self.assertIn('-    "type": "date",', second)
+        # Nothing was written
+        TestSnippet = get_historical_model("TestSnippet")
+        for snippet in TestSnippet.objects.all():
+            self.assertEqual(len(snippet.body.raw_data), 3)
+
+    def test_no_operations(self):
+        output = self.call_command("testapp", "0004")
+        self.assertIn("has no RawStreamFieldOperation operations", output)
+
+    def test_unknown_migration(self):
+        with self.assertRaisesMessage(CommandError, "Cannot find a migration"):
+            self.call_command("testapp", "9999")
+        with self.assertRaisesMessage(CommandError, "More than one migration"):
+            self.call_command("testapp", "000")
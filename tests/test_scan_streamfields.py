@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, migrations
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase
+from testapp.models import TestPage
+from wagtail import blocks
+from wagtail.fields import StreamField as WagtailStreamfield
+
+from mlstreamfield.fields import StreamField
+from mlstreamfield.management.commands.scan_streamfields import (
+    build_swap_migration,
+    get_field_mentions,
+    scan_field,
+)
+
+
+class TestScanStreamFields(SimpleTestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        self.loader = MigrationLoader(connection)
+        self.native_field = WagtailStreamfield(
+            [("text", blocks.TextBlock()), ("date", blocks.DateBlock())], blank=True
+        )
+        self.native_field.set_attributes_from_name("body")
+
+    def test_get_field_mentions(self):
+        # Only 0001_initial used the native StreamField
+        mentions = get_field_mentions(self.loader, "testapp", "testpage", "body")
+        self.assertEqual(len(mentions), 1)
+        self.assertEqual(
+            get_field_mentions(self.loader, "testapp", "testpage", "x"), []
+        )
+
+    def test_scan_field(self):
+        report = scan_field(self.loader, TestPage, self.native_field)
+        self.assertEqual(report.label, "testapp.TestPage.body")
+        self.assertEqual(report.migrations, 1)
+        self.assertGreater(report.definition_bytes, report.mlstreamfield_bytes)
+        self.assertGreater(report.historic_bytes, 0)
+        self.assertGreater(report.historic_compile_ms, 0)
+
+    def test_build_swap_migration(self):
+        migration = build_swap_migration(
+            self.loader, "testapp", [("testpage", self.native_field)], "swap"
+        )
+        self.assertEqual(migration.name, "0009_swap")
+        self.assertEqual(
+            migration.dependencies,
+            [("testapp", "0008_modify_title_values_with_bulk_update")],
+        )
+        [operation] = migration.operations
+        self.assertIsInstance(operation, migrations.AlterField)
+        self.assertIsInstance(operation.field, StreamField)
+        self.assertEqual(operation.field.deconstruct()[3], {"blank": True})
+
+    def test_no_native_fields(self):
+        stdout = StringIO()
+        call_command("scan_streamfields", "testapp", stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), "No native StreamFields found.")
@@ -0,0 +1,96 @@
+import os
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, migrations
+from django.db.migrations.loader import MigrationLoader
+from django.test import SimpleTestCase
+from testapp import migrations as testapp_migrations
+from wagtail.fields import StreamField as WagtailStreamfield
+
+from mlstreamfield.fields import StreamField
+from mlstreamfield.management.commands.squash_streamfield_migrations import (
+    StreamFieldHistoryRewriter,
+)
+
+
+class TestSquashStreamFieldMigrations(SimpleTestCase):
+    databases = {"default"}
+
+    def test_rewriter(self):
+        loader = MigrationLoader(connection)
+        rewriter = StreamFieldHistoryRewriter(
+            "testapp",
+            {("testpage", "body"), ("testsnippet", "body")},
+            loader.project_state(("testapp", "0001_initial"), at_end=False),
+        )
+        operations = []
+        for name in ["0001_initial", "0003_swap_native_streamfield_for_mlstreamfield"]:
+            migration = loader.get_migration("testapp", name)
+            operations.extend(rewriter.rewrite(migration.operations))
+
+        # The AlterField operations in 0003 no longer change anything
+        self.assertEqual((rewriter.rewritten, rewriter.removed), (2, 2))
+        self.assertTrue(
+            all(isinstance(op, migrations.CreateModel) for op in operations)
+        )
+        for operation in operations:
+            body = dict(operation.fields)["body"]
+            self.assertIsInstance(body, StreamField)
+            self.assertEqual(body.deconstruct()[3], {"blank": True})
+
+    def test_only_selected_fields_are_rewritten(self):
+        loader = MigrationLoader(connection)
+        rewriter = StreamFieldHistoryRewriter(
+            "testapp",
+            {("testsnippet", "body")},
+            loader.project_state(("testapp", "0001_initial"), at_end=False),
+        )
+        operations = rewriter.rewrite(
+            loader.get_migration("testapp", "0001_initial").operations
+        )
+        bodies = {op.name: dict(op.fields)["body"] for op in operations}
+        self.assertIsInstance(bodies["TestSnippet"], StreamField)
+        self.assertNotIsInstance(bodies["TestPage"], StreamField)
+        self.assertIsInstance(bodies["TestPage"], WagtailStreamfield)
+
+    def test_dry_run_reports_changes(self):
+        stdout = StringIO()
+        call_command(
+            "squash_streamfield_migrations",
+            "testapp",
+            "0003",
+            dry_run=True,
+            interactive=False,
+            stdout=stdout,
+        )
+        output = stdout.getvalue()
+        self.assertIn("Rewrote 2 native StreamField definition(s)", output)
+        self.assertIn("removed 2 redundant AlterField operation(s)", output)
+        self.assertIn("Size: ", output)
+        self.assertIn("Compile time: ", output)
+
+    def test_writes_squashed_migration(self):
+        path = os.path.join(
+            os.path.dirname(testapp_migrations.__file__),
+            "0003_squashed_streamfields.py",
+        )
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        stdout = StringIO()
+        call_command(
+            "squash_streamfield_migrations",
+            "testapp",
+            "0003",
+            squashed_name="squashed_streamfields",
+            start_migration_name="0003",
+            interactive=False,
+            stdout=stdout,
+        )
+        self.assertIn(f"Created new squashed migration {path}", stdout.getvalue())
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+        self.assertIn(
+            "replaces = [('testapp', '0003_swap_native_streamfield_for_mlstreamfield')]",
+            source,
+        )
@@ -0,0 +1,100 @@
+import copy
+import json
+
+from django.test import SimpleTestCase
+
+from mlstreamfield.transforms import (
+    MapBlockValue,
+    RawDataTransformer,
+    RemoveBlock,
+    RenameBlock,
+)
+
+
+RAW_DATA = [
+    {"type": "heading", "value": "Hello", "id": "1"},
+    {
+        "type": "section",
+        "value": {
+            "title": "  Section  ",
+            "links": [
+                {"type": "item", "value": 1, "id": "2a"},
+                {"type": "item", "value": 2, "id": "2b"},
+            ],
+            "tags": ["a", "b"],
+            "content": [
+                {"type": "paragraph", "value": "<p>Text</p>", "id": "3"},
+                {"type": "embed", "value": "https://example.com", "id": "4"},
+            ],
+        },
+        "id": "5",
+    },
+    {"type": "embed", "value": "https://example.com", "id": "6"},
+]
+
+
+class TestRawDataTransformer(SimpleTestCase):
+    def transform(self, *rules):
+        raw_data = copy.deepcopy(RAW_DATA)
+        RawDataTransformer(rules)(raw_data)
+        return raw_data
+
+    def test_rename_stream_child(self):
+        raw_data = self.transform(RenameBlock("heading", "title"))
+        self.assertEqual(raw_data[0]["type"], "title")
+        self.assertEqual(raw_data[1:], RAW_DATA[1:])
+
+    def test_rename_struct_child_preserves_key_order(self):
+        raw_data = self.transform(RenameBlock("section.links", "pages"))
+        self.assertEqual(
+            list(raw_data[1]["value"]), ["title", "pages", "tags", "content"]
+        )
+
+    def test_remove_nested_stream_child(self):
+        raw_data = self.transform(RemoveBlock("section.content.embed"))
+        self.assertEqual(
+            [child["id"] for child in raw_data[1]["value"]["content"]], ["3"]
+        )
+        # The top-level embed block has a different path
+        self.assertEqual(raw_data[2], RAW_DATA[2])
+
+    def test_map_list_items_in_both_formats(self):
+        raw_data = self.transform(
+            MapBlockValue("section.links.item", lambda value: value * 10),
+            MapBlockValue("section.tags.item", str.upper),
+        )
+        self.assertEqual(
+            [item["value"] for item in raw_data[1]["value"]["links"]], [10, 20]
+        )
+        self.assertEqual(raw_data[1]["value"]["tags"], ["A", "B"])
+
+    def test_rules_for_nested_blocks_use_original_names(self):
+        raw_data = self.transform(
+            RenameBlock("section", "chapter"),
+            RenameBlock("section.title", "heading"),
+            MapBlockValue("section.title", str.strip),
+        )
+        self.assertEqual(raw_data[1]["type"], "chapter")
+        self.assertEqual(raw_data[1]["value"]["heading"], "Section")
+
+    def test_unmatched_branches_are_not_walked(self):
+        class ExplodingList(list):
+            def __iter__(self):
+                raise AssertionError("Should not be walked")
+
+        raw_data = copy.deepcopy(RAW_DATA)
+        raw_data[1]["value"]["content"] = ExplodingList()
+        RawDataTransformer([RenameBlock("section.title", "heading")])(raw_data)
+        self.assertIn("heading", raw_data[1]["value"])
+
+    def test_applies_to(self):
+        transformer = RawDataTransformer(
+            [RenameBlock("section.title", "heading"), RemoveBlock("embed")]
+        )
+        self.assertTrue(transformer.applies_to(json.dumps(RAW_DATA)))
+        self.assertTrue(transformer.applies_to('[{"type": "embed", "value": ""}]'))
+        self.assertFalse(transformer.applies_to('[{"type": "heading", "value": ""}]'))
+        # Names that could be encoded in other ways, and double-encoded data,
+        # always need decoding
+        self.assertTrue(RawDataTransformer([RemoveBlock("café")]).applies_to("[]"))
+        self.assertTrue(transformer.applies_to(json.dumps(json.dumps(RAW_DATA[:1]))))
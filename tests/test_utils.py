@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase, TestCase
+from testapp.utils import get_historical_model
+
+from mlstreamfield.utils import prune_unchanged_stream_fields, time_to_compile
+
+
+class TestPruneUnchangedStreamFields(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.TestSnippet = get_historical_model("TestSnippet")
+
+    def test_unchanged_field_is_pruned(self):
+        snippets = list(self.TestSnippet.objects.all())
+        self.assertEqual(
+            prune_unchanged_stream_fields(snippets, ["title", "body"]), ["title"]
+        )
+
+    def test_unchanged_field_is_pruned_after_reading(self):
+        snippets = list(self.TestSnippet.objects.all())
+        for snippet in snippets:
+            self.assertEqual(len(snippet.body.raw_data), 3)
+        self.assertEqual(prune_unchanged_stream_fields(snippets), ["title"])
+
+    def test_changed_field_is_not_pruned(self):
+        snippets = list(self.TestSnippet.objects.all())
+        snippets[-1].body.raw_data[0]["value"] = "Changed"
+        self.assertEqual(prune_unchanged_stream_fields(snippets), ["body", "title"])
+
+    def test_save_with_pruned_fields(self):
+        snippet = self.TestSnippet.objects.first()
+        snippet.title = "New title"
+        with self.assertNumQueries(1):
+            snippet.save(update_fields=prune_unchanged_stream_fields([snippet]))
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.title, "New title")
+        self.assertEqual(len(snippet.body.raw_data), 3)
+
+
+class TestTimeToCompile(SimpleTestCase):
+    def test_source_is_not_executed(self):
+        # Neither the relative import nor the side effect would work outside
+        # the migration's package
+        source = "from . import models\n\nraise RuntimeError\n"
+        self.assertGreater(time_to_compile([source]), 0)
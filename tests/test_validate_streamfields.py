@@ -0,0 +1,61 @@
+import json
+
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from testapp.models import TestSnippet
+
+from mlstreamfield.fields import EncodedJSON
+
+
+class TestValidateStreamFields(TestCase):
+    def call_command(self, *args, **kwargs):
+        stdout = StringIO()
+        call_command("validate_streamfields", *args, stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def test_valid(self):
+        output = self.call_command()
+        self.assertIn("testapp.TestPage.body: 0 of 4 value(s) invalid", output)
+        self.assertIn("testapp.TestSnippet.body: 0 of 4 value(s) invalid", output)
+
+    def test_invalid(self):
+        snippet = TestSnippet.objects.first()
+        TestSnippet.objects.filter(pk=snippet.pk).update(
+            body=EncodedJSON(json.dumps([{"type": "heading", "value": "Title"}]))
+        )
+        stdout = StringIO()
+        with self.assertRaisesMessage(
+            CommandError, "Found 1 invalid StreamField value(s)."
+        ):
+            call_command(
+                "validate_streamfields",
+                "--field",
+                "testapp.TestSnippet.body",
+                stdout=stdout,
+            )
+        self.assertEqual(
+            stdout.getvalue().splitlines(),
+            [
+                "testapp.TestSnippet.body: 1 of 4 value(s) invalid",
+                f"  heading: unknown block type (1 value(s), e.g. pk {snippet.pk})",
+            ],
+        )
+
+    def test_sample(self):
+        output = self.call_command("testapp", sample=2, workers=2)
+        self.assertIn(
+            "testapp.TestSnippet.body: 0 of 2 value(s) invalid (4 in total)", output
+        )
+
+    def test_unknown_field(self):
+        with self.assertRaisesMessage(
+            CommandError, "Unknown mlstreamfield StreamField(s): testapp.testpage.title"
+        ):
+            self.call_command("--field", "testapp.TestPage.title")
+
+    def test_no_fields(self):
+        self.assertIn(
+            "No mlstreamfield StreamFields found.", self.call_command("wagtailcore")
+        )
@@ -0,0 +1,193 @@
+import json
+
+from django.test import SimpleTestCase, TestCase
+from testapp.constants import ORIGINAL_BODY_VALUE
+from testapp.models import TestPage, TestSnippet
+from wagtail import blocks
+
+from mlstreamfield.codecs import JSONCodec
+from mlstreamfield.fields import EncodedJSON
+from mlstreamfield.validation import (
+    Problem,
+    validate_raw_data,
+    validate_raw_json,
+    validate_stream_fields,
+)
+
+
+class TestValidateRawData(SimpleTestCase):
+    def setUp(self):
+        self.block = blocks.StreamBlock(
+            [
+                ("heading", blocks.CharBlock()),
+                (
+                    "section",
+                    blocks.StructBlock(
+                        [
+                            ("count", blocks.IntegerBlock()),
+                            ("links", blocks.ListBlock(blocks.PageChooserBlock())),
+                            (
+                                "content",
+                                blocks.StreamBlock([("date", blocks.DateBlock())]),
+                            ),
+                        ]
+                    ),
+                ),
+                ("divider", blocks.StaticBlock()),
+            ]
+        )
+
+    def validate(self, raw_data):
+        return list(validate_raw_data(self.block, raw_data))
+
+    def test_valid(self):
+        raw_data = [
+            {"type": "heading", "value": "Title", "id": "1"},
+            {
+                "type": "section",
+                "value": {
+                    "count": "3",
+                    "links": [{"type": "item", "value": 1, "id": "2"}],
+                    "content": [{"type": "date", "value": "2024-12-25"}],
+                },
+            },
+            # ListBlock data from before Wagtail 2.16, and missing struct keys
+            {"type": "section", "value": {"links": [1, None]}},
+            {"type": "divider", "value": None},
+        ]
+        self.assertEqual(self.validate(raw_data), [])
+
+    def test_unknown_block_types_and_keys(self):
+        raw_data = [
+            {"type": "paragraph", "value": "Text"},
+            {
+                "type": "section",
+                "value": {
+                    "title": "Section",
+                    "content": [{"type": "time", "value": "12:00"}],
+                },
+            },
+        ]
+        self.assertEqual(
+            self.validate(raw_data),
+            [
+                Problem("paragraph", "unknown block type"),
+                Problem("section.title", "unknown key"),
+                Problem("section.content.time", "unknown block type"),
+            ],
+        )
+
+    def test_unconvertible_values(self):
+        raw_data = [
+            {
+                "type": "section",
+                "value": {
+                    "count": "three",
+                    "links": [{"type": "item", "value": "home"}],
+                    "content": [{"type": "date", "value": "yesterday"}],
+                },
+            },
+        ]
+        self.assertEqual(
+            self.validate(raw_data),
+            [
+                Problem("section.count", "value can't be converted by IntegerBlock"),
+                Problem(
+                    "section.links.item",
+                    "value can't be converted by PageChooserBlock",
+                ),
+                Problem(
+                    "section.content.date", "value can't be converted by DateBlock"
+                ),
+            ],
+        )
+
+    def test_unexpected_structure(self):
+        raw_data = [
+            "heading",
+            {"type": "section", "value": ["Section"]},
+            {"type": "section", "value": {"links": {"page": 1}, "content": "x"}},
+        ]
+        self.assertEqual(
+            self.validate(raw_data),
+            [
+                Problem("(root)", "expected a block"),
+                Problem("section", "expected a dict of values"),
+                Problem("section.links", "expected a list of items"),
+                Problem("section.content", "expected a list of blocks"),
+            ],
+        )
+
+    def test_validate_raw_json(self):
+        codec = JSONCodec()
+        self.assertEqual(validate_raw_json(None, self.block, codec), [])
+        self.assertEqual(
+            validate_raw_json("not json", self.block, codec),
+            [Problem("(root)", "not valid JSON")],
+        )
+        # Problems found more than once in a value are only reported once
+        raw_json = json.dumps([{"type": "paragraph"}, {"type": "paragraph"}])
+        self.assertEqual(
+            validate_raw_json(raw_json, self.block, codec),
+            [Problem("paragraph", "unknown block type")],
+        )
+
+
+class TestValidateStreamFields(TestCase):
+    def setUp(self):
+        self.invalid_value = [
+            *ORIGINAL_BODY_VALUE,
+            {"type": "integer", "value": "many"},
+            {"type": "heading", "value": "Title"},
+        ]
+        self.invalid_pks = list(
+            TestSnippet.objects.order_by("pk").values_list("pk", flat=True)[:2]
+        )
+        TestSnippet.objects.filter(pk__in=self.invalid_pks).update(
+            body=EncodedJSON(json.dumps(self.invalid_value))
+        )
+
+    def test_validate(self):
+        page_report, snippet_report = validate_stream_fields(
+            [(TestPage.objects.all(), "body"), (TestSnippet.objects.all(), "body")],
+            batch_size=1,
+        )
+        self.assertEqual((page_report.processed, page_report.invalid), (4, 0))
+        self.assertEqual(snippet_report.label, "testapp.TestSnippet.body")
+        self.assertEqual((snippet_report.processed, snippet_report.invalid), (4, 2))
+        self.assertEqual(
+            dict(snippet_report.problems),
+            {
+                Problem("heading", "unknown block type"): 2,
+                Problem("integer", "value can't be converted by IntegerBlock"): 2,
+            },
+        )
+        self.assertEqual(
+            snippet_report.summary(),
+            [
+                "testapp.TestSnippet.body: 2 of 4 value(s) invalid",
+                f"  heading: unknown block type (2 value(s), e.g. pk "
+                f"{self.invalid_pks[0]})",
+                f"  integer: value can't be converted by IntegerBlock (2 value(s), "
+                f"e.g. pk {self.invalid_pks[0]})",
+            ],
+        )
+
+    def test_sample(self):
+        (report,) = validate_stream_fields(
+            [(TestSnippet.objects.all(), "body")], sample=3
+        )
+        self.assertEqual((report.total, report.processed), (4, 3))
+        self.assertIn(report.invalid, (1, 2))
+        self.assertIn("(4 in total)", report.summary()[0])
+
+    def test_validate_in_worker_processes(self):
+        reports = validate_stream_fields(
+            [(TestPage.objects.all(), "body"), (TestSnippet.objects.all(), "body")],
+            batch_size=1,
+            workers=2,
+        )
+        self.assertEqual(
+            [(report.processed, report.invalid) for report in reports],
+            [(4, 0), (4, 2)],
+        )
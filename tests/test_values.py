@@ -0,0 +1,220 @@
+import json
+
+from itertools import islice
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase
+from testapp.constants import MODIFIED_BODY_VALUE, ORIGINAL_BODY_VALUE
+
+from mlstreamfield.codecs import JSONCodec
+from mlstreamfield.fields import EncodedJSON, StreamField
+from mlstreamfield.values import RawStreamValue, decode_raw_json, iter_raw_blocks
+
+
+class TestDecodeRawJSON(SimpleTestCase):
+    def test_valid_json(self):
+        raw_json = json.dumps(ORIGINAL_BODY_VALUE)
+        self.assertEqual(
+            decode_raw_json(raw_json, JSONCodec()), (ORIGINAL_BODY_VALUE, None)
+        )
+
+    def test_double_encoded_json(self):
+        raw_json = json.dumps(json.dumps(ORIGINAL_BODY_VALUE))
+        self.assertEqual(
+            decode_raw_json(raw_json, JSONCodec()), (ORIGINAL_BODY_VALUE, None)
+        )
+
+    def test_invalid_json(self):
+        self.assertEqual(decode_raw_json("not json", JSONCodec()), ([], "not json"))
+
+    def test_json_encoded_invalid_json(self):
+        raw_json = json.dumps("not json")
+        self.assertEqual(decode_raw_json(raw_json, JSONCodec()), ([], "not json"))
+
+
+class TestLazyRawStreamValue(SimpleTestCase):
+    def setUp(self):
+        # Rebuilt from deconstruct(), as when migrating
+        self.field = StreamField().clone()
+        self.codec = JSONCodec()
+        self.raw_json = json.dumps(ORIGINAL_BODY_VALUE)
+
+    def get_value_from_db(self):
+        with mock.patch.object(StreamField, "codec", self.codec):
+            return self.field.from_db_value(self.raw_json, None, connection)
+
+    def test_from_db_value_does_not_decode(self):
+        # Loading a value from the database should not involve any JSON work
+        with mock.patch.object(self.codec, "loads") as loads:
+            value = self.get_value_from_db()
+            self.assertIsInstance(value, RawStreamValue)
+            self.assertFalse(value.is_decoded)
+            self.assertEqual(value.raw_json, self.raw_json)
+        loads.assert_not_called()
+
+    def test_unread_value_is_written_back_unchanged(self):
+        value = self.get_value_from_db()
+        with mock.patch.object(self.codec, "dumps") as dumps:
+            result = self.field.get_prep_value(value)
+        dumps.assert_not_called()
+        self.assertIsInstance(result, EncodedJSON)
+        self.assertEqual(result, self.raw_json)
+
+    def test_raw_data_is_decoded_on_first_access(self):
+        value = self.get_value_from_db()
+        with mock.patch.object(self.codec, "loads", wraps=self.codec.loads) as loads:
+            self.assertEqual(list(value.raw_data), ORIGINAL_BODY_VALUE)
+            self.assertEqual(list(value.raw_data), ORIGINAL_BODY_VALUE)
+        loads.assert_called_once_with(self.raw_json)
+        self.assertTrue(value.is_decoded)
+        self.assertFalse(value.has_changed)
+
+    def test_read_only_access_does_not_change_value(self):
+        value = self.get_value_from_db()
+        for block in value.raw_data:
+            self.assertIn(block["type"], ["text", "integer", "date"])
+            dict(block)
+            block.get("value")
+            list(block.items())
+        with mock.patch.object(self.codec, "dumps") as dumps:
+            result = self.field.get_prep_value(value)
+        dumps.assert_not_called()
+        self.assertEqual(result, self.raw_json)
+
+    def test_changes_to_raw_data_are_written(self):
+        value = self.get_value_from_db()
+        value.raw_data[0]["value"] = "Goodbye Galaxy!"
+        result = self.field.get_prep_value(value)
+        self.assertEqual(json.loads(result)[0], MODIFIED_BODY_VALUE[0])
+
+    def test_raw_text_is_decoded_on_access(self):
+        self.raw_json = json.dumps("not json")
+        value = self.get_value_from_db()
+        self.assertEqual(value.raw_text, "not json")
+        self.assertEqual(len(value.raw_data), 0)
+
+
+class TestChangeTracking(SimpleTestCase):
+    def setUp(self):
+        # Rebuilt from deconstruct(), as when migrating
+        self.field = StreamField().clone()
+        raw_json = json.dumps(
+            [
+                *ORIGINAL_BODY_VALUE,
+                {"type": "list", "value": [{"a": [1, 2]}], "id": "list"},
+            ]
+        )
+        self.value = self.field.from_db_value(raw_json, None, connection)
+
+    def assertChanged(self, mutate):
+        mutate(self.value.raw_data)
+        self.assertTrue(self.value.has_changed)
+        # The changed value must be written back in full
+        self.assertEqual(
+            json.loads(self.field.get_prep_value(self.value)),
+            list(self.value.raw_data),
+        )
+
+    def test_unchanged(self):
+        self.assertFalse(self.value.has_changed)
+
+    def test_new_values_are_always_changed(self):
+        value = self.field.to_python(ORIGINAL_BODY_VALUE)
+        self.assertTrue(value.has_changed)
+
+    def test_building_a_value_does_not_track_a_change(self):
+        value = RawStreamValue(self.field.stream_block, list(ORIGINAL_BODY_VALUE))
+        self.assertFalse(value._tracker.changed)
+
+    def test_replacing_block_value(self):
+        self.assertChanged(lambda data: data[0].update(value="Goodbye"))
+
+    def test_changing_nested_value(self):
+        self.assertChanged(lambda data: data[3]["value"][0]["a"].append(3))
+
+    def test_changing_nested_value_via_iteration(self):
+        def mutate(data):
+            for block in data:
+                for item in block.values():
+                    if isinstance(item, list):
+                        item[0]["a"].pop()
+
+        self.assertChanged(mutate)
+
+    def test_changing_nested_value_via_copy(self):
+        def mutate(data):
+            block = {**data[3]}
+            block["value"][0]["a"].clear()
+
+        self.assertChanged(mutate)
+
+    def test_removing_block(self):
+        self.assertChanged(lambda data: data.pop())
+
+    def test_adding_block(self):
+        self.assertChanged(lambda data: data.append(MODIFIED_BODY_VALUE[0]))
+
+    def test_replacing_raw_data(self):
+        self.value._raw_data = MODIFIED_BODY_VALUE
+        self.assertTrue(self.value.has_changed)
+
+
+class TestIterRawBlocks(SimpleTestCase):
+    def test_json_string(self):
+        for raw_json in [
+            json.dumps(ORIGINAL_BODY_VALUE),
+            json.dumps(ORIGINAL_BODY_VALUE, indent=2),
+            json.dumps(json.dumps(ORIGINAL_BODY_VALUE)),
+        ]:
+            with self.subTest(raw_json=raw_json):
+                self.assertEqual(list(iter_raw_blocks(raw_json)), ORIGINAL_BODY_VALUE)
+
+    def test_values_without_blocks(self):
+        for raw_json in ["[]", " [ ]\n", "{}", '"[]"', "not json", '"not json"']:
+            with self.subTest(raw_json=raw_json):
+                self.assertEqual(list(iter_raw_blocks(raw_json)), [])
+
+    def test_blocks_are_decoded_incrementally(self):
+        blocks = iter_raw_blocks(json.dumps(ORIGINAL_BODY_VALUE)[:-1] + ", {")
+        self.assertEqual(next(blocks), ORIGINAL_BODY_VALUE[0])
+        self.assertEqual(list(islice(blocks, 2)), ORIGINAL_BODY_VALUE[1:])
+        with self.assertRaises(ValueError):
+            next(blocks)
+
+    def test_invalid_json(self):
+        for raw_json in ["[1 2]", "[1,]", "[1] 2"]:
+            with self.subTest(raw_json=raw_json), self.assertRaises(ValueError):
+                list(iter_raw_blocks(raw_json))
+
+    def test_lazy_value_is_not_decoded(self):
+        field = StreamField().clone()
+        value = field.from_db_value(json.dumps(ORIGINAL_BODY_VALUE), None, connection)
+        self.assertEqual(
+            [block["type"] for block in iter_raw_blocks(value)],
+            ["text", "integer", "date"],
+        )
+        self.assertFalse(value.is_decoded)
+        self.assertEqual(field.get_prep_value(value), value.raw_json)
+
+    def test_decoded_value(self):
+        field = StreamField().clone()
+        value = field.from_db_value(json.dumps(ORIGINAL_BODY_VALUE), None, connection)
+        value.raw_data.pop()
+        self.assertEqual(list(iter_raw_blocks(value)), ORIGINAL_BODY_VALUE[:2])
+
+    def test_blocks_are_copies(self):
+        field = StreamField().clone()
+        for changed in [False, True]:
+            value = field.from_db_value(
+                json.dumps(ORIGINAL_BODY_VALUE), None, connection
+            )
+            value.decode()
+            if changed:
+                value.raw_data[2]["value"] = "2024-01-01"
+            with self.subTest(changed=changed):
+                for block in iter_raw_blocks(value):
+                    self.assertIs(type(block), dict)
+                    block["type"] = "other"
+                self.assertEqual(value.raw_data[0]["type"], "text")
+                self.assertEqual(value.has_changed, changed)
@@ -1,7 +1,11 @@
 import uuid
 
+from functools import cache
 from typing import Any, Sequence
 
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+
 
 def convert_simple_streamfield_value_to_dicts(
     value: Sequence[tuple[str, Any]], *, add_ids: bool = False
@@ -16,3 +20,16 @@ def convert_simple_streamfield_value_to_dicts(
             item_dict["id"] = uuid.uuid4().hex
         return_value.append(item_dict)
     return return_value
+
+
+@cache
+def get_historical_apps():
+    """
+    Return an app registry matching the latest migration state, where models
+    are the same as those available to data migrations.
+    """
+    return MigrationLoader(connection).project_state().apps
+
+
+def get_historical_model(model_name: str, app_label: str = "testapp"):
+    return get_historical_apps().get_model(app_label, model_name)